@@ -15,7 +15,7 @@ if src_path not in sys.path:
     sys.path.append(src_path)
 
 import gradio as gr
-from modules.config import LANGUAGE_CONFIG, SUPPORTED_LANGUAGES
+from modules.config import LANGUAGE_CONFIG, SUPPORTED_LANGUAGES, get_device
 from modules.voice_manager import (
     load_voices, 
     get_voices_for_language, 
@@ -468,6 +468,9 @@ with gr.Blocks(title="Chatterbox TTS Enhanced", theme=gr.themes.Soft(), css=CUST
 
 
 if __name__ == "__main__":
+    # Probe the device up front so the banner shows before the UI comes up;
+    # importing this module alone no longer touches CUDA.
+    get_device()
     demo.queue(
         max_size=50,
         default_concurrency_limit=1,
@@ -0,0 +1,15 @@
+"""
+Benchmarks for Chatterbox TTS Enhanced
+
+Runs without network access or checkpoints: every model is built from its
+real configuration with seeded random weights, so timings reflect the actual
+architectures even though the audio is noise. From the project root:
+
+    python -m benchmarks e2e                        # default matrix, compared to baseline.json
+    python -m benchmarks e2e --variants tts vc --text-lengths 100 400 --threads 1 4
+    python -m benchmarks e2e --save-baseline        # record a new baseline on this machine
+    python -m benchmarks micro --kernels cfm_step hift_decode --frames 100 500 --dtypes float32 bfloat16
+
+Baselines are machine-specific; compare runs from the same host (or CI runner
+class) only.
+"""
@@ -0,0 +1,175 @@
+"""
+Command-line entry point: `python -m benchmarks <command> [options]`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from .common import machine_info
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def _load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _parse_thresholds(items):
+    """`metric=fraction` pairs, e.g. `rtf=0.2 peak_rss_mb=0.05`."""
+    from .e2e import METRICS
+
+    out = {}
+    for item in items or ():
+        metric, _, value = item.partition("=")
+        if metric not in METRICS or not value:
+            raise SystemExit(f"Bad --threshold {item!r}; expected one of {sorted(METRICS)} as metric=fraction")
+        out[metric] = float(value)
+    return out
+
+
+def cmd_e2e(args):
+    from . import e2e
+
+    thresholds = _parse_thresholds(args.threshold)
+    print(f"Machine: {machine_info()}")
+    results = e2e.run_matrix(
+        args.variants, args.text_lengths, args.batch_sizes, args.threads,
+        repeats=args.repeats, warmup=args.warmup, seed=args.seed, device=args.device,
+    )
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": machine_info(),
+        "config": {k: v for k, v in vars(args).items() if k != "func"},
+        "results": results,
+    }
+    if args.output:
+        _save_json(args.output, report)
+        print(f"Results written to {args.output}")
+    if args.save_baseline:
+        _save_json(args.baseline, report)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = _load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if baseline.get("machine", {}).get("processor") != report["machine"]["processor"]:
+        print("Note: the baseline was recorded on a different processor; differences may not be regressions.")
+
+    rows = e2e.compare(results, baseline.get("results", {}), thresholds)
+    if not rows:
+        print("No scenarios in common with the baseline.")
+        return 0
+    print(e2e.format_comparison(rows))
+    regressions = [r for r in rows if r[-1]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond threshold.")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+def cmd_micro(args):
+    from . import micro
+
+    print(f"Machine: {machine_info()}")
+    results = micro.run_micro(
+        args.kernels, args.frames, args.dtypes, args.threads,
+        repeats=args.repeats, warmup=args.warmup, device=args.device,
+        meanflow=args.meanflow, seed=args.seed,
+    )
+    if args.output:
+        _save_json(args.output, {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": machine_info(),
+            "config": {k: v for k, v in vars(args).items() if k != "func"},
+            "results": results,
+        })
+        print(f"Results written to {args.output}")
+    return 0
+
+
+def cmd_normalize(args):
+    from . import micro
+
+    print(f"Machine: {machine_info()}")
+    results = micro.run_normalize(args.languages, args.words, repeats=args.repeats, warmup=args.warmup, seed=args.seed)
+    if args.output:
+        _save_json(args.output, {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": machine_info(),
+            "config": {k: v for k, v in vars(args).items() if k != "func"},
+            "results": results,
+        })
+        print(f"Results written to {args.output}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Chatterbox benchmarks on synthetic weights")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("e2e", help="end-to-end TTFA / RTF / tokens/s / peak RSS per pipeline")
+    p.add_argument("--variants", nargs="+", default=["tts", "mtl", "turbo", "vc"],
+                   choices=["tts", "mtl", "turbo", "vc"])
+    p.add_argument("--text-lengths", nargs="+", type=int, default=[60, 240], metavar="CHARS")
+    p.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    p.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    p.add_argument("--repeats", type=int, default=3)
+    p.add_argument("--warmup", type=int, default=1)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--device", default="cpu")
+    p.add_argument("--output", help="also write the full report to this JSON file")
+    p.add_argument("--baseline", default=DEFAULT_BASELINE)
+    p.add_argument("--save-baseline", action="store_true", help="record this run as the baseline instead of comparing")
+    p.add_argument("--threshold", nargs="*", metavar="METRIC=FRACTION",
+                   help="override regression thresholds, e.g. rtf=0.2")
+    p.set_defaults(func=cmd_e2e)
+
+    from .micro import DTYPES, KERNELS
+
+    p = sub.add_parser("micro", help="isolated S3Gen kernels: CFM step, HiFT, source module, mel front ends")
+    p.add_argument("--kernels", nargs="+", default=list(KERNELS), choices=KERNELS)
+    p.add_argument("--frames", nargs="+", type=int, default=[100, 500],
+                   help="input size in 50 Hz mel frames (500 = 10 s of audio)")
+    p.add_argument("--dtypes", nargs="+", default=["float32"], choices=list(DTYPES))
+    p.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    p.add_argument("--repeats", type=int, default=20)
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--device", default="cpu")
+    p.add_argument("--meanflow", action="store_true", help="use the Turbo (meanflow) estimator for cfm_step")
+    p.add_argument("--output", help="write the results to this JSON file")
+    p.set_defaults(func=cmd_micro)
+
+    from .micro import NORMALIZE_LANGUAGES
+
+    p = sub.add_parser("normalize", help="multilingual text normalizers with the per-word cache off and warm")
+    p.add_argument("--languages", nargs="+", default=list(NORMALIZE_LANGUAGES), choices=list(NORMALIZE_LANGUAGES))
+    p.add_argument("--words", nargs="+", type=int, default=[200, 2000], help="words per document")
+    p.add_argument("--repeats", type=int, default=20)
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", help="write the results to this JSON file")
+    p.set_defaults(func=cmd_normalize)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
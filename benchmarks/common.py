@@ -0,0 +1,112 @@
+"""
+Shared helpers for the benchmarks: import paths, thread control, memory
+high-water marks, machine description and sample statistics.
+"""
+import ctypes
+import gc
+import math
+import os
+import platform
+import sys
+
+# Same layout app.py sets up: `modules` from the project root, `chatterbox` from src/
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "src")):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+# Benchmarks must not learn from, or write to, the user's speech length stats
+os.environ.setdefault("CHATTERBOX_LENGTH_STATS", "")
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def set_threads(n):
+    """Use `n` intra-op threads for torch (and BLAS through OMP/MKL)."""
+    torch.set_num_threads(n)
+
+
+def release_memory():
+    """
+    Collect garbage and hand freed heap back to the OS (glibc only), so a
+    model that was just dropped no longer counts towards the next peak RSS.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's RSS high-water mark so the next `peak_rss_mb` covers
+    only what runs after this call. Linux only; elsewhere the peak stays
+    cumulative for the process.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (None if unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def machine_info():
+    """What a baseline was recorded on; results are only comparable on similar machines."""
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def percentile(sorted_samples, q):
+    """Linear-interpolated `q`-th percentile (0-100) of already sorted samples."""
+    if not sorted_samples:
+        return None
+    pos = (len(sorted_samples) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (pos - lo)
+
+
+def summarize(samples):
+    """mean / std / min / p50 / p90 / p99 / max of a list of numbers."""
+    xs = sorted(x for x in samples if x is not None)
+    if not xs:
+        return {}
+    mean = sum(xs) / len(xs)
+    std = math.sqrt(sum((x - mean) ** 2 for x in xs) / (len(xs) - 1)) if len(xs) > 1 else 0.0
+    return {
+        "n": len(xs),
+        "mean": mean,
+        "std": std,
+        "min": xs[0],
+        "p50": percentile(xs, 50),
+        "p90": percentile(xs, 90),
+        "p99": percentile(xs, 99),
+        "max": xs[-1],
+    }
@@ -0,0 +1,215 @@
+"""
+End-to-end benchmark of the four pipelines on synthetic weights.
+
+Each scenario is (variant, text length, batch size, thread count):
+
+- tts / mtl / turbo: the text is chunked exactly as the app does
+  (`modules.text_chunking`), and each chunk decodes the number of speech
+  tokens its length predicts (`PRIOR_RATIOS`). A batch of B is B requests
+  served one after another, as the batch tab does.
+- vc: converts a clip as long as the text would take to say (about
+  `CHARS_PER_SECOND`). Batch 1 streams through `generate_stream`; larger
+  batches go through `generate_batch` as one group.
+
+Reported per scenario (median over the repeats):
+
+- ttfa_s: time to the first audio chunk of the first request
+- rtf: wall time / seconds of audio produced (below 1 is faster than real time)
+- tokens_per_s: T3 decode rate (TTS variants only)
+- peak_rss_mb: process peak RSS while the scenario ran, models included
+"""
+import math
+import os
+import statistics
+import tempfile
+import time
+
+from .common import peak_rss_mb, release_memory, reset_peak_rss, set_threads, summarize
+from . import synthetic
+
+import torch
+
+CHARS_PER_SECOND = 15.0
+
+# metric -> True if higher is better
+METRICS = {
+    "ttfa_s": False,
+    "rtf": False,
+    "tokens_per_s": True,
+    "peak_rss_mb": False,
+}
+
+# Relative change tolerated before a metric counts as a regression
+DEFAULT_THRESHOLDS = {
+    "ttfa_s": 0.15,
+    "rtf": 0.15,
+    "tokens_per_s": 0.15,
+    "peak_rss_mb": 0.10,
+}
+
+
+def scenario_key(variant, n_chars, batch_size, threads):
+    return f"{variant}/chars={n_chars}/batch={batch_size}/threads={threads}"
+
+
+def _decode_stats(profile):
+    tokens = seconds = 0.0
+    for s in profile.stages if profile is not None else ():
+        if s.name == "t3_decode":
+            tokens += s.attrs.get("tokens", 0)
+            seconds += s.duration
+    return tokens, seconds
+
+
+def _run_tts(pipeline, variant, texts):
+    """Synthesize `texts` in order; returns (ttfa, wall, audio seconds, decode tokens, decode seconds)."""
+    from chatterbox.length_model import PRIOR_RATIOS
+    from modules.text_chunking import chunk_token_budget, iter_text_chunks, token_counter
+
+    language_id = "en" if variant == "mtl" else None
+    extra = {"language_id": language_id} if variant == "mtl" else {}
+    count_tokens = token_counter(pipeline, variant, language_id)
+    budget = chunk_token_budget(pipeline, variant, language_id)
+
+    ttfa = None
+    audio_s = tokens = decode_s = 0.0
+    t0 = time.perf_counter()
+    for text in texts:
+        for chunk in iter_text_chunks(text, count_tokens, budget):
+            max_new_tokens = math.ceil(chunk.n_tokens * PRIOR_RATIOS[variant])
+            wav = pipeline.generate(chunk.text, max_new_tokens=max_new_tokens, **extra)
+            if ttfa is None:
+                ttfa = time.perf_counter() - t0
+            audio_s += wav.shape[-1] / pipeline.sr
+            n, secs = _decode_stats(pipeline.last_profile)
+            tokens += n
+            decode_s += secs
+    return ttfa, time.perf_counter() - t0, audio_s, tokens, decode_s
+
+
+def _run_vc(pipeline, sources):
+    ttfa = None
+    audio_s = 0.0
+    t0 = time.perf_counter()
+    if len(sources) == 1:
+        for wav in pipeline.generate_stream(sources[0]):
+            if ttfa is None:
+                ttfa = time.perf_counter() - t0
+            audio_s += wav.shape[-1] / pipeline.sr
+    else:
+        wavs = pipeline.generate_batch(sources, batch_size=len(sources))
+        ttfa = time.perf_counter() - t0
+        audio_s = sum(w.shape[-1] / pipeline.sr for w in wavs)
+    return ttfa, time.perf_counter() - t0, audio_s, 0.0, 0.0
+
+
+def run_scenario(pipeline, variant, n_chars, batch_size, threads, workdir, repeats=3, warmup=1, seed=0):
+    """Time one scenario; returns its metrics plus the raw samples behind them."""
+    set_threads(threads)
+    if variant == "vc":
+        seconds = max(1.0, n_chars / CHARS_PER_SECOND)
+        inputs = [
+            synthetic.write_reference_voice(
+                os.path.join(workdir, f"source_{n_chars}_{i}.wav"), seconds=seconds, seed=seed + 1 + i,
+            )
+            for i in range(batch_size)
+        ]
+        run = lambda: _run_vc(pipeline, inputs)
+    else:
+        inputs = [synthetic.sample_text(n_chars)] * batch_size
+        run = lambda: _run_tts(pipeline, variant, inputs)
+
+    for _ in range(warmup):
+        torch.manual_seed(seed)
+        run()
+
+    release_memory()
+    reset_peak_rss()
+    samples = {"ttfa_s": [], "rtf": [], "tokens_per_s": [], "wall_s": [], "audio_s": []}
+    for _ in range(repeats):
+        torch.manual_seed(seed)
+        ttfa, wall, audio_s, tokens, decode_s = run()
+        samples["ttfa_s"].append(ttfa)
+        samples["wall_s"].append(wall)
+        samples["audio_s"].append(audio_s)
+        samples["rtf"].append(wall / audio_s if audio_s else None)
+        samples["tokens_per_s"].append(tokens / decode_s if decode_s else None)
+
+    result = {}
+    for name, xs in samples.items():
+        xs = [x for x in xs if x is not None]
+        result[name] = statistics.median(xs) if xs else None
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["samples"] = {name: summarize(xs) for name, xs in samples.items() if name in ("ttfa_s", "rtf")}
+    return result
+
+
+def run_matrix(variants, text_lengths, batch_sizes, thread_counts, repeats=3, warmup=1, seed=0,
+               device="cpu", log=print):
+    """
+    Build each variant once (then free it) and run every scenario for it.
+    Returns {scenario key: metrics}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="chatterbox-bench-") as workdir:
+        voice = synthetic.write_reference_voice(os.path.join(workdir, "reference.wav"), seed=seed)
+        for variant in variants:
+            t0 = time.perf_counter()
+            pipeline = synthetic.build_pipeline(variant, os.path.join(workdir, variant), device=device, seed=seed)
+            synthetic.prepare_voice(pipeline, variant, voice)
+            log(f"[{variant}] built in {time.perf_counter() - t0:.1f}s "
+                f"({', '.join(f'{k}={v / 1e6:.0f}M' for k, v in synthetic.describe(pipeline).items())} params)")
+
+            for threads in thread_counts:
+                for n_chars in text_lengths:
+                    for batch_size in batch_sizes:
+                        key = scenario_key(variant, n_chars, batch_size, threads)
+                        r = run_scenario(pipeline, variant, n_chars, batch_size, threads, workdir,
+                                         repeats=repeats, warmup=warmup, seed=seed)
+                        results[key] = r
+                        log(format_result(key, r))
+
+            del pipeline
+            release_memory()
+    return results
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def format_result(key, r):
+    return (f"{key:<40} ttfa={_fmt(r['ttfa_s'], '.2f')}s rtf={_fmt(r['rtf'], '.2f')} "
+            f"tok/s={_fmt(r['tokens_per_s'], '.1f')} rss={_fmt(r['peak_rss_mb'], '.0f')}MB")
+
+
+def compare(results, baseline, thresholds=None):
+    """
+    Compare `results` with `baseline` (both {scenario key: metrics}).
+
+    Returns one row per metric present in both: (key, metric, baseline,
+    current, relative change in the "worse" direction, regressed?).
+    Scenarios missing from either side are skipped.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    rows = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            worse = (old - new) / old if higher_is_better else (new - old) / old
+            rows.append((key, metric, old, new, worse, worse > thresholds[metric]))
+    return rows
+
+
+def format_comparison(rows):
+    """One line per compared metric; the percentage is positive when worse."""
+    lines = []
+    for key, metric, old, new, worse, regressed in rows:
+        flag = "REGRESSION" if regressed else ("improved" if worse < 0 else "ok")
+        lines.append(f"{key:<40} {metric:<13} {old:10.3f} -> {new:10.3f} ({worse:+.1%})  {flag}")
+    return "\n".join(lines)
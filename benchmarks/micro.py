@@ -0,0 +1,288 @@
+"""
+Micro-benchmarks for the S3Gen inner loops, each run in isolation:
+
+- cfm_step: one `ConditionalDecoder.forward` (a single CFM Euler step, CFG batch of 2)
+- hift_decode: `HiFTGenerator.decode`, including its STFT of the source and the iSTFT
+- hift_stft / hift_istft: those two transforms on their own
+- sine_source: `SourceModuleHnNSF` (and the `SineGen` inside it) on an upsampled F0 track
+- mel_24k: `s3gen.utils.mel.mel_spectrogram` (the flow's prompt features)
+- s3tok_log_mel: `S3Tokenizer.log_mel_spectrogram` (the speech tokenizer's features)
+
+Shapes are given in mel frames at S3Gen's 50 Hz frame rate, so the same
+`--frames 500` means 10 s of audio for every kernel. Modules come from one
+synthetic `S3Gen` (real configuration, seeded weights, folded for inference).
+
+Per (kernel, frames, dtype, threads) it reports wall time statistics in ms
+and, from one extra profiled call, the bytes and number of allocations
+made (CPU: torch profiler memory events; CUDA: the caching allocator stats).
+
+`run_normalize` times the multilingual tokenizer's language normalizers
+(`MTLTokenizer._normalize` for ja / ru / ko / zh) on documents of new
+sentences over a shared vocabulary, once with the per-word cache disabled
+and once with it warm, and reports the speedup.
+"""
+import copy
+import importlib.util
+import os
+import random
+import tempfile
+import time
+
+from .common import set_threads, summarize
+from . import synthetic
+
+import torch
+
+MEL_HOP_24K = 480  # S3Gen samples per mel frame
+MEL_HOP_16K = 320  # the same 20 ms at the tokenizer's 16 kHz
+
+KERNELS = ("cfm_step", "hift_decode", "hift_stft", "hift_istft", "sine_source", "mel_24k", "s3tok_log_mel")
+
+DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+
+class _Models:
+    """The S3Gen the kernels are taken from, plus per-dtype copies of its modules."""
+
+    def __init__(self, device, meanflow=False, seed=0):
+        torch.manual_seed(seed)
+        self.s3gen = synthetic.build_s3gen(device, meanflow=meanflow)
+        self.meanflow = meanflow
+        self._copies = {}
+
+    def get(self, name, dtype):
+        module = {
+            "estimator": self.s3gen.flow.decoder.estimator,
+            "hift": self.s3gen.mel2wav,
+        }[name]
+        if dtype == torch.float32:
+            return module
+        key = (name, dtype)
+        if key not in self._copies:
+            self._copies[key] = copy.deepcopy(module).to(dtype)
+        return self._copies[key]
+
+
+def _voiced_wave(n_samples, sr, device, dtype, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    t = torch.arange(n_samples) / sr
+    wav = 0.3 * torch.sin(2 * torch.pi * 150 * t) + 0.01 * torch.randn(n_samples, generator=g)
+    return wav.to(device=device, dtype=dtype)
+
+
+def make_kernel(name, models, frames, dtype, device):
+    """Return a zero-argument callable running kernel `name` once on fixed inputs."""
+    g = torch.Generator().manual_seed(frames)
+
+    def randn(*shape):
+        return torch.randn(*shape, generator=g).to(device=device, dtype=dtype)
+
+    if name == "cfm_step":
+        est = models.get("estimator", dtype)
+        x, mu, cond = randn(2, 80, frames), randn(2, 80, frames), randn(2, 80, frames)
+        mask = torch.ones(2, 1, frames, device=device, dtype=dtype)
+        spks = randn(2, 80)
+        t = torch.full((2,), 0.5, device=device, dtype=dtype)
+        r = torch.full((2,), 1.0, device=device, dtype=dtype) if models.meanflow else None
+        return lambda: est.forward(x=x, mask=mask, mu=mu, t=t, spks=spks, cond=cond, r=r)
+
+    hift = models.get("hift", dtype)
+    n_samples = frames * MEL_HOP_24K
+
+    if name == "hift_decode":
+        mel, source = randn(1, 80, frames), 0.1 * randn(1, 1, n_samples)
+        return lambda: hift.decode(x=mel, s=source)
+
+    if name == "hift_stft":
+        source = 0.1 * randn(1, n_samples)
+        return lambda: hift._stft(source)
+
+    if name == "hift_istft":
+        n_fft, hop = hift.istft_params["n_fft"], hift.istft_params["hop_len"]
+        n_stft_frames = n_samples // hop + 1
+        magnitude = randn(1, n_fft // 2 + 1, n_stft_frames).exp()
+        phase = randn(1, n_fft // 2 + 1, n_stft_frames)
+        return lambda: hift._istft(magnitude, phase)
+
+    if name == "sine_source":
+        f0 = 120 + 60 * torch.rand(1, frames, generator=g)
+        f0[:, ::7] = 0.0  # some unvoiced frames
+        f0 = f0.to(device=device, dtype=dtype)
+        m_source, f0_upsamp = hift.m_source, hift.f0_upsamp
+
+        def run():
+            s = f0_upsamp(f0[:, None]).transpose(1, 2)
+            return m_source(s)
+        return run
+
+    if name == "mel_24k":
+        from chatterbox.models.s3gen.utils.mel import mel_spectrogram
+
+        wav = _voiced_wave(n_samples, 24000, device, dtype)[None]
+        return lambda: mel_spectrogram(wav)
+
+    if name == "s3tok_log_mel":
+        tokenizer = models.s3gen.tokenizer
+        wav = _voiced_wave(frames * MEL_HOP_16K, 16000, device, dtype)
+        return lambda: tokenizer.log_mel_spectrogram(wav)
+
+    raise ValueError(f"Unknown kernel {name!r}; expected one of {KERNELS}")
+
+
+def _sync(device):
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def measure_allocations(fn, device):
+    """(MiB allocated, number of allocations) during one call of `fn`."""
+    if str(device).startswith("cuda"):
+        _sync(device)
+        before = torch.cuda.memory_stats(device)
+        fn()
+        _sync(device)
+        after = torch.cuda.memory_stats(device)
+        n = after.get("allocation.all.allocated", 0) - before.get("allocation.all.allocated", 0)
+        nbytes = after.get("allocated_bytes.all.allocated", 0) - before.get("allocated_bytes.all.allocated", 0)
+        return nbytes / 2**20, n
+
+    from torch.profiler import ProfilerActivity, profile
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    allocs = [e.self_cpu_memory_usage for e in prof.events() if e.self_cpu_memory_usage > 0]
+    return sum(allocs) / 2**20, len(allocs)
+
+
+def time_kernel(fn, device, repeats=20, warmup=3):
+    """Wall time of `repeats` calls of `fn`, in ms, after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        _sync(device)
+        t0 = time.perf_counter()
+        fn()
+        _sync(device)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run_micro(kernels, frame_counts, dtypes, thread_counts, repeats=20, warmup=3, device="cpu",
+              meanflow=False, seed=0, log=print):
+    """
+    Run every (kernel, frames, dtype, threads) combination. Returns
+    {"kernel/frames=F/dtype=D/threads=T": stats}, where stats holds the
+    timing summary in ms plus alloc_mb / allocs, or `error` if the kernel
+    does not support that dtype on this device.
+    """
+    models = _Models(device, meanflow=meanflow, seed=seed)
+    results = {}
+    with torch.inference_mode():
+        for threads in thread_counts:
+            set_threads(threads)
+            for name in kernels:
+                for frames in frame_counts:
+                    for dtype_name in dtypes:
+                        key = f"{name}/frames={frames}/dtype={dtype_name}/threads={threads}"
+                        try:
+                            fn = make_kernel(name, models, frames, DTYPES[dtype_name], device)
+                            stats = summarize(time_kernel(fn, device, repeats=repeats, warmup=warmup))
+                            stats["alloc_mb"], stats["allocs"] = measure_allocations(fn, device)
+                        except (RuntimeError, NotImplementedError) as e:
+                            stats = {"error": str(e).splitlines()[0]}
+                        results[key] = stats
+                        log(format_stats(key, stats))
+    return results
+
+
+def format_stats(key, s):
+    if "error" in s:
+        return f"{key:<50} unsupported: {s['error']}"
+    line = (f"{key:<50} mean={s['mean']:8.2f}ms p50={s['p50']:8.2f} p90={s['p90']:8.2f} "
+            f"p99={s['p99']:8.2f} std={s['std']:6.2f}")
+    if "alloc_mb" in s:
+        line += f" alloc={s['alloc_mb']:7.1f}MB/{s['allocs']}"
+    if "speedup" in s:
+        line += f" speedup={s['speedup']:5.1f}x"
+    return line
+
+
+# Words the normalize documents are drawn from, and the module each
+# language's normalizer needs (None: always available)
+NORMALIZE_LANGUAGES = {
+    "ja": (["日本", "東京", "今日", "天気", "先生", "学校", "電車", "友達", "映画", "時間", "は", "が", "を", "に",
+            "で", "行きます", "見ました", "とても", "良い", "新しい", "コーヒー", "ニュース"], "pykakasi"),
+    "ru": (["сегодня", "погода", "очень", "хорошая", "город", "москва", "друг", "книга", "читать", "утром",
+            "вечером", "дом", "работа", "время", "новый", "большой", "мы", "они", "и", "в", "на"],
+           "russian_text_stresser"),
+    "ko": (["오늘", "날씨가", "아주", "좋습니다", "서울", "친구", "학교에", "갑니다", "책을", "읽어요", "시간",
+            "새로운", "영화", "아침", "저녁", "우리는", "그리고", "커피"], None),
+    "zh": (["今天", "天氣", "很好", "我們", "朋友", "學校", "時間", "新聞", "電影", "咖啡", "北京", "城市",
+            "早上", "晚上", "的", "了", "在", "是"], None),
+}
+
+
+def _documents(language, words, count, seed=0):
+    """`count` documents of `words` words each: new sentences over one Zipf-weighted vocabulary."""
+    vocab = NORMALIZE_LANGUAGES[language][0]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    rng = random.Random(seed)
+    spaced = language in ("ru", "ko")
+    docs = []
+    for _ in range(count):
+        sentences, left = [], words
+        while left > 0:
+            n = min(left, rng.randint(6, 12))
+            picked = rng.choices(vocab, weights, k=n)
+            if spaced:
+                sentences.append(" ".join(picked) + ".")
+            else:  # no spaces: short clauses between commas
+                clauses = ["".join(picked[i:i + 3]) for i in range(0, n, 3)]
+                sentences.append(("、" if language == "ja" else "，").join(clauses) + "。")
+            left -= n
+        docs.append((" " if spaced else "").join(sentences))
+    return docs
+
+
+def run_normalize(languages, word_counts, repeats=20, warmup=3, seed=0, log=print):
+    """
+    Time the language normalizers with the per-word cache off and warm.
+    Returns {"normalize_<lang>/words=N/cache=off|on": stats}; the cache=on
+    entry also holds `speedup` (p50 off / p50 on).
+    """
+    from chatterbox.models.tokenizers.tokenizer import WORD_CACHE_SIZE, MTLTokenizer
+    from .synthetic import _write_grapheme_tokenizer
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        vocab = _write_grapheme_tokenizer(os.path.join(workdir, "mtl_tokenizer.json"))
+        for language in languages:
+            needs = NORMALIZE_LANGUAGES[language][1]
+            for words in word_counts:
+                key = f"normalize_{language}/words={words}"
+                if needs and importlib.util.find_spec(needs) is None:
+                    results[key] = {"error": f"{needs} is not installed"}
+                    log(format_stats(key, results[key]))
+                    continue
+                docs = _documents(language, words, warmup + repeats, seed=seed)
+                p50 = {}
+                for cache, size in (("off", 0), ("on", WORD_CACHE_SIZE)):
+                    tokenizer = MTLTokenizer(vocab, cache_size=size)
+                    samples = []
+                    for i, doc in enumerate(docs):
+                        t0 = time.perf_counter()
+                        tokenizer._normalize(doc, language_id=language)
+                        if i >= warmup:
+                            samples.append((time.perf_counter() - t0) * 1000)
+                    stats = summarize(samples)
+                    p50[cache] = stats["p50"]
+                    if cache == "on":
+                        stats["speedup"] = p50["off"] / p50["on"] if p50["on"] else float("inf")
+                    results[f"{key}/cache={cache}"] = stats
+                    log(format_stats(f"{key}/cache={cache}", stats))
+    return results
@@ -0,0 +1,201 @@
+"""
+Synthetic Chatterbox pipelines: the real architectures (T3 from `T3Config` /
+`LLAMA_CONFIGS`, S3Gen, VoiceEncoder, the Turbo GPT-2 variant) with seeded
+random weights and small generated tokenizers, so benchmarks run anywhere
+without downloading checkpoints.
+
+Random weights never learn to emit the stop token, so T3 always decodes up
+to the `max_new_tokens` it is given; benchmarks set that from the text
+length, which keeps the amount of work per text deterministic.
+"""
+import os
+import string
+
+from . import common  # noqa: F401  (sets up sys.path and the environment)
+
+import numpy as np
+import torch
+
+VARIANTS = ("tts", "mtl", "turbo", "vc")
+
+# Characters the synthetic grapheme tokenizers know; anything else maps to [UNK]
+_CHARSET = string.ascii_letters + string.digits + string.punctuation
+
+TURBO_VOCAB_SIZE = 50276
+_TURBO_EOS = "<|endoftext|>"
+
+SAMPLE_TEXT = (
+    "The quick brown fox jumps over the lazy dog. Benchmarks should be boring, "
+    "repeatable and cheap to run; this paragraph only needs to look like ordinary "
+    "English prose. It has commas, semicolons, numbers like 42 and 1999, and "
+    "sentences of different lengths! Does it ask questions? Sometimes it does. "
+    "When the text runs out it simply starts again from the beginning, so any "
+    "requested length can be produced from the same deterministic source. "
+)
+
+
+def sample_text(n_chars):
+    """Deterministic English-looking text of about `n_chars` characters, ending at a word boundary."""
+    text = SAMPLE_TEXT * (n_chars // len(SAMPLE_TEXT) + 1)
+    cut = text.rfind(" ", 0, n_chars + 1)
+    return text[:cut if cut > 0 else n_chars].strip()
+
+
+def _write_grapheme_tokenizer(path, extra_tokens=()):
+    """Character-level `tokenizers` JSON shaped like the real grapheme vocabularies."""
+    from tokenizers import Tokenizer
+    from tokenizers.models import BPE
+
+    from chatterbox.models.tokenizers.tokenizer import SPECIAL_TOKENS, UNK
+
+    vocab = {tok: i for i, tok in enumerate(SPECIAL_TOKENS)}
+    for ch in _CHARSET:
+        vocab.setdefault(ch, len(vocab))
+    tokenizer = Tokenizer(BPE(vocab=vocab, merges=[], unk_token=UNK))
+    tokenizer.add_special_tokens(list(SPECIAL_TOKENS) + list(extra_tokens))
+    tokenizer.save(path)
+    return path
+
+
+def _turbo_tokenizer(workdir):
+    """Byte-level BPE trained on the sample text, padded out to the Turbo vocabulary size."""
+    from tokenizers import Tokenizer, decoders, pre_tokenizers
+    from tokenizers.models import BPE
+    from tokenizers.trainers import BpeTrainer
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = BpeTrainer(
+        vocab_size=1024,
+        special_tokens=[_TURBO_EOS],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        show_progress=False,
+    )
+    tokenizer.train_from_iterator([SAMPLE_TEXT] * 4, trainer=trainer)
+    path = os.path.join(workdir, "turbo_tokenizer.json")
+    tokenizer.save(path)
+
+    fast = PreTrainedTokenizerFast(tokenizer_file=path, eos_token=_TURBO_EOS)
+    fast.pad_token = fast.eos_token
+    return fast
+
+
+def _turbo_config():
+    from chatterbox.models.t3.modules.t3_config import T3Config
+
+    # Same hyperparameters ChatterboxTurboTTS.from_local uses
+    hp = T3Config(text_tokens_dict_size=TURBO_VOCAB_SIZE)
+    hp.llama_config_name = "GPT2_medium"
+    hp.speech_tokens_dict_size = 6563
+    hp.input_pos_emb = None
+    hp.speech_cond_prompt_len = 375
+    hp.use_perceiver_resampler = False
+    hp.emotion_adv = False
+    return hp
+
+
+def build_s3gen(device, meanflow=False):
+    from chatterbox.models.s3gen import S3Gen
+
+    s3gen = S3Gen(meanflow=meanflow)
+    s3gen.to(device).eval()
+    # Random weights: folding is still worth doing (it changes the timings),
+    # but there is nothing meaningful to verify it against.
+    s3gen.prepare_for_inference(verify=False)
+    return s3gen
+
+
+def _voice_encoder(device):
+    from chatterbox.models.voice_encoder import VoiceEncoder
+
+    return VoiceEncoder().to(device).eval()
+
+
+def _t3(hp, device):
+    from chatterbox.models.t3 import T3
+
+    t3 = T3(hp) if hp is not None else T3()
+    return t3.to(device).eval()
+
+
+def build_pipeline(variant, workdir, device="cpu", seed=0):
+    """
+    Construct the `variant` pipeline ("tts", "mtl", "turbo" or "vc") exactly
+    as its `from_local` does, but with weights drawn from `seed` and
+    tokenizers written to `workdir`. No voice is prepared yet.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant {variant!r}; expected one of {VARIANTS}")
+    os.makedirs(workdir, exist_ok=True)
+    torch.manual_seed(seed)
+
+    if variant == "vc":
+        from chatterbox.vc import ChatterboxVC
+        return ChatterboxVC(build_s3gen(device), device)
+
+    ve = _voice_encoder(device)
+
+    if variant == "tts":
+        from chatterbox.models.tokenizers import EnTokenizer
+        from chatterbox.tts import ChatterboxTTS
+
+        tokenizer = EnTokenizer(_write_grapheme_tokenizer(os.path.join(workdir, "tokenizer.json")))
+        return ChatterboxTTS(_t3(None, device), build_s3gen(device), ve, tokenizer, device)
+
+    if variant == "mtl":
+        from chatterbox.models.t3.modules.t3_config import T3Config
+        from chatterbox.models.tokenizers import MTLTokenizer
+        from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+
+        path = _write_grapheme_tokenizer(os.path.join(workdir, "mtl_tokenizer.json"), extra_tokens=["[en]"])
+        tokenizer = MTLTokenizer(path)
+        return ChatterboxMultilingualTTS(_t3(T3Config.multilingual(), device), build_s3gen(device), ve, tokenizer, device)
+
+    from chatterbox.tts_turbo import ChatterboxTurboTTS
+
+    t3 = _t3(_turbo_config(), device)
+    del t3.tfmr.wte  # as in from_local: T3 embeds text itself
+    tokenizer = _turbo_tokenizer(workdir)
+    return ChatterboxTurboTTS(t3, build_s3gen(device, meanflow=True), ve, tokenizer, device)
+
+
+def write_reference_voice(path, seconds=10.0, sr=24000, seed=0):
+    """
+    A voiced, speech-like test clip: a gliding harmonic tone with syllable-rate
+    amplitude modulation, pauses and a little noise. Long enough for every
+    pipeline's reference-length checks.
+    """
+    import soundfile as sf
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 0.5
+    pauses = (np.sin(2 * np.pi * 0.25 * t) > -0.8).astype(np.float64)
+    wav = 0.3 * voiced * syllables * pauses + 0.005 * rng.standard_normal(t.shape)
+    wav = (0.5 * wav / np.abs(wav).max()).astype(np.float32)
+    sf.write(path, wav, sr)
+    return path
+
+
+def prepare_voice(pipeline, variant, voice_path):
+    """Set the synthetic reference voice as the pipeline's default conditioning."""
+    if variant == "vc":
+        pipeline.set_target_voice(voice_path)
+    else:
+        pipeline.prepare_conditionals(voice_path)
+
+
+def describe(pipeline):
+    """Parameter counts of the synthetic models, for the report."""
+    out = {}
+    for name in ("t3", "s3gen", "ve"):
+        module = getattr(pipeline, name, None)
+        if module is not None:
+            out[name] = sum(p.numel() for p in module.parameters())
+    return out
+
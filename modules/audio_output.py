@@ -0,0 +1,256 @@
+"""
+Streaming audio output encoding for Chatterbox TTS Enhanced
+
+The pipelines produce float32 waveforms chunk by chunk; this module turns
+those chunks into bytes for delivery as they arrive instead of shipping one
+uncompressed float blob at the end:
+
+- pcm: raw 16-bit little-endian frames
+- wav: a streaming WAV header, then 16-bit PCM
+- flac: lossless, typically 1.5-2x smaller than 16-bit PCM for speech;
+  comes out whole at the end of the stream, since its header carries the
+  total length and decoders such as libsndfile reject a file without it
+- opus: Ogg/Opus at the pipelines' 24 kHz, about 1/10 the size of 16-bit PCM (1/20 of float32)
+- mp3: when the installed libsndfile was built with MPEG support
+
+`ChunkEncoder` does the encoding in the calling thread, chunk in, bytes out.
+`StreamingAudioEncoder` runs one on a background thread and writes the bytes
+to a file, a file object or a socket as it goes, so the producer never waits
+on the encoder.
+"""
+import io
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 24000
+
+# format -> (libsndfile container, subtype, media type)
+FORMATS = {
+    "pcm": (None, None, "audio/L16"),
+    "wav": (None, None, "audio/wav"),
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+    "opus": ("OGG", "OPUS", "audio/ogg"),
+    "mp3": ("MPEG", "MPEG_LAYER_III", "audio/mpeg"),
+}
+
+# Encoded into a seekable buffer and returned whole by finish(), so the
+# encoder can write the final length into the header
+WHOLE_FILE_FORMATS = {"flac"}
+
+
+def available_formats():
+    """Output formats supported by this installation."""
+    try:
+        import soundfile as sf
+        containers = sf.available_formats()
+    except (ImportError, OSError):
+        containers = {}
+    return [fmt for fmt, (container, _, _) in FORMATS.items() if container is None or container in containers]
+
+
+def wav_header(sample_rate=SAMPLE_RATE, n_samples=None):
+    """16-bit mono WAV header; unknown length (streaming) uses the max size."""
+    data_size = 0xFFFFFFFF - 36 if n_samples is None else n_samples * 2
+    return b"RIFF" + struct.pack("<I", min(data_size + 36, 0xFFFFFFFF)) + b"WAVE" + \
+        b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16) + \
+        b"data" + struct.pack("<I", data_size)
+
+
+def to_pcm16(wav):
+    return (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def as_numpy(wav):
+    """Flat float32 NumPy view of a waveform tensor or array."""
+    if hasattr(wav, "detach"):
+        wav = wav.detach().cpu().numpy()
+    return np.asarray(wav, dtype=np.float32).reshape(-1)
+
+
+class _ForwardBuffer:
+    """
+    Write-only file object for libsndfile whose bytes can be taken out as
+    they are produced. Encoders that go back to patch their header when
+    closing (FLAC's total length) can only do so while it hasn't been taken;
+    afterwards the patch is dropped and the stream keeps its "unknown length"
+    header, which decoders accept.
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self.sent = 0  # bytes already handed out by take()
+        self.buf = bytearray()
+
+    def write(self, data):
+        data = bytes(data)
+        n = len(data)
+        start = self.pos
+        if start < self.sent:
+            data = data[self.sent - start:]
+            start = self.sent
+        offset = start - self.sent
+        if offset > len(self.buf):
+            self.buf += bytes(offset - len(self.buf))
+        self.buf[offset:offset + len(data)] = data
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        end = self.sent + len(self.buf)
+        self.pos = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: end}[whence] + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        return b""
+
+    def take(self):
+        out = bytes(self.buf)
+        self.sent += len(out)
+        self.buf.clear()
+        return out
+
+
+class ChunkEncoder:
+    """Incremental encoder: float waveform chunks in, encoded bytes out."""
+
+    def __init__(self, fmt="wav", sample_rate=SAMPLE_RATE):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown audio format '{fmt}'; expected one of {', '.join(FORMATS)}")
+        if fmt not in available_formats():
+            raise ValueError(f"Audio format '{fmt}' is not supported by the installed libsndfile")
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.media_type = FORMATS[fmt][2]
+        # False: encode() returns nothing and finish() the whole file
+        self.streaming = fmt not in WHOLE_FILE_FORMATS
+        self._started = False
+        self._file = None
+        self._buffer = None
+        container, subtype, _ = FORMATS[fmt]
+        if container is not None:
+            import soundfile as sf
+            self._buffer = _ForwardBuffer() if self.streaming else io.BytesIO()
+            self._file = sf.SoundFile(
+                self._buffer, "w", samplerate=sample_rate, channels=1, format=container, subtype=subtype,
+            )
+
+    def encode(self, wav) -> bytes:
+        """Encode one chunk; returns whatever bytes are ready (may be empty while the codec fills a page)."""
+        wav = as_numpy(wav)
+        if self._file is None:
+            header = wav_header(self.sample_rate) if self.format == "wav" and not self._started else b""
+            self._started = True
+            return header + to_pcm16(wav)
+        self._file.write(np.clip(wav, -1.0, 1.0))
+        return self._buffer.take() if self.streaming else b""
+
+    def finish(self) -> bytes:
+        """Flush the codec and return the remaining bytes."""
+        if self._file is None:
+            if self.format == "wav" and not self._started:
+                self._started = True
+                return wav_header(self.sample_rate, n_samples=0)
+            return b""
+        if not self._file.closed:
+            self._file.close()
+        if not self.streaming:
+            data = self._buffer.getvalue()
+            self._buffer = io.BytesIO()
+            return data
+        return self._buffer.take()
+
+    def encode_all(self, wav) -> bytes:
+        """A whole waveform as one complete file (WAV with its real length)."""
+        if self.format == "wav":
+            wav = as_numpy(wav)
+            self._started = True
+            return wav_header(self.sample_rate, n_samples=len(wav)) + to_pcm16(wav)
+        if self._file is None:
+            return self.encode(wav) + self.finish()
+        # Nothing taken until the end, so FLAC can still patch in its length
+        self._file.write(np.clip(as_numpy(wav), -1.0, 1.0))
+        return self.finish()
+
+
+class StreamingAudioEncoder:
+    """
+    Encodes waveform chunks on a background thread and writes the bytes to
+    `output` as soon as the codec produces them.
+
+    `output` is a path, a writable binary file object, or a callable taking
+    bytes (e.g. `socket.sendall`). `write()` only queues the chunk; an error
+    from the encoder thread is raised by the next `write()` or by `close()`.
+
+        with StreamingAudioEncoder("opus", model.sr, "out.ogg") as enc:
+            for chunk in model.generate_stream(audio):
+                enc.write(chunk)
+    """
+
+    _DONE = object()
+
+    def __init__(self, fmt, sample_rate, output, max_pending=64):
+        self.encoder = ChunkEncoder(fmt, sample_rate)
+        self._owns_file = isinstance(output, (str, os.PathLike))
+        if self._owns_file:
+            output = open(output, "wb")
+        self._file = output if hasattr(output, "write") else None
+        self._send = self._file.write if self._file is not None else output
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self.bytes_written = 0
+        self._thread = threading.Thread(target=self._loop, name="chatterbox-audio-encoder", daemon=True)
+        self._thread.start()
+
+    def _emit(self, data):
+        if data:
+            self._send(data)
+            self.bytes_written += len(data)
+
+    def _loop(self):
+        try:
+            while True:
+                wav = self._queue.get()
+                if wav is self._DONE:
+                    break
+                self._emit(self.encoder.encode(wav))
+            self._emit(self.encoder.finish())
+            if self._file is not None and hasattr(self._file, "flush"):
+                self._file.flush()
+        except Exception as e:
+            self._error = e
+            # Keep draining so a producer blocked on a full queue can finish
+            while self._queue.get() is not self._DONE:
+                pass
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, wav):
+        """Queue a float waveform chunk (tensor or array) for encoding."""
+        self._check()
+        if not self._thread.is_alive():
+            raise ValueError("write() on a closed StreamingAudioEncoder")
+        self._queue.put(as_numpy(wav))
+
+    def close(self):
+        """Finish the stream and wait for the last bytes to be written."""
+        if self._thread.is_alive():
+            self._queue.put(self._DONE)
+            self._thread.join()
+        if self._owns_file and not self._file.closed:
+            self._file.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
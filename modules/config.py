@@ -2,48 +2,90 @@
 Configuration and constants for Chatterbox TTS Enhanced
 """
 import os
-import torch
-from pathlib import Path
+from functools import lru_cache
+
+# Supported languages (lightweight module; doesn't import the multilingual model)
+from chatterbox.languages import SUPPORTED_LANGUAGES
 
 # Project paths
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 VOICE_DIR = os.path.join(PROJECT_ROOT, "voice_samples")
 os.makedirs(VOICE_DIR, exist_ok=True)
 
-# Device configuration
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-# Check GPU memory and fallback to CPU if less than 5GB
-if DEVICE == "cuda":
-    gpu_memory_gb = torch.cuda.get_device_properties(0).total_memory / 1024**3
-    if gpu_memory_gb < 5:
-        print("=" * 50)
-        print(f"⚠️  WARNING: GPU memory ({gpu_memory_gb:.2f} GB) is less than 5GB")
-        print("⚠️  Switching to CPU to avoid out-of-memory errors")
-        print("=" * 50)
-        DEVICE = "cpu"
-
-# Print device information
-print("=" * 50)
-print(f"🚀 Chatterbox TTS Enhanced Starting...")
-print(f"📱 Device: {DEVICE.upper()}")
-if DEVICE == "cuda":
-    print(f"🎮 GPU: {torch.cuda.get_device_name(0)}")
-    print(f"💾 GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
-    print("✅ GPU has sufficient memory (≥5GB)")
-else:
-    if torch.cuda.is_available():
-        print(f"⚠️  GPU available but using CPU due to low memory")
+# Target speech tokens (25 per second of audio) per text chunk
+CHUNK_SPEECH_TOKEN_BUDGET = 500
+
+# Synthesis result cache (seeded generations only)
+RESULT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".result_cache")
+RESULT_CACHE_MAX_BYTES = 2 * 1024**3
+RESULT_CACHE_MEMORY_BYTES = 256 * 1024**2
+
+# Generation time estimates, calibrated per device from real runs
+ETA_STATS_PATH = os.path.join(PROJECT_ROOT, ".eta_stats.json")
+
+# Joining chunks of long-form output (stitching.py)
+STITCH_PAD_MS = 100  # audio kept around the speech of each chunk
+STITCH_CROSSFADE_MS = 20
+STITCH_SILENCE_DB = -40  # frames this far below a chunk's loudest are silence
+# Expected output length beyond which audio is written to OUTPUT_DIR as it's generated
+STITCH_TO_DISK_SECONDS = 20 * 60
+OUTPUT_DIR = os.path.join(PROJECT_ROOT, "outputs")
+OUTPUT_MAX_AGE_HOURS = 24  # older files in OUTPUT_DIR are deleted when a new one is started
+
+# API server (server.py): jobs queued or running before new requests get 429
+SERVER_MAX_QUEUE = 32
+# Workers pulling from each model's queue. Jobs still run one at a time
+# (`model_manager.use` is exclusive), so more than 1 gives no parallelism
+SERVER_WORKERS_PER_MODEL = 1
+# Estimated seconds of queued work beyond which new requests get 429 (None: no limit)
+SERVER_MAX_BACKLOG_SECONDS = None
+
+
+@lru_cache(maxsize=None)
+def get_device():
+    """Probe the GPU on first use and return the device models should run on."""
+    import torch
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # Check GPU memory and fallback to CPU if less than 5GB
+    if device == "cuda":
+        gpu_memory_gb = torch.cuda.get_device_properties(0).total_memory / 1024**3
+        if gpu_memory_gb < 5:
+            print("=" * 50)
+            print(f"⚠️  WARNING: GPU memory ({gpu_memory_gb:.2f} GB) is less than 5GB")
+            print("⚠️  Switching to CPU to avoid out-of-memory errors")
+            print("=" * 50)
+            device = "cpu"
+
+    # Print device information
+    print("=" * 50)
+    print(f"🚀 Chatterbox TTS Enhanced Starting...")
+    print(f"📱 Device: {device.upper()}")
+    if device == "cuda":
         print(f"🎮 GPU: {torch.cuda.get_device_name(0)}")
-        print(f"💾 GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB (< 5GB required)")
+        print(f"💾 GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
+        print("✅ GPU has sufficient memory (≥5GB)")
     else:
-        print("⚠️  No GPU detected - Running on CPU")
-    print("⏱️  Generation will be slower on CPU")
-print("=" * 50)
-print()
+        if torch.cuda.is_available():
+            print(f"⚠️  GPU available but using CPU due to low memory")
+            print(f"🎮 GPU: {torch.cuda.get_device_name(0)}")
+            print(f"💾 GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB (< 5GB required)")
+        else:
+            print("⚠️  No GPU detected - Running on CPU")
+        print("⏱️  Generation will be slower on CPU")
+    print("=" * 50)
+    print()
+    return device
+
+
+def __getattr__(name):
+    # `DEVICE` used to be computed at import time; keep the old name working
+    # but only probe CUDA when somebody actually asks for it.
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Supported languages from chatterbox.mtl_tts
-from chatterbox.mtl_tts import SUPPORTED_LANGUAGES
 
 # Language configuration with sample audio and text
 LANGUAGE_CONFIG = {
@@ -0,0 +1,308 @@
+"""
+Generation time estimates and live progress for Chatterbox TTS Enhanced
+
+Estimates come from the app's own generations instead of a fixed
+characters-per-second guess. Every finished `generate()` call hands its
+`GenerationProfile` to `eta_model` (a profiling sink), which keeps, per
+device and variant, exponential moving averages of:
+
+- tokens_per_s: T3 decode speed
+- s3gen_rtf: S3Gen (CFM + HiFiGAN) seconds per second of audio
+- overhead_s: everything else in a call (conditioning, prefill, watermark)
+
+and saves them to ETA_STATS_PATH so the next session starts calibrated.
+Until a device/variant has been seen, rough priors are used.
+
+`ProgressTracker` turns the per-step reports of the T3 decode loop and the
+CFM solver (`chatterbox.profiling.report_progress`) into an overall fraction
+and time left for a multi-chunk job; the server uses the same estimates to
+decide whether to admit a request.
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+from chatterbox.length_model import SpeechLengthModel
+from chatterbox.models.utils import CancellationToken
+from chatterbox.profiling import add_sink, progress_callback
+
+from .config import CHUNK_SPEECH_TOKEN_BUDGET, ETA_STATS_PATH
+
+SPEECH_TOKENS_PER_SECOND = 25
+MEL_FRAMES_PER_SECOND = 50
+
+# Text tokens per character when the model's tokenizer isn't at hand
+# (grapheme vocabularies for tts/mtl, GPT-2 BPE for turbo)
+TEXT_TOKENS_PER_CHAR = {"tts": 1.0, "mtl": 1.0, "turbo": 0.25}
+
+# Starting points per device type until real runs have been observed
+PRIORS = {
+    "cuda": {
+        "tts": {"tokens_per_s": 40.0, "s3gen_rtf": 0.1, "overhead_s": 0.3},
+        "mtl": {"tokens_per_s": 40.0, "s3gen_rtf": 0.1, "overhead_s": 0.3},
+        "turbo": {"tokens_per_s": 120.0, "s3gen_rtf": 0.03, "overhead_s": 0.2},
+        "vc": {"tokens_per_s": None, "s3gen_rtf": 0.1, "overhead_s": 0.3},
+    },
+    "cpu": {
+        "tts": {"tokens_per_s": 8.0, "s3gen_rtf": 2.0, "overhead_s": 1.0},
+        "mtl": {"tokens_per_s": 8.0, "s3gen_rtf": 2.0, "overhead_s": 1.0},
+        "turbo": {"tokens_per_s": 15.0, "s3gen_rtf": 0.6, "overhead_s": 1.0},
+        "vc": {"tokens_per_s": None, "s3gen_rtf": 2.0, "overhead_s": 1.0},
+    },
+}
+PRIORS["mps"] = PRIORS["cpu"]
+
+METRICS = ("tokens_per_s", "s3gen_rtf", "overhead_s")
+
+
+def _device_key():
+    """The hardware the estimates belong to: GPU model, or device type and thread count."""
+    import torch
+    from .config import get_device
+
+    device = get_device()
+    if device == "cuda":
+        return f"cuda:{torch.cuda.get_device_name(0)}"
+    return f"{device}:{torch.get_num_threads()}t"
+
+
+class EtaModel:
+    """Online per-device timing model, fed by generation profiles."""
+
+    def __init__(self, path=ETA_STATS_PATH, alpha=0.2, save_every=10):
+        """
+        :param alpha: weight of each new observation in the moving averages.
+        :param save_every: observations between writes to `path` (also saved at exit).
+        """
+        self.path = path
+        self.alpha = alpha
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._stats = self._load()  # "device/variant" -> {"n", metric: value}
+        self._unsaved = 0
+        self._device = None
+
+    # ----------------------------------------------------------- persistence
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            stats = {k: dict(v) for k, v in self._stats.items()}
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Warning: could not save generation time stats: {e}")
+
+    # ----------------------------------------------------------------- rates
+    def _key(self, variant):
+        if self._device is None:
+            self._device = _device_key()
+        return f"{self._device}/{variant}"
+
+    def rates(self, variant) -> dict:
+        """Current tokens_per_s / s3gen_rtf / overhead_s for `variant` on this device."""
+        prior = PRIORS.get(self._key(variant).split(":")[0], PRIORS["cpu"])[variant]
+        with self._lock:
+            seen = dict(self._stats.get(self._key(variant), {}))
+            if variant == "vc" and "s3gen_rtf" not in seen:
+                # Same S3Gen and CFM steps as the English model
+                tts = self._stats.get(self._key("tts"), {})
+                if "s3gen_rtf" in tts:
+                    seen["s3gen_rtf"] = tts["s3gen_rtf"]
+        return {m: seen.get(m, prior[m]) for m in METRICS}
+
+    def calibrated(self, variant) -> bool:
+        with self._lock:
+            return self._stats.get(self._key(variant), {}).get("n", 0) > 0
+
+    def observe(self, profile):
+        """Profiling sink: learn from one finished `generate()` call."""
+        if profile.error or profile.total is None or profile.pipeline not in PRIORS["cpu"]:
+            return
+        tokens = decode_s = s3gen_s = audio_s = 0.0
+        for s in profile.stages:
+            if s.name == "t3_decode":
+                tokens += s.attrs.get("tokens", 0)
+                decode_s += s.duration
+            elif s.name in ("cfm", "hifigan"):
+                s3gen_s += s.duration
+                if s.name == "hifigan":
+                    audio_s += s.attrs.get("frames", 0) / MEL_FRAMES_PER_SECOND
+
+        sample = {"overhead_s": max(profile.total - decode_s - s3gen_s, 0.0)}
+        if tokens and decode_s:
+            sample["tokens_per_s"] = tokens / decode_s
+        if audio_s:
+            sample["s3gen_rtf"] = s3gen_s / audio_s
+
+        with self._lock:
+            stats = self._stats.setdefault(self._key(profile.pipeline), {"n": 0})
+            for metric, value in sample.items():
+                old = stats.get(metric)
+                stats[metric] = value if old is None else old + self.alpha * (value - old)
+            stats["n"] += 1
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    # ------------------------------------------------------------- estimates
+    def expected_speech_tokens(self, variant, n_text_tokens, language_id=None) -> float:
+        ratio = SpeechLengthModel.default().expected_ratio(variant, language_id)
+        return n_text_tokens * ratio
+
+    def chunk_breakdown(self, variant, speech_tokens) -> dict:
+        """Expected seconds of one generate() call, split into overhead / t3 / s3gen."""
+        r = self.rates(variant)
+        return {
+            "overhead": r["overhead_s"],
+            "t3": speech_tokens / r["tokens_per_s"] if r["tokens_per_s"] else 0.0,
+            "s3gen": speech_tokens / SPEECH_TOKENS_PER_SECOND * r["s3gen_rtf"],
+        }
+
+    def estimate_chunk(self, variant, speech_tokens) -> float:
+        return sum(self.chunk_breakdown(variant, speech_tokens).values())
+
+    def _text_speech_tokens(self, variant, text, count_tokens, language_id):
+        if count_tokens is not None:
+            n_text = count_tokens(text)
+        else:
+            n_text = len(text) * TEXT_TOKENS_PER_CHAR[variant]
+        return self.expected_speech_tokens(variant, n_text, language_id)
+
+    def expected_audio_seconds(self, variant, text, count_tokens=None, language_id=None) -> float:
+        """Expected length of the audio synthesized from `text`."""
+        return self._text_speech_tokens(variant, text, count_tokens, language_id) / SPEECH_TOKENS_PER_SECOND
+
+    def estimate_text(self, variant, text, count_tokens=None, language_id=None) -> float:
+        """
+        Expected seconds to synthesize `text`, chunked as the app does.
+        `count_tokens` (see `text_chunking.token_counter`) makes the text
+        token count exact; without it, it is approximated from the length.
+        """
+        n_speech = self._text_speech_tokens(variant, text, count_tokens, language_id)
+        n_chunks = max(1, math.ceil(n_speech / CHUNK_SPEECH_TOKEN_BUDGET))
+        return n_chunks * self.estimate_chunk(variant, n_speech / n_chunks)
+
+    def estimate_vc(self, audio_seconds) -> float:
+        r = self.rates("vc")
+        return r["overhead_s"] + audio_seconds * r["s3gen_rtf"]
+
+
+class ProgressTracker:
+    """
+    Progress and time left for one generation made of several chunks.
+
+    Call `begin_chunk(n_text_tokens)` before each chunk and `end_chunk()`
+    after it; in between, `on_step` (installed as the progress callback)
+    moves the estimate along with the T3 tokens produced against the
+    length the chunk was predicted to have, then with the CFM steps.
+    """
+
+    def __init__(self, variant, total_seconds, language_id=None, eta=None):
+        self.eta = eta or eta_model
+        self.variant = variant
+        self.language_id = language_id
+        self.total = max(total_seconds, 1e-3)
+        self.done = 0.0  # expected seconds of the finished chunks
+        self.chunk = {"overhead": 0.0, "t3": 0.0, "s3gen": 0.0}
+        self.expected_tokens = 0.0
+        self.phase, self.step, self.steps = None, 0, 0
+        self.started = time.monotonic()
+        self.result = None
+
+    def begin_chunk(self, n_text_tokens):
+        self.expected_tokens = self.eta.expected_speech_tokens(self.variant, n_text_tokens, self.language_id)
+        self.chunk = self.eta.chunk_breakdown(self.variant, self.expected_tokens)
+        self.phase, self.step, self.steps = None, 0, 0
+        # More text than the up-front estimate assumed: stretch the total
+        self.total = max(self.total, self.done + sum(self.chunk.values()))
+
+    def on_step(self, phase, done, total):
+        self.phase, self.step, self.steps = phase, done, total
+
+    def end_chunk(self):
+        self.done += sum(self.chunk.values())
+        self.phase, self.step, self.steps = None, 0, 0
+
+    def _chunk_elapsed(self):
+        c = self.chunk
+        if self.phase == "t3":
+            return c["overhead"] + c["t3"] * min(self.step / max(self.expected_tokens, 1.0), 0.99)
+        if self.phase == "cfm":
+            return c["overhead"] + c["t3"] + c["s3gen"] * self.step / max(self.steps, 1)
+        return 0.0
+
+    def fraction(self) -> float:
+        """Share of the whole job done, in [0, 0.99] until it finishes."""
+        return min((self.done + self._chunk_elapsed()) / self.total, 0.99)
+
+    def remaining(self) -> float:
+        """Expected seconds left."""
+        return max(self.total - self.done - self._chunk_elapsed(), 0.0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def run(self, fn, interval=0.5):
+        """
+        Call `fn(cancel)` on a worker thread with `on_step` as its progress
+        callback, yielding every `interval` seconds while it runs so the
+        caller can report progress. The return value ends up in `self.result`;
+        an exception from `fn` is re-raised here.
+
+        `cancel` is a `CancellationToken` for `fn` to pass to the model. If
+        this generator is closed early (the UI's Stop button, a disconnect),
+        the token is cancelled and the worker joined, so the model is free
+        again when `close()` returns.
+        """
+        box = {}
+        cancel = CancellationToken()
+
+        def target():
+            try:
+                with progress_callback(self.on_step):
+                    box["result"] = fn(cancel)
+            except BaseException as e:
+                box["error"] = e
+
+        worker = threading.Thread(target=target, name="chatterbox-generate", daemon=True)
+        worker.start()
+        try:
+            while True:
+                worker.join(interval)
+                if not worker.is_alive():
+                    break
+                yield
+        finally:
+            if worker.is_alive():
+                cancel.cancel("abandoned")
+                worker.join()
+        if "error" in box:
+            raise box["error"]
+        self.result = box["result"]
+
+
+# Global estimator, calibrated by every generate() in this process
+eta_model = EtaModel()
+add_sink(eta_model.observe)
+atexit.register(eta_model.save)
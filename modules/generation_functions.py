@@ -1,14 +1,22 @@
 """
 Speech generation, conversion, and utility functions for Chatterbox TTS Enhanced
 """
+import os
 import random
+import tempfile
 import numpy as np
 import torch
 import time
-import re
-from .config import DEVICE, LANGUAGE_CONFIG, SUPPORTED_LANGUAGES
+from concurrent.futures import Future
+from contextlib import closing
+from .config import LANGUAGE_CONFIG, OUTPUT_DIR, OUTPUT_MAX_AGE_HOURS, STITCH_TO_DISK_SECONDS, SUPPORTED_LANGUAGES
 from .model_manager import model_manager
 from .voice_manager import resolve_voice_path
+from .voice_library import voice_library
+from .text_chunking import chunk_token_budget, iter_text_chunks, token_counter
+from .result_cache import result_cache
+from .eta import ProgressTracker, eta_model
+from .stitching import ChunkStitcher
 
 
 def set_seed(seed: int):
@@ -20,11 +28,6 @@ def set_seed(seed: int):
     np.random.seed(seed)
 
 
-def estimate_generation_time(text_length):
-    """Estimate generation time based on text length."""
-    return (text_length / 50) * 2 + 1
-
-
 def format_time(seconds):
     """Format seconds into readable time string."""
     if seconds < 60:
@@ -34,81 +37,130 @@ def format_time(seconds):
     return f"{minutes} minute{'s' if minutes != 1 else ''} {seconds:.1f} seconds"
 
 
-def smart_chunk_text(text, max_words=40):
+def cached_generate(variant, model, chunk_text, voice_path, params, seed_num, watermark_async=False, **generate_kwargs):
     """
-    Intelligently chunk text based on sentence boundaries and word count.
-    Accumulates sentences to maximize chunk size up to max_words.
-    Supports all languages including CJK (Chinese, Japanese, Korean).
+    Generate one chunk through the result cache; returns (wav, cache_hit).
+
+    Seeded chunks are reseeded individually so that each one depends only on
+    its own inputs, which lets an edited document reuse unchanged chunks.
+    With `watermark_async`, a freshly generated wav is a `Future` (see
+    `resolve_wav`) that is watermarked, and cached, in the background.
     """
-    # Detect if text contains CJK characters (Chinese, Japanese, Korean)
-    def has_cjk(text):
-        return bool(re.search(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\uac00-\ud7af]', text))
-    
-    is_cjk = has_cjk(text)
-    
-    # Enhanced sentence pattern supporting multiple languages
-    # Includes: . ! ? (Western), 。！？ (CJK), । (Hindi), ؟ (Arabic)
-    sentence_pattern = r'(?<=[.!?。！？।؟])\s*|\n+'
-    sentences = re.split(sentence_pattern, text)
-    
-    chunks = []
-    current_chunk = []
-    current_count = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        
-        # Count words (space-separated) or characters (CJK)
-        if is_cjk:
-            sentence_count = len(re.sub(r'\s+', '', sentence))
-        else:
-            sentence_count = len(sentence.split())
-        
-        # Check if adding this sentence exceeds the limit
-        if current_count + sentence_count > max_words:
-            # If current chunk is not empty, save it
-            if current_chunk:
-                chunks.append(' '.join(current_chunk) if not is_cjk else ''.join(current_chunk))
-                current_chunk = []
-                current_count = 0
-            
-            # If the single sentence itself is longer than max_words, we must split it
-            if sentence_count > max_words:
-                # Split at commas/semicolons: , ; (Western), ，、； (CJK), ، (Arabic)
-                sub_parts = re.split(r'[,;،、；،]\s*', sentence)
-                for part in sub_parts:
-                    part = part.strip()
-                    if not part:
-                        continue
-                    
-                    if is_cjk:
-                        part_count = len(re.sub(r'\s+', '', part))
-                    else:
-                        part_count = len(part.split())
-                    
-                    if current_count + part_count > max_words and current_chunk:
-                        chunks.append(' '.join(current_chunk) if not is_cjk else ''.join(current_chunk))
-                        current_chunk = [part]
-                        current_count = part_count
-                    else:
-                        current_chunk.append(part)
-                        current_count += part_count
-            else:
-                # Sentence fits in a new chunk
-                current_chunk.append(sentence)
-                current_count += sentence_count
-        else:
-            # Sentence fits in current chunk
-            current_chunk.append(sentence)
-            current_count += sentence_count
-    
-    # Add remaining chunk
-    if current_chunk:
-        chunks.append(' '.join(current_chunk) if not is_cjk else ''.join(current_chunk))
-    
-    return chunks if chunks else [text]
+    key = result_cache.key(
+        variant, chunk_text, voice_path, params, seed_num,
+        generate_kwargs.get("language_id"), generate_kwargs.get("max_new_tokens"),
+    )
+    hit = result_cache.get(key)
+    if hit is not None:
+        return torch.from_numpy(hit[1]).unsqueeze(0), True
+
+    if seed_num != 0:
+        set_seed(int(seed_num))
+    with voice_library.foreground():
+        wav, profile = model.generate(
+            chunk_text, **params, watermark_async=watermark_async, return_profile=True, **generate_kwargs,
+        )
+    if key is None or (profile.attrs.get("hit_cap") and generate_kwargs.get("max_new_tokens") is None):
+        # Unseeded, or still cut off after the length model retried it at the hard maximum
+        pass
+    elif watermark_async:
+        def cache(future):
+            if future.exception() is None:
+                result_cache.put(key, model.sr, future.result())
+        wav.add_done_callback(cache)
+    else:
+        result_cache.put(key, model.sr, wav)
+    return wav, False
+
+
+def resolve_wav(wav):
+    """Wait for a background-watermarked wav; plain tensors pass through."""
+    return wav.result() if isinstance(wav, Future) else wav
+
+
+def iter_speech(variant, model, text, voice_path, params, seed_num=0, language_id=None, cancel=None):
+    """
+    Chunk `text` for `model` and yield (chunk, wav, cache_hit) as each chunk
+    is synthesized. Used by callers that stream audio instead of waiting for
+    the whole document; `cancel` (a `CancellationToken`) abandons the chunk
+    in progress within one model step.
+    """
+    voice_library.apply(variant, model, voice_path)
+    chunks = iter_text_chunks(
+        text, token_counter(model, variant, language_id), chunk_token_budget(model, variant, language_id),
+    )
+    extra = {"language_id": language_id} if variant == "mtl" else {}
+    if cancel is not None:
+        extra["cancel"] = cancel
+    for chunk in chunks:
+        wav, hit = cached_generate(variant, model, chunk.text, voice_path, params, seed_num, **extra)
+        yield chunk, wav, hit
+
+
+def prune_outputs(max_age_hours=OUTPUT_MAX_AGE_HOURS):
+    """Delete files in OUTPUT_DIR older than `max_age_hours`."""
+    if not os.path.isdir(OUTPUT_DIR):
+        return
+    cutoff = time.time() - max_age_hours * 3600
+    for entry in os.scandir(OUTPUT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass  # in use or already gone
+
+
+def new_output_path(variant):
+    """A new, unique WAV path in OUTPUT_DIR (clearing out old outputs first)."""
+    prune_outputs()
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{variant}_{time.strftime('%Y%m%d_%H%M%S')}_", suffix=".wav", dir=OUTPUT_DIR)
+    os.close(fd)
+    return path
+
+
+def new_stitcher(variant, model, text, count_tokens, language_id=None):
+    """
+    A `ChunkStitcher` sized for the audio `text` is expected to produce;
+    output expected to run past STITCH_TO_DISK_SECONDS goes to a WAV file
+    in OUTPUT_DIR instead of memory.
+    """
+    seconds = eta_model.expected_audio_seconds(variant, text, count_tokens, language_id)
+    path = None
+    if seconds > STITCH_TO_DISK_SECONDS:
+        path = new_output_path(variant)
+    return ChunkStitcher(model.sr, expected_seconds=seconds * 1.2, path=path)
+
+
+def stitched_output(stitcher):
+    """The stitched audio as a Gradio Audio value: (sample_rate, array), or a file path."""
+    audio = stitcher.result()
+    return audio if isinstance(audio, str) else (stitcher.sr, audio)
+
+
+def iter_tracked(tracker, chunks, generate_chunk, stitcher):
+    """
+    Call `generate_chunk(chunk, cancel)` for each chunk, adding the audio to
+    `stitcher`, and yield (progress, status) from 40 to 90 every half second
+    while the model works, following its token and solver steps. Chunks
+    may come back still being watermarked; each is added, in order, once
+    its watermark is done. `cancel` is the chunk's `CancellationToken`,
+    fired if this generator is closed before the chunk finishes.
+    """
+    pending = []
+    for i, chunk in enumerate(chunks):
+        tracker.begin_chunk(chunk.n_tokens)
+        status = lambda: f"Generating chunk {i+1} ({chunk.n_tokens} tokens)... ~{format_time(tracker.remaining())} left"
+        yield 40 + int(50 * tracker.fraction()), status()
+        with closing(tracker.run(lambda cancel: generate_chunk(chunk, cancel))) as steps:
+            for _ in steps:
+                yield 40 + int(50 * tracker.fraction()), status()
+        tracker.end_chunk()
+        pending.append(tracker.result[0])
+        while pending and not (isinstance(pending[0], Future) and not pending[0].done()):
+            stitcher.add(resolve_wav(pending.pop(0)))
+    for wav in pending:
+        stitcher.add(resolve_wav(wav))
 
 
 def generate_speech(text, voice_name, exaggeration, temperature, seed_num, cfgw, min_p, top_p, repetition_penalty):
@@ -140,55 +192,55 @@ def generate_speech(text, voice_name, exaggeration, temperature, seed_num, cfgw,
         if model is None:
              yield 0, None, "❌ Error: Failed to load TTS model."
              return
+        voice_library.apply("tts", model, audio_prompt_path)
         
         # Set seed if specified
         if seed_num != 0:
             set_seed(int(seed_num))
             yield 30, None, f"Seed set to {seed_num}"
         
-        # Chunk text
-        text_chunks = smart_chunk_text(text)
-        total_chunks = len(text_chunks)
-        generated_wavs = []
-        
-        # Estimate time
-        estimated_time = estimate_generation_time(len(text))
-        yield 40, None, f"Generating speech (English)...\nChunks: {total_chunks}\nEstimated time: {format_time(estimated_time)}"
-        
-        # Generate audio for each chunk
-        for i, chunk in enumerate(text_chunks):
-            progress = 40 + int((i / total_chunks) * 50)
-            yield progress, None, f"Generating chunk {i+1}/{total_chunks}..."
-            
-            chunk_wav = model.generate(
-                chunk,
-                audio_prompt_path=audio_prompt_path,
-                exaggeration=exaggeration,
-                temperature=temperature,
-                cfg_weight=cfgw,
-                min_p=min_p,
-                top_p=top_p,
-                repetition_penalty=repetition_penalty,
-            )
-            generated_wavs.append(chunk_wav)
-        
-        if not generated_wavs:
+        # Chunk text lazily by token budget; synthesis starts on the first chunk
+        count_tokens = token_counter(model, "tts")
+        text_chunks = iter_text_chunks(text, count_tokens, chunk_token_budget(model, "tts"))
+        stitcher = new_stitcher("tts", model, text, count_tokens)
+        params = dict(
+            exaggeration=exaggeration,
+            temperature=temperature,
+            cfg_weight=cfgw,
+            min_p=min_p,
+            top_p=top_p,
+            repetition_penalty=repetition_penalty,
+        )
+        
+        # Estimate time from this machine's measured speed
+        estimated_time = eta_model.estimate_text("tts", text, count_tokens)
+        tracker = ProgressTracker("tts", estimated_time)
+        yield 40, None, f"Generating speech (English)...\nEstimated time: {format_time(estimated_time)}"
+        
+        # Generate audio for each chunk (Stop or a disconnect cancels the one in progress)
+        with closing(iter_tracked(
+                tracker, text_chunks,
+                lambda chunk, cancel: cached_generate(
+                    "tts", model, chunk.text, audio_prompt_path, params, seed_num, watermark_async=True, cancel=cancel,
+                ),
+                stitcher,
+        )) as updates:
+            for progress, status in updates:
+                yield progress, None, status
+        total_chunks = stitcher.n_chunks
+        
+        if not total_chunks:
              yield 0, None, "❌ Error: No audio generated."
              return
 
         yield 90, None, "Finalizing audio..."
-        
-        # Concatenate audio chunks
-        if len(generated_wavs) > 1:
-            full_wav = torch.cat(generated_wavs, dim=-1)
-        else:
-            full_wav = generated_wavs[0]
+        output = stitched_output(stitcher)
         
         # Calculate actual time taken
         total_time = time.time() - start_time
         final_status = f"✅ Generation complete!\nTime taken: {format_time(total_time)}\nText length: {len(text)} chars\nChunks: {total_chunks}"
         
-        yield 100, (model.sr, full_wav.squeeze(0).numpy()), final_status
+        yield 100, output, final_status
         
     except Exception as e:
         error_status = f"❌ Error generating speech: {str(e)}"
@@ -229,60 +281,80 @@ def generate_multilingual_speech(text, voice_name, language_code, exaggeration,
         if model is None:
              yield 0, None, "❌ Error: Failed to load Multilingual model."
              return
+        voice_library.apply("mtl", model, audio_prompt_path)
         
         # Set seed if specified
         if seed_num != 0:
             set_seed(int(seed_num))
             yield 30, None, f"Seed set to {seed_num}"
         
-        # Chunk text
-        text_chunks = smart_chunk_text(text)
-        total_chunks = len(text_chunks)
-        generated_wavs = []
-        
-        # Estimate time
-        estimated_time = estimate_generation_time(len(text))
+        # Chunk text lazily by token budget; synthesis starts on the first chunk
+        count_tokens = token_counter(model, "mtl", language_code)
+        text_chunks = iter_text_chunks(text, count_tokens, chunk_token_budget(model, "mtl", language_code))
+        stitcher = new_stitcher("mtl", model, text, count_tokens, language_code)
+        params = dict(
+            exaggeration=exaggeration,
+            temperature=temperature,
+            cfg_weight=cfgw,
+        )
+        
+        # Estimate time from this machine's measured speed
+        estimated_time = eta_model.estimate_text("mtl", text, count_tokens, language_code)
+        tracker = ProgressTracker("mtl", estimated_time, language_code)
         lang_name = SUPPORTED_LANGUAGES.get(language_code, language_code)
-        yield 40, None, f"Generating speech in {lang_name}...\nChunks: {total_chunks}\nEstimated time: {format_time(estimated_time)}"
-        
-        # Generate audio for each chunk
-        for i, chunk in enumerate(text_chunks):
-            progress = 40 + int((i / total_chunks) * 50)
-            yield progress, None, f"Generating chunk {i+1}/{total_chunks}..."
-            
-            chunk_wav = model.generate(
-                chunk,
-                language_id=language_code,
-                audio_prompt_path=audio_prompt_path,
-                exaggeration=exaggeration,
-                temperature=temperature,
-                cfg_weight=cfgw,
-            )
-            generated_wavs.append(chunk_wav)
-            
-        if not generated_wavs:
+        yield 40, None, f"Generating speech in {lang_name}...\nEstimated time: {format_time(estimated_time)}"
+        
+        # Generate audio for each chunk (Stop or a disconnect cancels the one in progress)
+        with closing(iter_tracked(
+                tracker, text_chunks,
+                lambda chunk, cancel: cached_generate(
+                    "mtl", model, chunk.text, audio_prompt_path, params, seed_num,
+                    watermark_async=True, language_id=language_code, cancel=cancel,
+                ),
+                stitcher,
+        )) as updates:
+            for progress, status in updates:
+                yield progress, None, status
+        total_chunks = stitcher.n_chunks
+        
+        if not total_chunks:
              yield 0, None, "❌ Error: No audio generated."
              return
         
         yield 90, None, "Finalizing audio..."
-        
-        # Concatenate audio chunks
-        if len(generated_wavs) > 1:
-            full_wav = torch.cat(generated_wavs, dim=-1)
-        else:
-            full_wav = generated_wavs[0]
+        output = stitched_output(stitcher)
         
         # Calculate actual time taken
         total_time = time.time() - start_time
         final_status = f"✅ Generation complete!\nLanguage: {lang_name}\nTime taken: {format_time(total_time)}\nText length: {len(text)} chars\nChunks: {total_chunks}"
         
-        yield 100, (model.sr, full_wav.squeeze(0).numpy()), final_status
+        yield 100, output, final_status
         
     except Exception as e:
         error_status = f"❌ Error generating speech: {str(e)}"
         yield 0, None, error_status
 
 
+def resolve_vc_target(target_voice_name):
+    """
+    Map a voice conversion dropdown value to its sample path.
+
+    Returns None for "no target" (use the model's default voice) and raises
+    KeyError if the voice does not exist.
+    """
+    # Remove gender symbols if present
+    clean_name = (target_voice_name or "").replace(" ♂️", "").replace(" ♀️", "")
+    if not clean_name or clean_name == "None":
+        return None
+
+    # Try to find the voice with different gender suffix combinations
+    from .voice_manager import VOICES
+    for name in (clean_name, f"{clean_name}_male", f"{clean_name}_female"):
+        if name in VOICES["samples"]:
+            return VOICES["samples"][name]
+    raise KeyError(target_voice_name)
+
+
 def convert_voice(input_audio, target_voice_name):
     """Convert voice with progress tracking."""
     try:
@@ -295,30 +367,14 @@ def convert_voice(input_audio, target_voice_name):
         
         yield 20, None, "Loading input audio..."
         
-        # Remove gender symbols if present
-        clean_name = target_voice_name.replace(" ♂️", "").replace(" ♀️", "")
-        
-        if not clean_name or clean_name == "None":
-            target_voice_path = None
+        try:
+            target_voice_path = resolve_vc_target(target_voice_name)
+        except KeyError:
+            yield 0, None, f"❌ Error: Target voice '{target_voice_name}' not found."
+            return
+        if target_voice_path is None:
             yield 40, None, "⚠️ No target voice selected - using default..."
         else:
-            # Try to find the voice with different gender suffix combinations
-            from .voice_manager import VOICES
-            possible_names = [
-                clean_name,
-                f"{clean_name}_male",
-                f"{clean_name}_female"
-            ]
-            
-            target_voice_path = None
-            for name in possible_names:
-                if name in VOICES["samples"]:
-                    target_voice_path = VOICES["samples"][name]
-                    break
-            
-            if not target_voice_path:
-                yield 0, None, f"❌ Error: Target voice '{target_voice_name}' not found."
-                return
             yield 40, None, f"Using target voice: {target_voice_name}..."
         
         # Load model via manager (handles unloading others)
@@ -327,11 +383,21 @@ def convert_voice(input_audio, target_voice_name):
         if model is None:
              yield 0, None, "❌ Error: Failed to load VC model."
              return
-        
-        yield 70, None, "Converting voice..."
-        
-        # Convert voice
-        wav = model.generate(input_audio, target_voice_path=target_voice_path)
+        voice_library.apply("vc", model, target_voice_path)
+        
+        # Convert voice chunk by chunk so long recordings don't exhaust memory
+        import librosa
+        total_sec = max(librosa.get_duration(path=input_audio), 1e-3)
+        yield 70, None, f"Converting voice...\nEstimated time: {format_time(eta_model.estimate_vc(total_sec))}"
+        # Consecutive pieces of one signal: no trimming or crossfades
+        stitcher = ChunkStitcher(model.sr, expected_seconds=total_sec, trim=False, crossfade_ms=0)
+        done_sec = 0.0
+        with voice_library.foreground():
+            for chunk in model.generate_stream(input_audio):
+                stitcher.add(chunk)
+                done_sec += chunk.shape[-1] / model.sr
+                left = eta_model.estimate_vc(max(total_sec - done_sec, 0.0)) if done_sec < total_sec else 0.0
+                yield 70 + int(25 * min(done_sec / total_sec, 1.0)), None, f"Converting voice... {done_sec:.0f}s / {total_sec:.0f}s, ~{format_time(left)} left"
         
         yield 95, None, "Finalizing audio..."
         
@@ -339,14 +405,14 @@ def convert_voice(input_audio, target_voice_name):
         total_time = time.time() - start_time
         final_status = f"✅ Conversion complete!\nTime taken: {format_time(total_time)}"
         
-        yield 100, (model.sr, wav.squeeze(0).numpy()), final_status
+        yield 100, stitched_output(stitcher), final_status
         
     except Exception as e:
         error_status = f"❌ Error converting voice: {str(e)}"
         yield 0, None, error_status
 
 
-def generate_turbo_speech(text, voice_name):
+def generate_turbo_speech(text, voice_name, seed_num=0):
     """Generate speech using Turbo model with progress tracking and paralinguistic tag support."""
     try:
         start_time = time.time()
@@ -375,44 +441,42 @@ def generate_turbo_speech(text, voice_name):
         if model is None:
              yield 0, None, "❌ Error: Failed to load Turbo model."
              return
-        
-        # Chunk text
-        text_chunks = smart_chunk_text(text)
-        total_chunks = len(text_chunks)
-        generated_wavs = []
-        
-        # Estimate time (Turbo is faster, so reduce estimate)
-        estimated_time = estimate_generation_time(len(text)) * 0.3  # Turbo is ~3x faster
-        yield 40, None, f"Generating speech with Turbo (English)...\nChunks: {total_chunks}\nEstimated time: {format_time(estimated_time)}\n💡 Tip: Use tags like [chuckle], [laugh], [sigh] for realism!"
-        
-        # Generate audio for each chunk
-        for i, chunk in enumerate(text_chunks):
-            progress = 40 + int((i / total_chunks) * 50)
-            yield progress, None, f"Generating chunk {i+1}/{total_chunks}..."
-            
-            chunk_wav = model.generate(
-                chunk,
-                audio_prompt_path=audio_prompt_path
-            )
-            generated_wavs.append(chunk_wav)
-        
-        if not generated_wavs:
+        voice_library.apply("turbo", model, audio_prompt_path)
+        
+        # Chunk text lazily by token budget; synthesis starts on the first chunk
+        count_tokens = token_counter(model, "turbo")
+        text_chunks = iter_text_chunks(text, count_tokens, chunk_token_budget(model, "turbo"))
+        stitcher = new_stitcher("turbo", model, text, count_tokens)
+        
+        # Estimate time from this machine's measured speed
+        estimated_time = eta_model.estimate_text("turbo", text, count_tokens)
+        tracker = ProgressTracker("turbo", estimated_time)
+        yield 40, None, f"Generating speech with Turbo (English)...\nEstimated time: {format_time(estimated_time)}\n💡 Tip: Use tags like [chuckle], [laugh], [sigh] for realism!"
+        
+        # Generate audio for each chunk (Stop or a disconnect cancels the one in progress)
+        with closing(iter_tracked(
+                tracker, text_chunks,
+                lambda chunk, cancel: cached_generate(
+                    "turbo", model, chunk.text, audio_prompt_path, {}, seed_num, watermark_async=True, cancel=cancel,
+                ),
+                stitcher,
+        )) as updates:
+            for progress, status in updates:
+                yield progress, None, status
+        total_chunks = stitcher.n_chunks
+        
+        if not total_chunks:
              yield 0, None, "❌ Error: No audio generated."
              return
 
         yield 90, None, "Finalizing audio..."
-        
-        # Concatenate audio chunks
-        if len(generated_wavs) > 1:
-            full_wav = torch.cat(generated_wavs, dim=-1)
-        else:
-            full_wav = generated_wavs[0]
+        output = stitched_output(stitcher)
         
         # Calculate actual time taken
         total_time = time.time() - start_time
         final_status = f"✅ Generation complete!\nTime taken: {format_time(total_time)}\nText length: {len(text)} chars\nChunks: {total_chunks}\n⚡ Generated with Turbo (350M params)"
         
-        yield 100, (model.sr, full_wav.squeeze(0).numpy()), final_status
+        yield 100, output, final_status
         
     except Exception as e:
         error_status = f"❌ Error generating speech: {str(e)}"
@@ -474,25 +538,23 @@ def generate_batch_turbo_speech(text_list, voice_list, use_same_voice):
             yield int(10 + (idx / total_items) * 85), audio_outputs, f"🎙️ Generating item {item_num}/{total_items}: {text[:50]}..."
             
             try:
-                # Chunk text
-                text_chunks = smart_chunk_text(text)
+                voice_library.apply("turbo", model, audio_prompt_path)
+
+                # Chunk text by token budget
+                count_tokens = token_counter(model, "turbo")
+                text_chunks = iter_text_chunks(text, count_tokens, chunk_token_budget(model, "turbo"))
+                stitcher = new_stitcher("turbo", model, text, count_tokens)
                 generated_wavs = []
                 
-                # Generate audio for each chunk
-                for chunk in text_chunks:
-                    chunk_wav = model.generate(
-                        chunk,
-                        audio_prompt_path=audio_prompt_path
-                    )
-                    generated_wavs.append(chunk_wav)
-                
-                # Concatenate chunks
-                if len(generated_wavs) > 1:
-                    full_wav = torch.cat(generated_wavs, dim=-1)
-                else:
-                    full_wav = generated_wavs[0]
+                # Generate audio for each chunk; each is watermarked while the next one runs
+                with voice_library.foreground():
+                    for chunk in text_chunks:
+                        chunk_wav = model.generate(chunk.text, watermark_async=True)
+                        generated_wavs.append(chunk_wav)
+                for chunk_wav in generated_wavs:
+                    stitcher.add(resolve_wav(chunk_wav))
                 
-                audio_outputs.append((model.sr, full_wav.squeeze(0).numpy()))
+                audio_outputs.append(stitched_output(stitcher))
                 
             except Exception as e:
                 yield int(10 + (idx / total_items) * 85), audio_outputs, f"❌ Item {item_num}/{total_items}: Error - {str(e)}"
@@ -515,4 +577,92 @@ def generate_batch_turbo_speech(text_list, voice_list, use_same_voice):
     except Exception as e:
         error_status = f"❌ Error in batch generation: {str(e)}"
         yield 0, [], error_status
-                    
+
+
+def convert_voice_batch(input_audios, target_voice_names, batch_size=8):
+    """
+    Convert many input files, each to its own target voice.
+
+    Jobs are grouped by target so every target's conditionals are computed
+    (or fetched from the voice library) once, and each group is converted
+    with batched tokenization and S3Gen inference.
+
+    Args:
+        input_audios: List of input audio file paths
+        target_voice_names: List of target voice names, one per input (a
+            single name is applied to every input)
+        batch_size: Number of inputs converted per model pass
+
+    Yields:
+        Tuple of (overall_progress, audio_outputs_list, status_message)
+    """
+    try:
+        start_time = time.time()
+
+        if isinstance(target_voice_names, str):
+            target_voice_names = [target_voice_names] * len(input_audios)
+        jobs = [(i, audio, name) for i, (audio, name) in enumerate(zip(input_audios, target_voice_names)) if audio]
+        if not jobs:
+            yield 0, [], "❌ Error: No input audio provided."
+            return
+
+        total_items = len(jobs)
+        audio_outputs = [None] * len(input_audios)
+        timings = {}
+        errors = {}
+
+        # Group by target voice
+        groups = {}
+        for i, audio, name in jobs:
+            try:
+                target_voice_path = resolve_vc_target(name)
+            except KeyError:
+                errors[i] = f"Target voice '{name}' not found"
+                continue
+            groups.setdefault(target_voice_path, []).append((i, audio))
+
+        yield 5, audio_outputs, f"📦 Converting {total_items} files to {len(groups)} target voice(s)..."
+
+        yield 10, audio_outputs, "Loading Voice Conversion model..."
+        model = model_manager.get_vc_model()
+        if model is None:
+            yield 0, [], "❌ Error: Failed to load VC model."
+            return
+
+        done = len(errors)
+        for target_voice_path, items in groups.items():
+            target_label = os.path.basename(target_voice_path) if target_voice_path else "default voice"
+            yield int(10 + (done / total_items) * 85), audio_outputs, f"🔄 Converting {len(items)} file(s) to {target_label}..."
+            try:
+                voice_library.apply("vc", model, target_voice_path)
+                with voice_library.foreground():
+                    wavs, secs = model.generate_batch([audio for _, audio in items], batch_size=batch_size, return_timings=True)
+                for (i, _), wav, sec in zip(items, wavs, secs):
+                    audio_outputs[i] = (model.sr, wav.squeeze(0).numpy())
+                    timings[i] = sec
+            except Exception as e:
+                for i, _ in items:
+                    errors[i] = str(e)
+            done += len(items)
+
+        # Calculate total time
+        total_time = time.time() - start_time
+        successful = len(timings)
+
+        final_status = f"✅ Batch conversion complete!\n"
+        final_status += f"Total items: {total_items}\n"
+        final_status += f"Successful: {successful}\n"
+        final_status += f"Failed: {total_items - successful}\n"
+        final_status += f"Total time: {format_time(total_time)}\n"
+        final_status += f"Average time per item: {format_time(total_time / total_items)}\n"
+        for i, audio, _ in jobs:
+            if i in timings:
+                final_status += f"\n• {os.path.basename(audio)}: {format_time(timings[i])}"
+            else:
+                final_status += f"\n• {os.path.basename(audio)}: ❌ {errors.get(i, 'failed')}"
+
+        yield 100, audio_outputs, final_status
+
+    except Exception as e:
+        error_status = f"❌ Error in batch conversion: {str(e)}"
+        yield 0, [], error_status
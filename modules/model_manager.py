@@ -1,12 +1,36 @@
 """
 Model management for Chatterbox TTS Enhanced
 """
-import torch
-from .config import DEVICE
-from chatterbox.tts import ChatterboxTTS
-from chatterbox.vc import ChatterboxVC
-from chatterbox.mtl_tts import ChatterboxMultilingualTTS
-from chatterbox.tts_turbo import ChatterboxTurboTTS
+import threading
+from contextlib import contextmanager
+
+from .config import get_device
+from .voice_library import voice_library
+from .voice_manager import VOICES
+
+# NOTE: the model classes are imported inside the getters below. Each pipeline
+# pulls in its own heavy stack (transformers, pkuseg, perth...), and a process
+# that only ever serves one of them shouldn't pay for the others.
+
+
+# A file each model's from_pretrained downloads: if it is in the HuggingFace
+# cache, the model can be loaded without a download
+CHECKPOINTS = {
+    "tts": ("ResembleAI/chatterbox", "t3_cfg.safetensors"),
+    "mtl": ("ResembleAI/chatterbox", "t3_mtl23ls_v2.safetensors"),
+    "vc": ("ResembleAI/chatterbox", "s3gen.safetensors"),
+    "turbo": ("ResembleAI/chatterbox-turbo", "t3_turbo_v1.safetensors"),
+}
+
+
+def installed_models():
+    """Model types whose checkpoints are already downloaded."""
+    from huggingface_hub import try_to_load_from_cache
+
+    return [
+        model_type for model_type, (repo_id, filename) in CHECKPOINTS.items()
+        if isinstance(try_to_load_from_cache(repo_id, filename), str)
+    ]
 
 
 class ModelManager:
@@ -18,9 +42,13 @@ class ModelManager:
         self.vc_model = None
         self.turbo_model = None
         self.current_model_type = None
+        # Guards model switches, and lets callers hold a model for a whole job
+        # so nobody unloads it underneath them
+        self.lock = threading.RLock()
 
     def unload_all(self):
         """Unload all models to free up memory."""
+        voice_library.detach()
         if self.tts_model is not None:
             del self.tts_model
             self.tts_model = None
@@ -34,22 +62,29 @@ class ModelManager:
             del self.turbo_model
             self.turbo_model = None
         
-        if DEVICE == "cuda":
-            torch.cuda.empty_cache()
+        if get_device() == "cuda":
             import gc
+            import torch
+            torch.cuda.empty_cache()
             gc.collect()
         self.current_model_type = None
         print("🧹 Memory cleared: All models unloaded")
 
     def get_tts_model(self):
         """Load TTS model and unload others if needed."""
+        with self.lock:
+            return self._get_tts_model()
+
+    def _get_tts_model(self):
         if self.current_model_type != "tts":
             print("🔄 Switching to TTS model...")
             self.unload_all()
             try:
-                self.tts_model = ChatterboxTTS.from_pretrained(DEVICE)
+                from chatterbox.tts import ChatterboxTTS
+                self.tts_model = ChatterboxTTS.from_pretrained(get_device())
                 self.current_model_type = "tts"
                 print("✅ TTS model loaded")
+                voice_library.attach("tts", self.tts_model, VOICES["samples"].values())
             except Exception as e:
                 print(f"❌ Error loading TTS model: {e}")
                 return None
@@ -57,13 +92,19 @@ class ModelManager:
 
     def get_mtl_model(self):
         """Load Multilingual model and unload others if needed."""
+        with self.lock:
+            return self._get_mtl_model()
+
+    def _get_mtl_model(self):
         if self.current_model_type != "mtl":
             print("🔄 Switching to Multilingual model...")
             self.unload_all()
             try:
-                self.mtl_model = ChatterboxMultilingualTTS.from_pretrained(DEVICE)
+                from chatterbox.mtl_tts import ChatterboxMultilingualTTS
+                self.mtl_model = ChatterboxMultilingualTTS.from_pretrained(get_device())
                 self.current_model_type = "mtl"
                 print("✅ Multilingual model loaded")
+                voice_library.attach("mtl", self.mtl_model, VOICES["samples"].values())
             except Exception as e:
                 print(f"❌ Error loading Multilingual model: {e}")
                 return None
@@ -71,13 +112,19 @@ class ModelManager:
 
     def get_vc_model(self):
         """Load VC model and unload others if needed."""
+        with self.lock:
+            return self._get_vc_model()
+
+    def _get_vc_model(self):
         if self.current_model_type != "vc":
             print("🔄 Switching to VC model...")
             self.unload_all()
             try:
-                self.vc_model = ChatterboxVC.from_pretrained(DEVICE)
+                from chatterbox.vc import ChatterboxVC
+                self.vc_model = ChatterboxVC.from_pretrained(get_device())
                 self.current_model_type = "vc"
                 print("✅ VC model loaded")
+                voice_library.attach("vc", self.vc_model, VOICES["samples"].values())
             except Exception as e:
                 print(f"❌ Error loading VC model: {e}")
                 return None
@@ -85,21 +132,49 @@ class ModelManager:
 
     def get_turbo_model(self):
         """Load Turbo model and unload others if needed."""
+        with self.lock:
+            return self._get_turbo_model()
+
+    def _get_turbo_model(self):
         if self.current_model_type != "turbo":
             print("🔄 Switching to Turbo model...")
             self.unload_all()
             try:
-                self.turbo_model = ChatterboxTurboTTS.from_pretrained(device=DEVICE)
+                from chatterbox.tts_turbo import ChatterboxTurboTTS
+                self.turbo_model = ChatterboxTurboTTS.from_pretrained(device=get_device())
                 self.current_model_type = "turbo"
                 print("✅ Turbo model loaded")
+                voice_library.attach("turbo", self.turbo_model, VOICES["samples"].values())
             except Exception as e:
                 print(f"❌ Error loading Turbo model: {e}")
                 return None
         return self.turbo_model
 
+    def get_model(self, model_type):
+        """Load the model for `model_type` ("tts", "mtl", "vc" or "turbo")."""
+        return getattr(self, f"get_{model_type}_model")()
+
+    @contextmanager
+    def use(self, model_type):
+        """
+        Hold the model for `model_type` for the duration of the block; other
+        threads that need a different model wait instead of unloading it.
+
+        The hold is exclusive, even for callers wanting the same model: a
+        pipeline's `conds` and its cached voice state are swapped per call,
+        so two generations can't safely share one instance.
+        """
+        with self.lock:
+            model = self.get_model(model_type)
+            if model is None:
+                raise RuntimeError(f"Failed to load {model_type} model")
+            with voice_library.foreground():
+                yield model
+
 
 # Global model manager instance
 model_manager = ModelManager()
+voice_library.use_models(model_manager.use, installed_models)
 
 
 # Deprecated load functions (kept for compatibility but redirected)
@@ -0,0 +1,189 @@
+"""
+Synthesis result cache for Chatterbox TTS Enhanced
+
+Repeated prompts (IVR menus, UI strings, re-rendered documents) produce the
+same audio when the text, voice, model, sampling parameters and seed are the
+same. Results are cached per chunk under a hash of exactly those inputs:
+
+- memory tier: float32 waveforms in an LRU bounded by bytes
+- disk tier: FLAC files under RESULT_CACHE_DIR, evicted least-recently-used
+  once the directory grows past RESULT_CACHE_MAX_BYTES
+
+Entries are stored at 16-bit precision in both tiers, so a hit returns the
+same samples whichever tier answers it. Callers get their own copy.
+
+Only seeded generations are cached; with seed 0 every run is meant to differ.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MEMORY_BYTES
+from .voice_library import voice_library
+
+
+def _normalize_text(variant, text):
+    # Same normalization the model applies, so trivially different inputs share entries
+    if variant == "mtl":
+        from chatterbox.mtl_tts import punc_norm
+    elif variant == "turbo":
+        from chatterbox.tts_turbo import punc_norm
+    else:
+        from chatterbox.tts import punc_norm
+    return punc_norm(text)
+
+
+PCM16_SCALE = 32767.0  # used both ways, so a stored chunk keeps its level
+
+
+def _to_pcm16(wav):
+    import numpy as np
+    return np.rint(np.clip(wav, -1.0, 1.0) * PCM16_SCALE).astype(np.int16)
+
+
+def _from_pcm16(pcm):
+    import numpy as np
+    return pcm.astype(np.float32) / np.float32(PCM16_SCALE)
+
+
+class ResultCache:
+    """Two-tier (memory + FLAC on disk) cache of generated audio chunks."""
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_disk_bytes=RESULT_CACHE_MAX_BYTES,
+                 max_memory_bytes=RESULT_CACHE_MEMORY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (sr, wav)
+        self._memory_bytes = 0
+        self._disk = None  # key -> size, in LRU order; scanned lazily
+        self._disk_bytes = 0
+
+    # ------------------------------------------------------------------ keys
+    def key(self, variant, text, voice_path, params, seed, language_id=None, max_new_tokens=None):
+        """
+        Cache key for one chunk, or None if the result must not be cached
+        (unseeded generation). `max_new_tokens` is None for the pipeline's
+        adaptive cap; results that ran into it should not be stored.
+        """
+        if not seed:
+            return None
+        if voice_path is None:
+            voice = "builtin"
+        elif os.path.isfile(voice_path):
+            voice = voice_library.content_hash(voice_path)
+        else:
+            voice = str(voice_path)
+        payload = json.dumps({
+            "text": _normalize_text(variant, text),
+            "voice": voice,
+            "variant": variant,
+            "language": language_id,
+            "params": {k: float(v) for k, v in sorted(params.items())},
+            "max_new_tokens": max_new_tokens,
+            "seed": int(seed),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ disk
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.flac")
+
+    def _scan_disk(self):
+        """Build the disk index (oldest first) on first use."""
+        if self._disk is not None:
+            return
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".flac"):
+                        st = os.stat(os.path.join(root, name))
+                        entries.append((st.st_mtime, name[:-5], st.st_size))
+        entries.sort()
+        self._disk = OrderedDict((key, size) for _, key, size in entries)
+        self._disk_bytes = sum(self._disk.values())
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # ---------------------------------------------------------------- memory
+    def _remember(self, key, sr, wav):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = (sr, wav)
+        self._memory_bytes += wav.nbytes
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, (_, old) = self._memory.popitem(last=False)
+            self._memory_bytes -= old.nbytes
+
+    # ------------------------------------------------------------------- api
+    def get(self, key):
+        """Return (sample_rate, float32 waveform) for `key`, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                self._memory.move_to_end(key)
+                return hit[0], hit[1].copy()
+            self._scan_disk()
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+
+        import soundfile as sf
+        path = self._path(key)
+        try:
+            pcm, sr = sf.read(path, dtype="int16")
+            wav = _from_pcm16(pcm)
+            os.utime(path)
+        except (OSError, RuntimeError):
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            self._remember(key, sr, wav.copy())
+        return sr, wav
+
+    def put(self, key, sr, wav):
+        """Store a mono waveform (numpy array or tensor) under `key`."""
+        if key is None:
+            return
+        import numpy as np
+        import soundfile as sf
+
+        if hasattr(wav, "detach"):
+            wav = wav.detach().cpu().numpy()
+        pcm = _to_pcm16(np.asarray(wav, dtype=np.float32).reshape(-1))
+        # Exactly what a disk hit decodes to, in a new array, so nothing the
+        # caller does to its audio reaches the cache
+        wav = _from_pcm16(pcm)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        sf.write(tmp, pcm, sr, format="FLAC", subtype="PCM_16")
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._remember(key, sr, wav)
+            self._scan_disk()
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._evict_disk()
+
+
+# Global result cache instance
+result_cache = ResultCache()
@@ -0,0 +1,490 @@
+"""
+HTTP/WebSocket serving layer for Chatterbox TTS Enhanced
+
+A standalone asyncio app (FastAPI) that owns the model instances through
+`model_manager`, independent of the Gradio UI:
+
+- every request becomes a job on a bounded per-model queue; when the
+  server is full, new requests get 429 instead of piling up
+- each job carries a time estimate from `eta_model` (calibrated on this
+  machine's own generations); a request whose `timeout` cannot be met
+  behind the queued work gets 503 up front, and with
+  SERVER_MAX_BACKLOG_SECONDS set, so does one arriving at a long backlog
+  (429, with a Retry-After from the backlog). GET /v1/jobs/{id} reports
+  a job's state, current model step and time left
+- each model type has its own worker(s); a worker holds the model for a
+  whole job (`model_manager.use`), so jobs never switch models under each
+  other. That hold is exclusive: a loaded pipeline keeps per-call state
+  (the voice's conditionals), so jobs run one at a time across the whole
+  server, and jobs that alternate model types reload the model each time
+- audio is streamed back chunk by chunk, encoded as it arrives
+  (`format`: wav, pcm, flac, opus or mp3 over HTTP; raw PCM frames, or
+  encoded pages for the compressed formats, over WebSocket). FLAC is the
+  exception: it is sent whole once the job is done, as a complete file
+- a job can be cancelled explicitly (DELETE /v1/jobs/{id}), is cancelled
+  when its client disconnects, and can carry a deadline (`timeout`); the
+  job's `CancellationToken` is checked at every T3/CFM step, so abandoned
+  work stops within one step instead of at the next chunk
+- cancellation counts and per-stage generate() timings are exported at
+  GET /metrics (Prometheus text format)
+
+Run with `python server.py` from the project root.
+"""
+import asyncio
+import itertools
+import math
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from chatterbox.models.utils import CancellationToken, GenerationCancelled, cancellation_counts
+from chatterbox.profiling import PrometheusSink, add_sink, progress_callback
+
+from .audio_output import SAMPLE_RATE, ChunkEncoder, as_numpy, available_formats
+from .config import LANGUAGE_CONFIG, SERVER_MAX_BACKLOG_SECONDS, SERVER_MAX_QUEUE, SERVER_WORKERS_PER_MODEL
+from .eta import eta_model
+from .generation_functions import iter_speech, resolve_vc_target
+from .model_manager import model_manager
+from .voice_manager import load_voices, resolve_voice_path
+
+MODEL_TYPES = ("tts", "mtl", "turbo", "vc")
+
+
+class Overloaded(Exception):
+    """Raised when a job can't be admitted; carries the HTTP status and Retry-After."""
+
+    def __init__(self, message, status=429, retry_after=1.0):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Job:
+    """One request: its work function, cancellation token and output stream."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, model_type, work, loop, timeout=None, estimate=0.0):
+        self.id = f"job-{next(self._ids)}"
+        self.model_type = model_type
+        self.work = work  # (model, job) -> iterator of float32 numpy chunks
+        self.token = CancellationToken(timeout=timeout)
+        self.output = asyncio.Queue()
+        self.loop = loop
+        self.state = "queued"
+        self.created = time.time()
+        self.estimate = estimate  # expected seconds of work
+        self.started = None
+        self.step = (None, 0, 0)  # (phase, done, total) of the model loop in progress
+
+    def cancel(self):
+        self.token.cancel()
+
+    def on_progress(self, phase, done, total):
+        # Progress callback, called from the worker thread
+        self.step = (phase, done, total)
+
+    def remaining(self):
+        """Expected seconds of work left."""
+        if self.started is None:
+            return self.estimate
+        return max(self.estimate - (time.monotonic() - self.started), 0.0)
+
+    def emit(self, item):
+        # Called from the worker thread
+        self.loop.call_soon_threadsafe(self.output.put_nowait, item)
+
+    async def chunks(self):
+        """Yield the job's audio chunks; re-raises the job's error, if any."""
+        while True:
+            item = await self.output.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class JobScheduler:
+    """Bounded per-model job queues served by per-model worker tasks."""
+
+    def __init__(self, max_queue=SERVER_MAX_QUEUE, workers_per_model=SERVER_WORKERS_PER_MODEL,
+                 max_backlog=SERVER_MAX_BACKLOG_SECONDS):
+        self.max_queue = max_queue
+        self.max_backlog = max_backlog
+        self.workers_per_model = workers_per_model
+        self.jobs = {}
+        self.queues = {}
+        self.tasks = []
+        self.executor = None
+        self.finished = Counter()  # final job state -> count
+
+    @property
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if job.state in ("queued", "running"))
+
+    @property
+    def backlog(self):
+        """
+        Expected seconds until the work already admitted is done. Jobs share
+        one device, so their estimates add up even across model types.
+        """
+        return sum(job.remaining() for job in self.jobs.values() if job.state in ("queued", "running"))
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(MODEL_TYPES) * self.workers_per_model, thread_name_prefix="chatterbox-job",
+        )
+        for model_type in MODEL_TYPES:
+            self.queues[model_type] = asyncio.Queue()
+            for _ in range(self.workers_per_model):
+                self.tasks.append(asyncio.create_task(self._worker(model_type)))
+
+    async def stop(self):
+        for job in self.jobs.values():
+            job.cancel()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, model_type, work, timeout=None, estimate=0.0):
+        """
+        Queue a job expected to take `estimate` seconds, or raise `Overloaded`
+        if the server is at capacity or the job would miss its `timeout`.
+        """
+        if self.pending >= self.max_queue:
+            raise Overloaded("Server is busy, retry later")
+        backlog = self.backlog
+        if self.max_backlog is not None and backlog > self.max_backlog:
+            raise Overloaded(
+                f"Server is busy (~{backlog:.0f}s of work queued), retry later",
+                retry_after=backlog - self.max_backlog,
+            )
+        if timeout is not None and backlog + estimate > timeout:
+            raise Overloaded(
+                f"Job would take ~{backlog + estimate:.0f}s with the current queue, beyond its {timeout:g}s timeout",
+                status=503, retry_after=backlog + estimate - timeout,
+            )
+        job = Job(model_type, work, asyncio.get_running_loop(), timeout=timeout, estimate=estimate)
+        self.jobs[job.id] = job
+        self.queues[model_type].put_nowait(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    async def _worker(self, model_type):
+        queue = self.queues[model_type]
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await queue.get()
+            try:
+                if job.token.cancelled:
+                    job.state = "cancelled"
+                    job.emit(None)
+                    continue
+                job.state = "running"
+                job.started = time.monotonic()
+                await loop.run_in_executor(self.executor, self._run, job)
+            finally:
+                self.finished[job.state] += 1
+                self.jobs.pop(job.id, None)
+
+    @staticmethod
+    def _run(job):
+        try:
+            with model_manager.use(job.model_type) as model, progress_callback(job.on_progress):
+                for wav in job.work(model, job):
+                    if job.token.cancelled:
+                        break
+                    job.emit(wav)
+            job.state = "cancelled" if job.token.cancelled else "done"
+            job.emit(None)
+        except GenerationCancelled:
+            job.state = "cancelled"
+            job.emit(None)
+        except Exception as e:
+            job.state = "failed"
+            job.emit(e)
+
+
+# ---------------------------------------------------------------------------
+# Request handling
+# ---------------------------------------------------------------------------
+class TTSRequest(BaseModel):
+    text: str
+    model: str = "turbo"
+    voice: Optional[str] = None
+    language: str = "en"
+    exaggeration: float = 0.5
+    temperature: float = 0.8
+    cfg_weight: float = 0.5
+    seed: int = 0
+    stream: bool = True
+    format: str = "wav"  # see audio_output.FORMATS
+    timeout: Optional[float] = None  # seconds, including time spent queued
+
+
+def _tts_work(req: TTSRequest):
+    """Build the job body for a TTS request, validating it up front."""
+    if req.model not in ("tts", "mtl", "turbo"):
+        raise HTTPException(400, f"Unknown model '{req.model}'")
+    if not req.text.strip():
+        raise HTTPException(400, "Text cannot be empty")
+
+    language = req.language if req.model == "mtl" else "en"
+    if req.voice:
+        voice_path = resolve_voice_path(req.voice, language)
+        if not voice_path:
+            raise HTTPException(404, f"Voice '{req.voice}' not found")
+    elif req.model == "mtl":
+        voice_path = LANGUAGE_CONFIG.get(language, {}).get("audio")
+    elif req.model == "turbo":
+        raise HTTPException(400, "Turbo requires a voice")
+    else:
+        voice_path = None
+
+    if req.model == "turbo":
+        params = {}  # Turbo ignores CFG/exaggeration
+    else:
+        params = dict(exaggeration=req.exaggeration, temperature=req.temperature, cfg_weight=req.cfg_weight)
+
+    def work(model, job):
+        for _, wav, _ in iter_speech(
+            req.model, model, req.text, voice_path, params, req.seed,
+            language_id=language if req.model == "mtl" else None, cancel=job.token,
+        ):
+            yield as_numpy(wav)
+    return work
+
+
+def _tts_estimate(req: TTSRequest):
+    language = req.language if req.model == "mtl" else None
+    return eta_model.estimate_text(req.model, req.text, language_id=language)
+
+
+def _vc_work(input_path, target_voice_path):
+    def work(model, job):
+        from .voice_library import voice_library
+        try:
+            voice_library.apply("vc", model, target_voice_path)
+            for wav in model.generate_stream(input_path, cancel=job.token):
+                yield as_numpy(wav)
+        finally:
+            os.remove(input_path)
+    return work
+
+
+def _submit(model_type, work, timeout=None, estimate=0.0):
+    try:
+        return scheduler.submit(model_type, work, timeout=timeout, estimate=estimate)
+    except Overloaded as e:
+        retry_after = str(max(1, math.ceil(e.retry_after)))
+        raise HTTPException(e.status, e.message, headers={"Retry-After": retry_after})
+
+
+def _encoder(fmt):
+    try:
+        return ChunkEncoder(fmt, SAMPLE_RATE)
+    except ValueError as e:
+        raise HTTPException(400, f"{e}; available: {', '.join(available_formats())}")
+
+
+async def _respond(job, stream, encoder):
+    headers = {"X-Job-Id": job.id}
+    if stream:
+        async def body():
+            try:
+                # Encode off the event loop, chunk by chunk as the job produces them
+                async for wav in job.chunks():
+                    data = await asyncio.to_thread(encoder.encode, wav)
+                    if data:
+                        yield data
+                yield await asyncio.to_thread(encoder.finish)
+            finally:
+                # Client went away (or we finished): stop any remaining work
+                job.cancel()
+        return StreamingResponse(body(), media_type=encoder.media_type, headers=headers)
+
+    try:
+        wavs = [wav async for wav in job.chunks()]
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+    if job.token.cancelled:
+        if job.token.reason == "deadline":
+            raise HTTPException(504, "Job deadline exceeded")
+        raise HTTPException(409, "Job cancelled")
+    audio = np.concatenate(wavs) if wavs else np.zeros(0, dtype=np.float32)
+    data = await asyncio.to_thread(encoder.encode_all, audio)
+    return Response(data, media_type=encoder.media_type, headers=headers)
+
+
+scheduler = JobScheduler()
+stage_metrics = add_sink(PrometheusSink())
+
+
+@asynccontextmanager
+async def lifespan(app):
+    load_voices()
+    scheduler.start()
+    yield
+    await scheduler.stop()
+
+
+app = FastAPI(title="Chatterbox TTS Enhanced", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "pending": scheduler.pending,
+        "max_queue": scheduler.max_queue,
+        "backlog_s": round(scheduler.backlog, 1),
+        "current_model": model_manager.current_model_type,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    lines = [
+        "# HELP chatterbox_generations_cancelled_total Generations abandoned mid-loop, by reason.",
+        "# TYPE chatterbox_generations_cancelled_total counter",
+    ]
+    for reason, n in sorted(cancellation_counts().items()):
+        lines.append(f'chatterbox_generations_cancelled_total{{reason="{reason}"}} {n}')
+    lines += [
+        "# HELP chatterbox_jobs_total Finished jobs, by final state.",
+        "# TYPE chatterbox_jobs_total counter",
+    ]
+    for state, n in sorted(scheduler.finished.items()):
+        lines.append(f'chatterbox_jobs_total{{state="{state}"}} {n}')
+    lines += [
+        "# HELP chatterbox_jobs_pending Jobs queued or running.",
+        "# TYPE chatterbox_jobs_pending gauge",
+        f"chatterbox_jobs_pending {scheduler.pending}",
+        "# HELP chatterbox_backlog_seconds Estimated seconds of queued and running work.",
+        "# TYPE chatterbox_backlog_seconds gauge",
+        f"chatterbox_backlog_seconds {scheduler.backlog:.3f}",
+    ]
+    return "\n".join(lines) + "\n" + stage_metrics.render()
+
+
+@app.post("/v1/tts")
+async def tts(req: TTSRequest):
+    encoder = _encoder(req.format)
+    job = _submit(req.model, _tts_work(req), req.timeout, _tts_estimate(req))
+    return await _respond(job, req.stream, encoder)
+
+
+@app.post("/v1/vc")
+async def vc(
+    audio: UploadFile = File(...),
+    target_voice: str = Form("None"),
+    stream: bool = Form(True),
+    format: str = Form("wav"),
+    timeout: Optional[float] = Form(None),
+):
+    encoder = _encoder(format)
+    try:
+        target_voice_path = resolve_vc_target(target_voice)
+    except KeyError:
+        raise HTTPException(404, f"Target voice '{target_voice}' not found")
+
+    suffix = os.path.splitext(audio.filename or "")[1] or ".wav"
+    fd, input_path = tempfile.mkstemp(suffix=suffix, prefix="chatterbox_vc_")
+    with os.fdopen(fd, "wb") as f:
+        f.write(await audio.read())
+
+    import librosa
+    try:
+        estimate = eta_model.estimate_vc(librosa.get_duration(path=input_path))
+    except Exception:
+        estimate = eta_model.estimate_vc(0.0)  # unreadable audio fails in the job itself
+    try:
+        job = _submit("vc", _vc_work(input_path, target_voice_path), timeout, estimate)
+    except HTTPException:
+        os.remove(input_path)
+        raise
+    return await _respond(job, stream, encoder)
+
+
+@app.get("/v1/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = scheduler.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown job '{job_id}'")
+    phase, done, total = job.step
+    return {
+        "job_id": job.id,
+        "model": job.model_type,
+        "state": job.state,
+        "estimate_s": round(job.estimate, 1),
+        "remaining_s": round(job.remaining(), 1),
+        "step": {"phase": phase, "done": done, "total": total},
+    }
+
+
+@app.delete("/v1/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not scheduler.cancel(job_id):
+        raise HTTPException(404, f"Unknown job '{job_id}'")
+    return {"job_id": job_id, "cancelled": True}
+
+
+@app.websocket("/v1/tts/ws")
+async def tts_ws(ws: WebSocket):
+    """
+    Send one JSON `TTSRequest`; receive `{"job_id"}`, then binary frames at
+    24 kHz, then `{"event": "done"}` (or `{"error"}`). Frames are raw 16-bit
+    PCM for `format` "wav" or "pcm", otherwise consecutive pieces of one
+    encoded stream (e.g. Ogg/Opus pages).
+    """
+    await ws.accept()
+    job = None
+    try:
+        req = TTSRequest(**await ws.receive_json())
+        try:
+            encoder = _encoder("pcm" if req.format == "wav" else req.format)
+            job = _submit(req.model, _tts_work(req), req.timeout, _tts_estimate(req))
+        except HTTPException as e:
+            await ws.send_json({"error": e.detail, "status": e.status_code})
+            return
+        await ws.send_json({"job_id": job.id, "sample_rate": SAMPLE_RATE, "format": encoder.format})
+        async for wav in job.chunks():
+            data = await asyncio.to_thread(encoder.encode, wav)
+            if data:
+                await ws.send_bytes(data)
+        data = await asyncio.to_thread(encoder.finish)
+        if data:
+            await ws.send_bytes(data)
+        await ws.send_json({"event": "cancelled" if job.token.cancelled else "done"})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        await ws.send_json({"error": str(e), "status": 500})
+    finally:
+        if job is not None:
+            job.cancel()
+        try:
+            await ws.close()
+        except RuntimeError:
+            pass
@@ -0,0 +1,134 @@
+"""
+Long-form audio stitching for Chatterbox TTS Enhanced
+
+Chunks used to be collected in a list and `torch.cat`-ed at the end, which
+holds every chunk twice at the peak and leaves hard seams and uneven pauses
+(Turbo pads each chunk with silence tokens). `ChunkStitcher` instead:
+
+- trims each chunk's leading and trailing silence with a frame energy
+  detector, keeping `pad_ms` of the original audio around the speech so
+  every join gets the same natural pause
+- joins chunks with a short equal-power (sin/cos) crossfade
+- writes straight into one preallocated buffer that grows geometrically,
+  sized up front from the expected audio length, or, given a `path`,
+  appends to a WAV/FLAC file on disk so audiobook-length output never has
+  to fit in RAM
+
+Only the last `crossfade_ms` of audio is held back, waiting for the next chunk.
+"""
+import math
+import os
+
+import numpy as np
+
+from .audio_output import as_numpy
+from .config import STITCH_CROSSFADE_MS, STITCH_PAD_MS, STITCH_SILENCE_DB
+
+
+def speech_bounds(wav, sample_rate, threshold_db=STITCH_SILENCE_DB, frame_ms=10):
+    """
+    (start, end) sample offsets of the speech in `wav`: the first and last
+    frames whose RMS is within `threshold_db` of the loudest frame. A chunk
+    with no frame above -60 dBFS is all silence and returns (0, 0).
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(wav) // frame
+    if n_frames == 0:
+        return 0, len(wav)
+    frames = wav[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.einsum("ij,ij->i", frames, frames) / frame
+    peak = energy.max()
+    if peak < 1e-6:  # -60 dBFS
+        return 0, 0
+    loud = np.flatnonzero(energy >= peak * 10 ** (threshold_db / 10))
+    end = len(wav) if loud[-1] == n_frames - 1 else (loud[-1] + 1) * frame
+    return loud[0] * frame, end
+
+
+class ChunkStitcher:
+    """Joins speech chunks into one waveform in memory or on disk."""
+
+    def __init__(self, sample_rate, expected_seconds=60.0, path=None, trim=True,
+                 pad_ms=STITCH_PAD_MS, crossfade_ms=STITCH_CROSSFADE_MS, threshold_db=STITCH_SILENCE_DB):
+        """
+        :param expected_seconds: initial buffer size; the buffer doubles when
+            it runs out, so a good guess means no reallocation at all.
+        :param path: write to this .wav/.flac file instead of memory.
+        :param trim: trim silence around each chunk; turn off for chunks that
+            are consecutive pieces of one signal (voice conversion blocks).
+        """
+        self.sr = sample_rate
+        self.trim = trim
+        self.pad = int(sample_rate * pad_ms / 1000)
+        self.crossfade = int(sample_rate * crossfade_ms / 1000)
+        self.threshold_db = threshold_db
+        self.path = path
+        self.n_chunks = 0
+        self.length = 0  # samples committed to the buffer or file
+        self._tail = np.zeros(0, dtype=np.float32)  # held back for the next crossfade
+        self._file = None
+        self._buffer = None
+        if path is None:
+            self._buffer = np.empty(max(int(expected_seconds * sample_rate), 1), dtype=np.float32)
+        else:
+            import soundfile as sf
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = sf.SoundFile(path, "w", samplerate=sample_rate, channels=1, subtype="PCM_16")
+
+    @property
+    def duration(self):
+        """Seconds of audio stitched so far."""
+        return (self.length + len(self._tail)) / self.sr
+
+    def _commit(self, wav):
+        if not len(wav):
+            return
+        if self._file is not None:
+            self._file.write(wav)
+        else:
+            needed = self.length + len(wav)
+            if needed > len(self._buffer):
+                grown = np.empty(max(needed, 2 * len(self._buffer)), dtype=np.float32)
+                grown[:self.length] = self._buffer[:self.length]
+                self._buffer = grown
+            self._buffer[self.length:needed] = wav
+        self.length += len(wav)
+
+    def add(self, wav):
+        """Append one chunk (tensor or array, any shape with one channel)."""
+        wav = as_numpy(wav)
+        if self.trim:
+            start, end = speech_bounds(wav, self.sr, self.threshold_db)
+            if start == end:
+                return
+            wav = wav[max(start - self.pad, 0):min(end + self.pad, len(wav))]
+        if not len(wav):
+            return
+        self.n_chunks += 1
+
+        n = min(len(self._tail), len(wav), self.crossfade)
+        if n:
+            # Equal-power crossfade: cos^2 + sin^2 = 1 keeps the loudness constant
+            t = (np.arange(n, dtype=np.float32) + 0.5) * (math.pi / 2 / n)
+            self._commit(self._tail[:len(self._tail) - n])
+            self._commit(self._tail[len(self._tail) - n:] * np.cos(t) + wav[:n] * np.sin(t))
+            wav = wav[n:]
+        else:
+            self._commit(self._tail)
+
+        keep = min(self.crossfade, len(wav))
+        self._commit(wav[:len(wav) - keep])
+        self._tail = wav[len(wav) - keep:].copy()
+
+    def result(self):
+        """
+        The stitched waveform (float32, 1-D) as a view of the buffer; in
+        disk mode, closes the file and returns its path.
+        """
+        self._commit(self._tail)
+        self._tail = self._tail[:0]
+        if self._file is not None:
+            if not self._file.closed:
+                self._file.close()
+            return self.path
+        return self._buffer[:self.length]
@@ -0,0 +1,124 @@
+"""
+Token-budget text chunking for Chatterbox TTS Enhanced
+
+Long text is split at sentence boundaries and packed into chunks sized by
+the model's own tokenizer, so every chunk carries about the same amount of
+speech and none runs into the T3 generation cap. Chunks are produced lazily:
+synthesis of the first chunk can start while the rest of the document is
+still being scanned, and each sentence is tokenized exactly once.
+"""
+import re
+from collections import namedtuple
+
+from chatterbox.length_model import PRIOR_RATIOS
+
+from .config import CHUNK_SPEECH_TOKEN_BUDGET
+
+# Sentence boundaries: . ! ? (Western), 。！？ (CJK), । (Hindi), ؟ (Arabic), newlines
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。！？।؟])\s*|\n+')
+# Clause boundaries: , ; (Western), ，、； (CJK), ، (Arabic)
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;，、；،])\s*')
+CJK_CHAR = re.compile(r'[\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\uac00-\ud7af]')
+
+TextChunk = namedtuple("TextChunk", ["text", "start", "end", "n_tokens"])
+
+
+def token_counter(model, variant, language_id=None):
+    """Return `text -> token count` using the tokenizer `model` will actually run."""
+    if variant == "turbo":
+        return lambda text: len(model.tokenizer.encode(text, add_special_tokens=False))
+    if variant == "mtl":
+        from chatterbox.mtl_tts import punc_norm
+        lang = language_id.lower() if language_id else None
+        return lambda text: len(model.tokenizer.encode(punc_norm(text), language_id=lang))
+    from chatterbox.tts import punc_norm
+    return lambda text: len(model.tokenizer.encode(punc_norm(text)))
+
+
+def chunk_token_budget(model, variant, language_id=None, max_new_tokens=1000, speech_token_budget=None):
+    """
+    Text tokens per chunk for `model`: the speech budget (capped safely below
+    `max_new_tokens`) divided by the speech/text ratio its length model has
+    measured for this language, and never more than T3 accepts.
+    """
+    speech_budget = min(speech_token_budget or CHUNK_SPEECH_TOKEN_BUDGET, int(max_new_tokens * 0.9))
+    length_model = getattr(model, "length_model", None)
+    if length_model is not None:
+        ratio = length_model.expected_ratio(variant, language_id)
+    else:
+        ratio = PRIOR_RATIOS[variant]
+    budget = int(speech_budget / ratio)
+    hp = getattr(getattr(model, "t3", None), "hp", None)
+    max_text_tokens = getattr(hp, "max_text_tokens", 2048) - 2  # room for SOT/EOT
+    return max(1, min(budget, max_text_tokens))
+
+
+def _spans(text, pattern, start, end):
+    """Yield the non-empty (start, end) pieces of text[start:end] between matches of `pattern`."""
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        if m.start() > pos and text[pos:m.start()].strip():
+            yield pos, m.start()
+        pos = max(pos, m.end())
+    if pos < end and text[pos:end].strip():
+        yield pos, end
+
+
+def _word_spans(text, start, end):
+    """Fallback split for a clause that alone exceeds the budget: words, or characters for CJK."""
+    piece = text[start:end]
+    if CJK_CHAR.search(piece):
+        for i, ch in enumerate(piece):
+            if not ch.isspace():
+                yield start + i, start + i + 1
+    else:
+        for m in re.finditer(r'\S+', piece):
+            yield start + m.start(), start + m.end()
+
+
+def iter_text_chunks(text, count_tokens, max_tokens):
+    """
+    Lazily split `text` into chunks of at most ~`max_tokens` tokens.
+
+    Sentences are packed greedily; a sentence over budget is split at
+    clause punctuation, and a clause still over budget at words. Each piece
+    is tokenized once, so the whole pass is linear in the text length.
+
+    Yields `TextChunk(text, start, end, n_tokens)`, with offsets into `text`.
+    """
+    parts = []  # (start, end) of the pieces in the pending chunk
+    total = 0
+
+    def joined():
+        out = []
+        for s, e in parts:
+            piece = text[s:e].strip()
+            if out and not (CJK_CHAR.match(out[-1][-1]) or CJK_CHAR.match(piece[0])):
+                out.append(" ")
+            out.append(piece)
+        return "".join(out)
+
+    def pieces():
+        for s, e in _spans(text, SENTENCE_BOUNDARY, 0, len(text)):
+            n = count_tokens(text[s:e].strip())
+            if n <= max_tokens:
+                yield s, e, n
+                continue
+            for cs, ce in _spans(text, CLAUSE_BOUNDARY, s, e):
+                n = count_tokens(text[cs:ce].strip())
+                if n <= max_tokens:
+                    yield cs, ce, n
+                    continue
+                for ws, we in _word_spans(text, cs, ce):
+                    yield ws, we, count_tokens(text[ws:we])
+
+    for s, e, n in pieces():
+        # +1 for the separator token between pieces
+        if parts and total + 1 + n > max_tokens:
+            yield TextChunk(joined(), parts[0][0], parts[-1][1], total)
+            parts, total = [], 0
+        total += n + (1 if parts else 0)
+        parts.append((s, e))
+
+    if parts:
+        yield TextChunk(joined(), parts[0][0], parts[-1][1], total)
@@ -0,0 +1,383 @@
+"""
+Precomputed voice conditionals for Chatterbox TTS Enhanced
+
+Turning a reference clip into model conditionals (speaker embedding, prompt
+tokens, S3Gen reference mel/x-vector) takes seconds. The voice library does
+that work once per (model variant, voice), keeps the result in memory and
+persists it next to the voice samples, so picking a voice is a dictionary
+lookup instead of a full embedding pass.
+
+Entries are keyed by the clip's content hash. A file whose mtime/size still
+match the index is trusted without rehashing; anything else is rehashed and,
+if the content changed, recomputed.
+
+Building happens outside the library's lock, so a lookup never waits on
+another voice's build. Once a model has been loaded, a background worker
+indexes every voice for every installed model variant, so switching models
+keeps voice selection a lookup. It steps aside while a generation is running
+(`foreground()`) and builds under the model manager's exclusive hold, loading
+the variant if needed; conditionals already on disk need no model at all.
+"""
+import copy
+import hashlib
+import importlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from .config import VOICE_DIR
+
+CACHE_DIR = os.path.join(VOICE_DIR, ".conds_cache")
+
+# Bump when the pipelines change how conditionals are computed, so stale
+# files on disk are rebuilt instead of loaded
+CONDS_FORMAT = 2
+
+
+def _conditionals_cls(model):
+    # Each pipeline module ships its own `Conditionals` dataclass
+    return importlib.import_module(type(model).__module__).Conditionals
+
+
+def _load_conds(model, fpath):
+    return _conditionals_cls(model).load(fpath, map_location=model.device).to(model.device)
+
+
+def _save_ref_dict(ref_dict, fpath):
+    import torch
+    torch.save({"gen": {k: v.cpu() if torch.is_tensor(v) else v for k, v in ref_dict.items()}}, fpath)
+
+
+def _load_ref_dict(model, fpath):
+    import torch
+    gen = torch.load(fpath, map_location="cpu", weights_only=True)["gen"]
+    return {k: v.to(model.device) if torch.is_tensor(v) else v for k, v in gen.items()}
+
+
+# How each model variant builds, saves and restores its conditionals
+VARIANTS = {
+    "tts": {
+        "build": lambda model, path: model.build_conditionals(path),
+        "save": lambda conds, fpath: conds.save(fpath),
+        "load": _load_conds,
+        "attr": "conds",
+    },
+    "mtl": {
+        "build": lambda model, path: model.build_conditionals(path),
+        "save": lambda conds, fpath: conds.save(fpath),
+        "load": _load_conds,
+        "attr": "conds",
+    },
+    "turbo": {
+        "build": lambda model, path: model.build_conditionals(path, exaggeration=0.0),
+        "save": lambda conds, fpath: conds.save(fpath),
+        "load": _load_conds,
+        "attr": "conds",
+    },
+    "vc": {
+        "build": lambda model, path: model.build_ref_dict(path),
+        "save": _save_ref_dict,
+        "load": _load_ref_dict,
+        "attr": "ref_dict",
+    },
+}
+
+
+def _copy_conds(conds):
+    """
+    Copy that a pipeline may modify: `generate` sets the exaggeration on the
+    T3 conditionals and memoizes embeddings on them.
+    """
+    if hasattr(conds, "t3"):
+        return type(conds)(conds.t3.copy(), dict(conds.gen))
+    return copy.copy(conds)
+
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class VoiceLibrary:
+    """In-memory + on-disk cache of per-voice conditionals for the loaded model."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self._lock = threading.RLock()
+        self._idle = threading.Condition(self._lock)
+        self._memory = {}  # (variant, path) -> ((mtime_ns, size), conds)
+        self._building = {}  # (variant, path) -> ((mtime_ns, size), Future of conds)
+        self._foreground = 0  # generations running; background indexing waits for 0
+        self._index = self._read_index()  # path -> {"mtime_ns", "size", "sha1"}
+        self._defaults = {}  # variant -> the model's built-in conditionals
+        self._variant = None
+        self._model = None
+        self._pending = {}  # (path, variant) -> None, in scheduling order
+        self._failed = set()  # (variant, sha1) whose build failed, (variant, None) if it can't load
+        self._worker = None
+        self._hold = None  # variant -> context manager holding that model exclusively
+        self._installed = None  # () -> variants whose checkpoints are present
+
+    def use_models(self, hold, installed):
+        """
+        Let background indexing take models through `hold(variant)` (a
+        context manager yielding the loaded model, held exclusively) and
+        index for every variant `installed()` lists. Without this, only the
+        attached model is indexed.
+        """
+        self._hold = hold
+        self._installed = installed
+
+    # ------------------------------------------------------------------ index
+    def _read_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1)
+        os.replace(tmp, self.index_file)
+
+    def _content_hash(self, path, stat):
+        """Return the clip's sha1, rehashing only if mtime/size moved."""
+        entry = self._index.get(path)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["sha1"]
+        sha1 = _file_sha1(path)
+        self._index[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": sha1}
+        self._write_index()
+        return sha1
+
+    def content_hash(self, path):
+        """sha1 of the clip at `path`, served from the index while it is unchanged."""
+        path = os.path.abspath(path)
+        with self._lock:
+            return self._content_hash(path, os.stat(path))
+
+    def _cache_path(self, variant, sha1):
+        return os.path.join(self.cache_dir, variant, f"{sha1}.v{CONDS_FORMAT}.pt")
+
+    # ------------------------------------------------------------------ lookup
+    def get(self, variant, model, path):
+        """
+        Return the conditionals for `path` under `model`, computing them only
+        if neither memory nor disk has an up-to-date copy. Concurrent lookups
+        of the same voice share one build.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        fingerprint = (stat.st_mtime_ns, stat.st_size)
+        key = (variant, path)
+
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and hit[0] == fingerprint:
+                return hit[1]
+            in_flight = self._building.get(key)
+            if in_flight is None or in_flight[0] != fingerprint:
+                in_flight = None
+                building = (fingerprint, Future())
+                self._building[key] = building
+                sha1 = self._content_hash(path, stat)
+        if in_flight is not None:
+            return in_flight[1].result()
+
+        try:
+            conds = self._load_or_build(variant, model, path, sha1)
+        except BaseException as e:
+            with self._lock:
+                if self._building.get(key) is building:
+                    del self._building[key]
+            building[1].set_exception(e)
+            raise
+
+        with self._lock:
+            if self._building.get(key) is building:
+                del self._building[key]
+            # Unless the model was swapped out in the meantime
+            if self._model is None or self._model is model:
+                self._memory[key] = (fingerprint, conds)
+        building[1].set_result(conds)
+        return conds
+
+    def _load_or_build(self, variant, model, path, sha1):
+        import torch
+
+        spec = VARIANTS[variant]
+        fpath = self._cache_path(variant, sha1)
+        if os.path.exists(fpath):
+            try:
+                return spec["load"](model, fpath)
+            except Exception as e:
+                print(f"⚠️ Discarding unreadable conditionals cache {fpath}: {e}")
+
+        with torch.inference_mode():
+            conds = spec["build"](model, path)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp = f"{fpath}.{threading.get_ident()}.tmp"
+        spec["save"](conds, tmp)
+        os.replace(tmp, fpath)
+        return conds
+
+    def apply(self, variant, model, path):
+        """
+        Point `model` at the voice in `path`, or back at its built-in voice
+        when `path` is None, so `generate` can run without an audio prompt.
+        """
+        spec = VARIANTS[variant]
+        if path is None:
+            conds = self._defaults.get(variant)
+        elif os.path.isfile(path):
+            conds = self.get(variant, model, path)
+        else:
+            # Remote sample etc.; nothing stable to key a cache entry on
+            import torch
+            with torch.inference_mode():
+                conds = spec["build"](model, path)
+        setattr(model, spec["attr"], _copy_conds(conds))
+
+    def invalidate(self, path):
+        """Forget everything cached for `path` (e.g. after the voice is deleted)."""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._memory if k[1] == path]:
+                del self._memory[key]
+            entry = self._index.pop(path, None)
+            if entry is None:
+                return
+            self._write_index()
+            # Other voices may share the same content; only drop unreferenced files
+            if any(e["sha1"] == entry["sha1"] for e in self._index.values()):
+                return
+            for variant in VARIANTS:
+                fpath = self._cache_path(variant, entry["sha1"])
+                if os.path.exists(fpath):
+                    os.remove(fpath)
+
+    # -------------------------------------------------------------- background
+    @contextmanager
+    def foreground(self):
+        """Mark a generation as running; background indexing waits until none are."""
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._foreground -= 1
+                if not self._foreground:
+                    self._idle.notify_all()
+
+    def attach(self, variant, model, paths=()):
+        """Make `model` the active one and index `paths` in the background."""
+        with self._lock:
+            self._defaults[variant] = _copy_conds(getattr(model, VARIANTS[variant]["attr"]))
+            self._variant = variant
+            self._model = model
+            # Conditionals built for the previous model live on its device; drop them
+            self._memory = {k: v for k, v in self._memory.items() if k[0] == variant}
+        for path in paths:
+            self.schedule(path)
+
+    def detach(self):
+        """Forget the current model (called before it is unloaded)."""
+        with self._lock:
+            self._defaults.clear()
+            self._variant = None
+            self._model = None
+            self._memory.clear()
+
+    def _variants(self):
+        variants = []
+        if self._installed is not None:
+            try:
+                variants = [v for v in self._installed() if v in VARIANTS]
+            except Exception as e:
+                print(f"⚠️ Could not list installed models: {e}")
+        if self._variant not in variants:
+            variants.insert(0, self._variant)
+        return variants
+
+    def schedule(self, path):
+        """Queue `path` for background indexing under every installed variant, once a model is loaded."""
+        if self._variant is None:
+            return
+        path = os.path.abspath(path)
+        variants = self._variants()
+        with self._lock:
+            for variant in variants:
+                self._pending.setdefault((path, variant), None)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="voice-library", daemon=True)
+                self._worker.start()
+
+    def _next(self):
+        """
+        Next (path, variant) to index, or None (and the worker exits) when
+        there is none. The loaded variant's entries go first, so each
+        missing variant is loaded once.
+        """
+        with self._idle:
+            # Don't compete with a generation for the model
+            while self._foreground:
+                self._idle.wait()
+            if not self._pending:
+                self._worker = None
+                return None
+            key = next((k for k in self._pending if k[1] == self._variant), next(iter(self._pending)))
+            del self._pending[key]
+            return key
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            path, variant = item
+            if not os.path.exists(path):
+                continue
+            try:
+                self._index_voice(path, variant)
+            except Exception as e:
+                print(f"⚠️ Could not index voice {os.path.basename(path)} for {variant}: {e}")
+
+    def _index_voice(self, path, variant):
+        with self._lock:
+            sha1 = self._content_hash(path, os.stat(path))
+            if (variant, sha1) in self._failed or (variant, None) in self._failed:
+                return
+            # Another variant's conditionals only need building once; they are
+            # read back from disk when that model is loaded
+            if variant != self._variant and os.path.exists(self._cache_path(variant, sha1)):
+                return
+            model = self._model if variant == self._variant else None
+        if self._hold is None:
+            if model is not None:
+                self.get(variant, model, path)
+            return
+
+        building = False
+        try:
+            with self._hold(variant) as model:
+                building = True
+                self.get(variant, model, path)
+        except Exception:
+            with self._lock:
+                # The model can't be loaded: don't retry it for every voice
+                self._failed.add((variant, sha1 if building else None))
+            raise
+
+
+# Global voice library instance
+voice_library = VoiceLibrary()
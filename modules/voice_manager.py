@@ -5,8 +5,8 @@ import os
 import shutil
 import tempfile
 import urllib.request
-import gradio as gr
 from .config import VOICE_DIR, LANGUAGE_CONFIG, SUPPORTED_LANGUAGES
+from .voice_library import voice_library
 
 # Voice storage
 VOICES = {"samples": {}}
@@ -128,6 +128,8 @@ def get_all_voices_with_gender():
 
 def clone_voice(audio_file, new_voice_name, voice_language, voice_gender):
     """Clone a voice by saving the reference audio."""
+    import gradio as gr
+
     try:
         # Input validations
         if not new_voice_name or not new_voice_name.strip():
@@ -155,6 +157,7 @@ def clone_voice(audio_file, new_voice_name, voice_language, voice_gender):
         
         # Update voices dictionary
         VOICES["samples"][new_voice_name] = wav_path
+        voice_library.schedule(wav_path)
         updated_voices = list(VOICES["samples"].keys())
         
         # Format display name with gender symbol
@@ -168,6 +171,8 @@ def clone_voice(audio_file, new_voice_name, voice_language, voice_gender):
 
 def delete_voice(voice_name):
     """Delete a voice and its associated file."""
+    import gradio as gr
+
     try:
         if not voice_name or voice_name == "None":
             return "❌ Error: No voice selected.", gr.update()
@@ -195,6 +200,7 @@ def delete_voice(voice_name):
         wav_path = VOICES["samples"][actual_name]
         if os.path.exists(wav_path):
             os.remove(wav_path)
+        voice_library.invalidate(wav_path)
         
         # Remove from dictionary
         del VOICES["samples"][actual_name]
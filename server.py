@@ -0,0 +1,41 @@
+"""
+Chatterbox TTS Enhanced - API server
+
+Serves the models over HTTP/WebSocket without the Gradio UI:
+
+    python server.py --host 0.0.0.0 --port 8000
+
+    curl -X POST localhost:8000/v1/tts -H 'Content-Type: application/json' \
+         -d '{"text": "Hello there!", "model": "tts"}' -o out.wav
+"""
+import argparse
+import os
+import sys
+
+# Add src directory and project root to sys.path
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+src_path = os.path.join(project_root, "src")
+if src_path not in sys.path:
+    sys.path.append(src_path)
+
+from modules.config import get_device
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chatterbox TTS Enhanced API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    import uvicorn
+    from modules.server import app
+
+    get_device()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
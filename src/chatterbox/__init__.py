@@ -6,6 +6,25 @@ except ImportError:
 __version__ = version("chatterbox-tts")
 
 
-from .tts import ChatterboxTTS
-from .vc import ChatterboxVC
-from .mtl_tts import ChatterboxMultilingualTTS, SUPPORTED_LANGUAGES
\ No newline at end of file
+# Public names are resolved on first access so that importing one pipeline
+# (e.g. `chatterbox.vc`) doesn't drag in transformers, pkuseg etc. for the others.
+_LAZY_ATTRS = {
+    "ChatterboxTTS": ".tts",
+    "ChatterboxVC": ".vc",
+    "ChatterboxMultilingualTTS": ".mtl_tts",
+    "ChatterboxTurboTTS": ".tts_turbo",
+    "SUPPORTED_LANGUAGES": ".languages",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRS))
@@ -0,0 +1,196 @@
+"""
+Speech length model: how many speech tokens a chunk of text should produce.
+
+T3 decodes until it emits EOS or hits `max_new_tokens`, so a generation that
+never stops always pays for the full cap. This keeps per-(variant, language)
+running statistics of log(speech tokens / text tokens), calibrated from the
+generations the pipelines log, and turns them into a cap for each chunk.
+The cap never drops below the loose prior used until enough runs have been
+seen, only grows past it for languages that need it, and a run that still
+hits it is decoded again at the hard maximum (see `decode`).
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATS_PATH = os.environ.get(
+    "CHATTERBOX_LENGTH_STATS",
+    str(Path.home() / ".cache" / "chatterbox" / "speech_length_stats.json"),
+)
+
+# Speech tokens T3 may generate for one chunk, whatever the length model says
+HARD_MAX_TOKENS = 1000
+
+# Speech tokens (25/s) per text token before any runs have been observed
+PRIOR_RATIOS = {
+    "tts": 3.5,
+    "mtl": 3.0,
+    "turbo": 7.0,
+}
+
+
+class SpeechLengthModel:
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path=DEFAULT_STATS_PATH,
+        n_sigmas=4.0,
+        prior_slack=3.0,
+        margin_tokens=25,
+        min_tokens=64,
+        min_samples=20,
+        save_every=20,
+    ):
+        """
+        :param n_sigmas: how far above the mean log ratio the cap sits.
+        :param prior_slack: multiplier on the prior ratio; the cap never goes below it.
+        :param margin_tokens: flat allowance (1 s) on top of the ratio, which
+            matters for very short chunks.
+        :param min_samples: observations needed before the stats replace the prior.
+        """
+        self.path = path
+        self.n_sigmas = n_sigmas
+        self.prior_slack = prior_slack
+        self.margin_tokens = margin_tokens
+        self.min_tokens = min_tokens
+        self.min_samples = min_samples
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._stats = self._load()  # key -> {"n", "mean", "m2"} of log ratio
+        self._unsaved = 0
+
+    @classmethod
+    def default(cls) -> "SpeechLengthModel":
+        """Process-wide instance backed by `DEFAULT_STATS_PATH`, saved at exit."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+                atexit.register(cls._default.save)
+            return cls._default
+
+    @staticmethod
+    def _key(variant, language_id=None):
+        return f"{variant}:{(language_id or 'en').lower()}"
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            stats = dict(self._stats)
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save speech length stats: {e}")
+
+    def _calibrated(self, key):
+        s = self._stats.get(key)
+        if s is None or s["n"] < self.min_samples:
+            return None
+        std = math.sqrt(s["m2"] / (s["n"] - 1))
+        return s["mean"], std
+
+    def expected_ratio(self, variant, language_id=None) -> float:
+        """Typical speech tokens per text token."""
+        with self._lock:
+            calibrated = self._calibrated(self._key(variant, language_id))
+        if calibrated is None:
+            return PRIOR_RATIOS[variant]
+        return math.exp(calibrated[0])
+
+    def max_new_tokens(self, n_text_tokens, variant, language_id=None, hard_max=HARD_MAX_TOKENS) -> int:
+        """Cap on speech tokens for a chunk of `n_text_tokens` text tokens."""
+        with self._lock:
+            calibrated = self._calibrated(self._key(variant, language_id))
+        ratio = PRIOR_RATIOS[variant] * self.prior_slack
+        if calibrated is not None:
+            mean, std = calibrated
+            ratio = max(ratio, math.exp(mean + self.n_sigmas * std))
+        cap = math.ceil(n_text_tokens * ratio) + self.margin_tokens
+        return int(min(max(cap, self.min_tokens), hard_max))
+
+    def observe(self, n_text_tokens, n_speech_tokens, variant, language_id=None, hit_cap=False) -> bool:
+        """
+        Record a finished generation. Returns True (and logs a warning) if it
+        looks like an outlier: it ran into its cap, or its length is far
+        outside what this language normally produces. Every run is learned
+        from; a capped one counts at its capped length, a lower bound of
+        what it needed, so hitting the cap pulls the cap up.
+        """
+        if n_text_tokens <= 0 or n_speech_tokens <= 0:
+            return False
+        key = self._key(variant, language_id)
+        x = math.log(n_speech_tokens / n_text_tokens)
+
+        with self._lock:
+            calibrated = self._calibrated(key)
+            outlier = hit_cap or (
+                calibrated is not None and abs(x - calibrated[0]) > self.n_sigmas * calibrated[1]
+            )
+            # Welford update
+            s = self._stats.setdefault(key, {"n": 0, "mean": 0.0, "m2": 0.0})
+            s["n"] += 1
+            delta = x - s["mean"]
+            s["mean"] += delta / s["n"]
+            s["m2"] += delta * (x - s["mean"])
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+
+        if outlier:
+            reason = "hit the token cap" if hit_cap else "unusual length"
+            logger.warning(
+                f"Speech length outlier ({key}): {n_speech_tokens} speech tokens for "
+                f"{n_text_tokens} text tokens ({reason}); possible hallucination or early stop"
+            )
+        if should_save:
+            self.save()
+        return outlier
+
+    def decode(self, decode_fn, n_text_tokens, variant, language_id=None, max_new_tokens=None,
+               hard_max=HARD_MAX_TOKENS):
+        """
+        Run `decode_fn(max_new_tokens) -> (speech_tokens, hit_cap)` under
+        this model's cap for the chunk, or under `max_new_tokens` if the
+        caller set one, and record the outcome. If the model's own cap is
+        hit, the chunk is decoded once more at `hard_max` instead of coming
+        back cut off mid-sentence.
+
+        Returns (speech_tokens, the cap of the run kept, whether it hit it).
+        """
+        adaptive = max_new_tokens is None
+        if adaptive:
+            max_new_tokens = self.max_new_tokens(n_text_tokens, variant, language_id, hard_max=hard_max)
+        speech_tokens, hit_cap = decode_fn(max_new_tokens)
+        if hit_cap and adaptive and max_new_tokens < hard_max:
+            logger.info(
+                f"{variant} chunk of {n_text_tokens} text tokens hit its cap of {max_new_tokens} "
+                f"speech tokens; decoding again with {hard_max}"
+            )
+            max_new_tokens = hard_max
+            speech_tokens, hit_cap = decode_fn(max_new_tokens)
+        self.observe(n_text_tokens, speech_tokens.size(-1), variant, language_id, hit_cap=bool(hit_cap))
+        return speech_tokens, max_new_tokens, bool(hit_cap)
@@ -0,0 +1,78 @@
+"""
+Single-pass audio ingest shared by the pipelines.
+
+A clip is decoded once at its native rate and resampled straight to every
+rate the models need (24 kHz for S3Gen mels, 16 kHz for the S3 tokenizer,
+CAMPPlus and the voice encoder). The windowed-sinc kernels are built once
+per (src_sr, dst_sr, device) and reused, and the results come back as
+tensors already on the model device.
+"""
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import librosa
+import torch
+import torchaudio as ta
+
+
+@lru_cache(100)
+def get_resampler(src_sr, dst_sr, device):
+    """Kaiser-windowed sinc resampler (roughly librosa's "kaiser_best"), cached per device."""
+    return ta.transforms.Resample(
+        src_sr,
+        dst_sr,
+        resampling_method="sinc_interp_kaiser",
+        lowpass_filter_width=64,
+        rolloff=0.9475937167399596,
+        beta=14.769656459379492,
+    ).to(device)
+
+
+def decode_audio(fpath) -> Tuple[torch.Tensor, int]:
+    """Decode `fpath` to a mono float32 (1, L) tensor at its native sample rate."""
+    wav, sr = librosa.load(fpath, sr=None, mono=True)
+    return torch.from_numpy(wav).float().unsqueeze(0), sr
+
+
+def audio_duration(fpath) -> float:
+    """Duration of `fpath` in seconds, read from the header where possible."""
+    return librosa.get_duration(path=fpath)
+
+
+def resample(wav: torch.Tensor, src_sr: int, dst_sr: int, device) -> torch.Tensor:
+    wav = wav.to(device)
+    if src_sr == dst_sr:
+        return wav
+    return get_resampler(src_sr, dst_sr, torch.device(device))(wav)
+
+
+def load_audio(fpath, sr: int, device) -> torch.Tensor:
+    """Decode `fpath` and return a (1, L) tensor at `sr` on `device`."""
+    wav, native_sr = decode_audio(fpath)
+    return resample(wav, native_sr, sr, device)
+
+
+@torch.inference_mode()
+def load_audio_views(
+    fpath,
+    sample_rates: Sequence[int],
+    device,
+    gain_fn: Optional[Callable] = None,
+) -> List[torch.Tensor]:
+    """
+    Decode a clip once and return one (1, L) tensor on `device` per entry of
+    `sample_rates`, each resampled directly from the native rate.
+
+    :param gain_fn: optional `(wav, sr) -> float` loudness gain, evaluated on
+        the first view. Being a scalar it is applied to every view, so the
+        views stay consistent without resampling the normalised signal again.
+    """
+    wav, native_sr = decode_audio(fpath)
+    views = [resample(wav, native_sr, sr, device) for sr in sample_rates]
+
+    if gain_fn is not None:
+        gain = gain_fn(views[0][0].cpu().numpy(), sample_rates[0])
+        if gain != 1.0:
+            views = [v * gain for v in views]
+
+    return views
@@ -140,7 +140,8 @@ class CausalMaskedDiffWithXvec(torch.nn.Module):
                   finalize,
                   n_timesteps=10,
                   noised_mels=None,
-                  meanflow=False):
+                  meanflow=False,
+                  cancel=None):
         # token: (B, n_toks)
         # token_len: (B,)
         B = token.size(0)
@@ -169,6 +170,7 @@ class CausalMaskedDiffWithXvec(torch.nn.Module):
         h, h_masks = self.encoder(token, token_len)
         if finalize is False:
             h = h[:, :-self.pre_lookahead_len * self.token_mel_ratio]
+            h_masks = h_masks[:, :, :h.shape[1]]
 
         h_lengths = h_masks.sum(dim=-1).squeeze(dim=-1)
         mel_len1, mel_len2 = prompt_feat.shape[1], h.shape[1] - prompt_feat.shape[1]
@@ -192,6 +194,7 @@ class CausalMaskedDiffWithXvec(torch.nn.Module):
             n_timesteps=n_timesteps,
             noised_mels=noised_mels,
             meanflow=meanflow,
+            cancel=cancel,
         )
         feat = feat[:, :, mel_len1:]
         assert feat.shape[2] == mel_len2
@@ -16,6 +16,8 @@ import torch
 import torch.nn.functional as F
 from .matcha.flow_matching import BASECFM
 from .configs import CFM_PARAMS
+from ..utils import check_cancelled
+from ...profiling import report_progress
 from tqdm import tqdm
 
 
@@ -75,7 +77,7 @@ class ConditionalCFM(BASECFM):
             t_span = 1 - torch.cos(t_span * 0.5 * torch.pi)
         return self.solve_euler(z, t_span=t_span, mu=mu, mask=mask, spks=spks, cond=cond), flow_cache
 
-    def solve_euler(self, x, t_span, mu, mask, spks, cond, meanflow=False):
+    def solve_euler(self, x, t_span, mu, mask, spks, cond, meanflow=False, cancel=None):
         """
         Fixed euler solver for ODEs.
         Args:
@@ -90,6 +92,7 @@ class ConditionalCFM(BASECFM):
                 shape: (batch_size, spk_emb_dim)
             cond: Not used but kept for future purposes
             meanflow: meanflow mode
+            cancel: optional `CancellationToken`, checked before every step
         """
         in_dtype = x.dtype
         x, t_span, mu, mask, spks, cond = cast_all(x, t_span, mu, mask, spks, cond, dtype=self.estimator.dtype)
@@ -105,7 +108,9 @@ class ConditionalCFM(BASECFM):
         cond_in = torch.zeros([2 * B, 80, T], device=x.device, dtype=x.dtype)
         r_in    = torch.zeros([2 * B       ], device=x.device, dtype=x.dtype) # (only used for meanflow)
 
-        for t, r in zip(t_span[:-1], t_span[1:]):
+        n_steps = len(t_span) - 1
+        for step, (t, r) in enumerate(zip(t_span[:-1], t_span[1:])):
+            check_cancelled(cancel)
             t = t.unsqueeze(dim=0)
             r = r.unsqueeze(dim=0)
             # Shapes:
@@ -139,6 +144,7 @@ class ConditionalCFM(BASECFM):
             dxdt = ((1.0 + self.inference_cfg_rate) * dxdt - self.inference_cfg_rate * cfg_dxdt)
             dt = r - t
             x = x + dt * dxdt
+            report_progress("cfm", step + 1, n_steps)
 
 
 
@@ -193,7 +199,7 @@ class CausalConditionalCFM(ConditionalCFM):
         self.rand_noise = None
 
     @torch.inference_mode()
-    def forward(self, mu, mask, n_timesteps, temperature=1.0, spks=None, cond=None, noised_mels=None, meanflow=False):
+    def forward(self, mu, mask, n_timesteps, temperature=1.0, spks=None, cond=None, noised_mels=None, meanflow=False, cancel=None):
         """Forward diffusion
 
         Args:
@@ -207,6 +213,7 @@ class CausalConditionalCFM(ConditionalCFM):
                 shape: (batch_size, spk_emb_dim)
             cond: Not used but kept for future purposes
             noised_mels: gt mels noised a time t
+            cancel: optional `CancellationToken` for the ODE solver
         Returns:
             sample: generated mel-spectrogram
                 shape: (batch_size, n_feats, mel_timesteps)
@@ -228,19 +235,23 @@ class CausalConditionalCFM(ConditionalCFM):
         #   because they were distilled with CFG outputs. We would need to add another hparam and
         #   change the conditional logic here if we want to use CFG inference with a meanflow model.
         if meanflow:
-            return self.basic_euler(z, t_span=t_span, mu=mu, mask=mask, spks=spks, cond=cond), None
+            return self.basic_euler(z, t_span=t_span, mu=mu, mask=mask, spks=spks, cond=cond, cancel=cancel), None
 
-        return self.solve_euler(z, t_span=t_span, mu=mu, mask=mask, spks=spks, cond=cond, meanflow=meanflow), None
+        return self.solve_euler(z, t_span=t_span, mu=mu, mask=mask, spks=spks, cond=cond, meanflow=meanflow, cancel=cancel), None
 
-    def basic_euler(self, x, t_span, mu, mask, spks, cond):
+    def basic_euler(self, x, t_span, mu, mask, spks, cond, cancel=None):
         in_dtype = x.dtype
         x, t_span, mu, mask, spks, cond = cast_all(x, t_span, mu, mask, spks, cond, dtype=self.estimator.dtype)
 
         print("S3 Token -> Mel Inference...")
-        for t, r in tqdm(zip(t_span[..., :-1], t_span[..., 1:]), total=t_span.shape[-1] - 1):
+        n_steps = t_span.shape[-1] - 1
+        steps = zip(t_span[..., :-1], t_span[..., 1:])
+        for step, (t, r) in enumerate(tqdm(steps, total=n_steps)):
+            check_cancelled(cancel)
             t, r = t[None], r[None]
             dxdt = self.estimator.forward(x, mask=mask, mu=mu, t=t, spks=spks, cond=cond, r=r)
             dt = r - t
             x = x + dt * dxdt
+            report_progress("cfm", step + 1, n_steps)
 
         return x.to(in_dtype)
@@ -12,14 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 
 import numpy as np
 import torch
-import torchaudio as ta
-from functools import lru_cache
+from torch.nn.utils import parametrize
+from torch.nn.utils.parametrizations import weight_norm
 from typing import Optional
 
+from ..audio_ingest import get_resampler
+from ..utils import check_cancelled
+from ...profiling import stage
 from ..s3tokenizer import S3_SR, SPEECH_VOCAB_SIZE, S3Tokenizer
 from .const import S3GEN_SR
 from .flow import CausalMaskedDiffWithXvec
@@ -38,12 +42,6 @@ def drop_invalid_tokens(x):
     return x[x < SPEECH_VOCAB_SIZE]
 
 
-# TODO: global resampler cache
-@lru_cache(100)
-def get_resampler(src_sr, dst_sr, device):
-    return ta.transforms.Resample(src_sr, dst_sr).to(device)
-
-
 class S3Token2Mel(torch.nn.Module):
     """
     S3Gen's CFM decoder maps S3 speech tokens to mel-spectrograms.
@@ -121,7 +119,12 @@ class S3Token2Mel(torch.nn.Module):
         ref_sr: int,
         device="auto",
         ref_fade_out=True,
+        ref_wav_16: Optional[torch.Tensor] = None,
     ):
+        """
+        :param ref_wav_16: the same reference already at 16 kHz (e.g. from
+            `load_audio_views`); saves resampling `ref_wav` a second time.
+        """
         device = self.device if device == "auto" else device
         if isinstance(ref_wav, np.ndarray):
             ref_wav = torch.from_numpy(ref_wav).float()
@@ -144,9 +147,12 @@ class S3Token2Mel(torch.nn.Module):
         ref_mels_24_len = None
 
         # Resample to 16kHz
-        ref_wav_16 = ref_wav
-        if ref_sr != S3_SR:
-            ref_wav_16 = get_resampler(ref_sr, S3_SR, device)(ref_wav)
+        if ref_wav_16 is not None:
+            ref_wav_16 = torch.atleast_2d(ref_wav_16).to(device)
+        else:
+            ref_wav_16 = ref_wav
+            if ref_sr != S3_SR:
+                ref_wav_16 = get_resampler(ref_sr, S3_SR, device)(ref_wav)
 
         # Speaker embedding
         ref_x_vector = self.speaker_encoder.inference(ref_wav_16.to(dtype=self.dtype))
@@ -182,6 +188,7 @@ class S3Token2Mel(torch.nn.Module):
         finalize: bool = False,
         speech_token_lens=None,
         noised_mels=None,
+        cancel=None,
     ):
         """
         Generate waveforms from S3 speech tokens and a reference waveform, which the speaker timbre is inferred from.
@@ -198,6 +205,7 @@ class S3Token2Mel(torch.nn.Module):
         - `ref_wav`: reference waveform (`torch.Tensor` with shape=[B=1, T])
         - `ref_sr`: reference sample rate
         - `finalize`: whether streaming is finished or not. Note that if False, the last 3 tokens will be ignored.
+        - `cancel`: optional `CancellationToken`, checked at every CFM step.
         """
         assert (ref_wav is None) ^ (ref_dict is None), f"Must provide exactly one of ref_wav or ref_dict (got {ref_wav} and {ref_dict})"
 
@@ -224,6 +232,7 @@ class S3Token2Mel(torch.nn.Module):
             noised_mels=noised_mels,
             n_timesteps=n_cfm_timesteps,
             meanflow=self.meanflow,
+            cancel=cancel,
             **ref_dict,
         )
         return output_mels
@@ -257,6 +266,73 @@ class S3Token2Wav(S3Token2Mel):
         trim_fade[n_trim:] = (torch.cos(torch.linspace(torch.pi, 0, n_trim)) + 1) / 2
         self.register_buffer("trim_fade", trim_fade, persistent=False) # (buffers get automatic device casting)
         self.estimator_dtype = "fp32"
+        self.inference_ready = False
+
+    @torch.no_grad()
+    def prepare_for_inference(self, verify=True, rtol=1e-3, atol=1e-4):
+        """
+        One-off load-time folding for inference (call after loading weights and
+        moving to the target device):
+
+        - bake HiFT's (and its F0 predictor's) weight norm into plain weights
+        - fold CAMPPlus BatchNorms into the convolutions before them
+        - put HiFT's STFT window on the model device once
+
+        With `verify`, fixed random probes are run through both models before
+        and after; on any mismatch beyond `rtol`/`atol` the folding is undone
+        (with a warning) and the unfolded modules are used instead.
+        """
+        if self.inference_ready:
+            return self
+        self.eval()
+        hift, campplus = self.mel2wav, self.speaker_encoder
+
+        if verify:
+            g = torch.Generator().manual_seed(0)
+            n_frames = 40
+            mel = torch.randn(1, 80, n_frames, generator=g)
+            source = 0.1 * torch.randn(1, 1, n_frames * 480, generator=g)  # 480 samples per mel frame
+            fbank = torch.randn(1, 2 * n_frames, 80, generator=g)
+            probes = [t.to(device=self.device, dtype=self.dtype) for t in (mel, source, fbank)]
+
+            def run():
+                mel, source, fbank = probes
+                return {
+                    "hift": hift.decode(x=mel, s=source),
+                    "f0_predictor": hift.f0_predictor(mel),
+                    "campplus": campplus(fbank),
+                }
+            before = run()
+            # What folding changes, to undo it. HiFT can't simply be deep-copied:
+            # a copy shares its Parametrized* classes, which removing weight
+            # norm from the original strips.
+            weight_normed = [name for name, m in hift.named_modules() if parametrize.is_parametrized(m, "weight")]
+            hift_state = {k: v.clone() for k, v in hift.state_dict().items()}
+            unfolded_campplus = copy.deepcopy(campplus)
+
+        hift.remove_weight_norm()
+        campplus.fuse_batchnorm()
+
+        if verify:
+            mismatched = []
+            for name, out in run().items():
+                ref = before[name]
+                if not torch.allclose(out, ref, rtol=rtol, atol=atol):
+                    mismatched.append(f"{name} by up to {(out - ref).abs().max().item():.2e}")
+            if mismatched:
+                logging.warning(
+                    f"prepare_for_inference: folding changed {', '.join(mismatched)}; "
+                    f"keeping the unfolded weights"
+                )
+                for name in weight_normed:
+                    weight_norm(hift.get_submodule(name))
+                hift.load_state_dict(hift_state)
+                self.speaker_encoder = unfolded_campplus
+            del hift_state, unfolded_campplus
+
+        hift.stft_window = hift.stft_window.to(self.device)
+        self.inference_ready = True
+        return self
 
     def forward(
         self,
@@ -271,7 +347,7 @@ class S3Token2Wav(S3Token2Mel):
         skip_vocoder=False,
         n_cfm_timesteps=None,
         noised_mels=None,
-
+        cancel=None,
     ):
         """
         Generate waveforms from S3 speech tokens and a reference waveform, which the speaker timbre is inferred from.
@@ -280,11 +356,12 @@ class S3Token2Wav(S3Token2Mel):
         output_mels = super().forward(
             speech_tokens, speech_token_lens=speech_token_lens, ref_wav=ref_wav,
             ref_sr=ref_sr, ref_dict=ref_dict, finalize=finalize,
-            n_cfm_timesteps=n_cfm_timesteps, noised_mels=noised_mels,
+            n_cfm_timesteps=n_cfm_timesteps, noised_mels=noised_mels, cancel=cancel,
         )
 
         if skip_vocoder:
             return output_mels
+        check_cancelled(cancel)
 
         # TODO jrm: ignoring the speed control (mel interpolation) and the HiFTGAN caching mechanisms for now.
         hift_cache_source = torch.zeros(1, 1, 0).to(self.device)
@@ -309,22 +386,25 @@ class S3Token2Wav(S3Token2Mel):
         n_cfm_timesteps = None,
         finalize: bool = False,
         speech_token_lens=None,
+        cancel=None,
     ):
         n_cfm_timesteps = n_cfm_timesteps or (2 if self.meanflow else 10)
         noise = None
         if self.meanflow:
             noise = torch.randn(1, 80, speech_tokens.size(-1) * 2, dtype=self.dtype, device=self.device)
-        output_mels = super().forward(
-            speech_tokens, speech_token_lens=speech_token_lens, ref_wav=ref_wav, ref_sr=ref_sr, ref_dict=ref_dict,
-            n_cfm_timesteps=n_cfm_timesteps, finalize=finalize, noised_mels=noise,
-        )
+        with stage("cfm", steps=n_cfm_timesteps, speech_tokens=speech_tokens.size(-1)):
+            output_mels = super().forward(
+                speech_tokens, speech_token_lens=speech_token_lens, ref_wav=ref_wav, ref_sr=ref_sr, ref_dict=ref_dict,
+                n_cfm_timesteps=n_cfm_timesteps, finalize=finalize, noised_mels=noise, cancel=cancel,
+            )
         return output_mels
 
     @torch.inference_mode()
     def hift_inference(self, speech_feat, cache_source: torch.Tensor = None):
         if cache_source is None:
             cache_source = torch.zeros(1, 1, 0).to(device=self.device, dtype=self.dtype)
-        return self.mel2wav.inference(speech_feat=speech_feat, cache_source=cache_source)
+        with stage("hifigan", frames=speech_feat.size(-1)):
+            return self.mel2wav.inference(speech_feat=speech_feat, cache_source=cache_source)
 
     @torch.inference_mode()
     def inference(
@@ -339,6 +419,7 @@ class S3Token2Wav(S3Token2Mel):
         drop_invalid_tokens=True,
         n_cfm_timesteps=None,
         speech_token_lens=None,
+        cancel=None,
     ):
         # hallucination prevention, drop special tokens
         # if drop_invalid_tokens:
@@ -352,8 +433,10 @@ class S3Token2Wav(S3Token2Mel):
             ref_dict=ref_dict,
             n_cfm_timesteps=n_cfm_timesteps,
             finalize=True,
+            cancel=cancel,
         )
         output_mels = output_mels.to(dtype=self.dtype) # FIXME (fp16 mode) is this still needed?
+        check_cancelled(cancel)
         output_wavs, output_sources = self.hift_inference(output_mels, None)
 
         # NOTE: ad-hoc method to reduce "spillover" from the reference clip.
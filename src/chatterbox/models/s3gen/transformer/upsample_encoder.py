@@ -277,7 +277,9 @@ class UpsampleConformerEncoder(torch.nn.Module):
                                               self.static_chunk_size,
                                               num_decoding_left_chunks)
         # lookahead + conformer encoder
-        xs = self.pre_lookahead_layer(xs)
+        # zero the padded frames first: the lookahead conv reads past the end of
+        # each sequence and would otherwise pick up the embedding's bias there
+        xs = self.pre_lookahead_layer(xs * mask_pad.transpose(1, 2))
         xs = self.forward_layers(xs, chunk_masks, pos_emb, mask_pad)
 
         # upsample + conformer encoder
@@ -6,9 +6,12 @@
 
 
 from collections import OrderedDict
+from functools import lru_cache
+
 import torch
 import torch.nn.functional as F
 import torch.utils.checkpoint as cp
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 import torchaudio.compliance.kaldi as Kaldi
 
 
@@ -42,20 +45,71 @@ def pad_list(xs, pad_value):
     return pad
 
 
-def extract_feature(audio):
-    features = []
-    feature_times = []
-    feature_lengths = []
-    for au in audio:
-        feature = Kaldi.fbank(au.unsqueeze(0), num_mel_bins=80)
-        feature = feature - feature.mean(dim=0, keepdim=True)
-        features.append(feature)
-        feature_times.append(au.shape[0])
-        feature_lengths.append(feature.shape[0])
-    # padding for batch inference
-    features_padded = pad_list(features, pad_value=0)
-    # features = torch.cat(features)
-    return features_padded, feature_lengths, feature_times
+def length_mask(lengths, max_len):
+    """(B,) lengths -> (B, max_len) float mask, 1 on valid frames."""
+    return (torch.arange(max_len, device=lengths.device)[None, :] < lengths[:, None]).float()
+
+
+@lru_cache()
+def _fbank_consts(num_mel_bins, device):
+    # Kaldi defaults at 16 kHz: 25 ms povey window, padded to a 512-point FFT
+    window = torch.hann_window(400, periodic=False, device=device).pow(0.85)
+    mel_banks, _ = Kaldi.get_mel_banks(num_mel_bins, 512, 16000.0, 20.0, 0.0, 100.0, -500.0, 1.0)
+    mel_banks = F.pad(mel_banks, (0, 1), mode="constant", value=0).to(device)
+    return window, mel_banks
+
+
+def batched_fbank(wavs, wav_lens, num_mel_bins=80):
+    """
+    `Kaldi.fbank(wav, num_mel_bins=num_mel_bins)` (default options) for every row
+    of a right-padded (B, L) batch at once. Every step after framing is
+    frame-local, so frames that lie within an item match the per-item call.
+
+    :return: (feats, feat_lens) - (B, T, num_mel_bins) and (B,)
+    """
+    frame_len, frame_shift, preemph = 400, 160, 0.97
+    if wavs.size(1) < frame_len:
+        wavs = F.pad(wavs, (0, frame_len - wavs.size(1)))
+    window, mel_banks = _fbank_consts(num_mel_bins, wavs.device)
+
+    frames = wavs.unfold(1, frame_len, frame_shift)  # (B, T, 400), snip_edges=True
+    frames = frames - frames.mean(dim=-1, keepdim=True)  # remove_dc_offset
+    prev = torch.cat([frames[..., :1], frames[..., :-1]], dim=-1)  # replicate-padded shift
+    frames = (frames - preemph * prev) * window
+    frames = F.pad(frames, (0, 512 - frame_len))
+
+    spectrum = torch.fft.rfft(frames).abs().pow(2.0)
+    feats = torch.matmul(spectrum, mel_banks.to(spectrum.dtype).T)
+    feats = torch.clamp(feats, min=torch.finfo(feats.dtype).eps).log()
+
+    feat_lens = torch.div(wav_lens.to(wavs.device) - frame_len, frame_shift, rounding_mode="floor") + 1
+    return feats, feat_lens.clamp(min=0)
+
+
+def extract_feature(audio, audio_lens=None):
+    """
+    Mean-normalized fbanks for a list of waveforms, or a right-padded (B, L)
+    tensor with `audio_lens`. Normalization uses each item's valid frames only
+    and padded frames come back as zeros.
+    """
+    if torch.is_tensor(audio) and audio.dim() == 2:
+        if audio_lens is None:
+            audio_lens = torch.full((audio.size(0),), audio.size(1), device=audio.device)
+        wavs = audio
+    else:
+        audio_lens = torch.tensor([au.shape[0] for au in audio], device=audio[0].device)
+        wavs = pad_list(list(audio), pad_value=0)
+    audio_lens = torch.as_tensor(audio_lens, device=wavs.device).long()
+
+    feats, feat_lens = batched_fbank(wavs, audio_lens, num_mel_bins=80)
+    mask = length_mask(feat_lens, feats.size(1)).unsqueeze(-1)
+    mean = (feats * mask).sum(dim=1, keepdim=True) / mask.sum(dim=1, keepdim=True).clamp(min=1)
+    features_padded = (feats - mean) * mask
+    return features_padded, feat_lens.tolist(), audio_lens.tolist()
+
+
+def _masked(x, mask):
+    return x if mask is None else x * mask
 
 
 class BasicResBlock(torch.nn.Module):
@@ -83,9 +137,10 @@ class BasicResBlock(torch.nn.Module):
                 torch.nn.BatchNorm2d(self.expansion * planes),
             )
 
-    def forward(self, x):
-        out = F.relu(self.bn1(self.conv1(x)))
-        out = self.bn2(self.conv2(out))
+    def forward(self, x, mask=None):
+        # `mask` (B, 1, 1, T) zeroes padded frames ahead of every time-mixing conv
+        out = F.relu(self.bn1(self.conv1(_masked(x, mask))))
+        out = self.bn2(self.conv2(_masked(out, mask)))
         out += self.shortcut(x)
         out = F.relu(out)
         return out
@@ -115,12 +170,13 @@ class FCM(torch.nn.Module):
             self.in_planes = planes * block.expansion
         return torch.nn.Sequential(*layers)
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
         x = x.unsqueeze(1)
-        out = F.relu(self.bn1(self.conv1(x)))
-        out = self.layer1(out)
-        out = self.layer2(out)
-        out = F.relu(self.bn2(self.conv2(out)))
+        mask = None if mask is None else mask[:, None, None, :]
+        out = F.relu(self.bn1(self.conv1(_masked(x, mask))))
+        for layer in (*self.layer1, *self.layer2):
+            out = layer(out, mask)
+        out = F.relu(self.bn2(self.conv2(_masked(out, mask))))
 
         shape = out.shape
         out = out.reshape(shape[0], shape[1] * shape[2], shape[3])
@@ -143,9 +199,16 @@ def get_nonlinear(config_str, channels):
     return nonlinear
 
 
-def statistics_pooling(x, dim=-1, keepdim=False, unbiased=True, eps=1e-2):
-    mean = x.mean(dim=dim)
-    std = x.std(dim=dim, unbiased=unbiased)
+def statistics_pooling(x, dim=-1, keepdim=False, unbiased=True, eps=1e-2, mask=None):
+    if mask is None:
+        mean = x.mean(dim=dim)
+        std = x.std(dim=dim, unbiased=unbiased)
+    else:
+        # Statistics over each item's valid frames only
+        n = mask.sum(dim=dim, keepdim=True)
+        mean = (x * mask).sum(dim=dim, keepdim=True) / n
+        var = (((x - mean) * mask) ** 2).sum(dim=dim) / (n.squeeze(dim) - (1 if unbiased else 0))
+        mean, std = mean.squeeze(dim), var.sqrt()
     stats = torch.cat([mean, std], dim=-1)
     if keepdim:
         stats = stats.unsqueeze(dim=dim)
@@ -153,8 +216,8 @@ def statistics_pooling(x, dim=-1, keepdim=False, unbiased=True, eps=1e-2):
 
 
 class StatsPool(torch.nn.Module):
-    def forward(self, x):
-        return statistics_pooling(x)
+    def forward(self, x, mask=None):
+        return statistics_pooling(x, mask=mask)
 
 
 class TDNNLayer(torch.nn.Module):
@@ -186,11 +249,16 @@ class TDNNLayer(torch.nn.Module):
         )
         self.nonlinear = get_nonlinear(config_str, out_channels)
 
-    def forward(self, x):
-        x = self.linear(x)
+    def forward(self, x, mask=None):
+        x = self.linear(_masked(x, mask))
         x = self.nonlinear(x)
         return x
 
+    def output_lengths(self, lengths):
+        conv = self.linear
+        span = conv.dilation[0] * (conv.kernel_size[0] - 1) + 1
+        return torch.div(lengths + 2 * conv.padding[0] - span, conv.stride[0], rounding_mode="floor") + 1
+
 
 class CAMLayer(torch.nn.Module):
     def __init__(
@@ -211,15 +279,23 @@ class CAMLayer(torch.nn.Module):
         self.linear2 = torch.nn.Conv1d(bn_channels // reduction, out_channels, 1)
         self.sigmoid = torch.nn.Sigmoid()
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
+        x = _masked(x, mask)
         y = self.linear_local(x)
-        context = x.mean(-1, keepdim=True) + self.seg_pooling(x)
+        if mask is None:
+            context = x.mean(-1, keepdim=True) + self.seg_pooling(x)
+        else:
+            context = x.sum(-1, keepdim=True) / mask.sum(-1, keepdim=True) + self.seg_pooling(x, mask=mask)
         context = self.relu(self.linear1(context))
         m = self.sigmoid(self.linear2(context))
         return y * m
 
-    def seg_pooling(self, x, seg_len=100, stype="avg"):
-        if stype == "avg":
+    def seg_pooling(self, x, seg_len=100, stype="avg", mask=None):
+        if stype == "avg" and mask is not None:
+            # Average over the valid frames of each segment; x is already masked
+            seg = F.avg_pool1d(x, kernel_size=seg_len, stride=seg_len, ceil_mode=True)
+            seg = seg / F.avg_pool1d(mask, kernel_size=seg_len, stride=seg_len, ceil_mode=True).clamp(min=1e-8)
+        elif stype == "avg":
             seg = F.avg_pool1d(x, kernel_size=seg_len, stride=seg_len, ceil_mode=True)
         elif stype == "max":
             seg = F.max_pool1d(x, kernel_size=seg_len, stride=seg_len, ceil_mode=True)
@@ -266,12 +342,12 @@ class CAMDenseTDNNLayer(torch.nn.Module):
     def bn_function(self, x):
         return self.linear1(self.nonlinear1(x))
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
         if self.training and self.memory_efficient:
             x = cp.checkpoint(self.bn_function, x)
         else:
             x = self.bn_function(x)
-        x = self.cam_layer(self.nonlinear2(x))
+        x = self.cam_layer(self.nonlinear2(x), mask=mask)
         return x
 
 
@@ -304,9 +380,9 @@ class CAMDenseTDNNBlock(torch.nn.ModuleList):
             )
             self.add_module("tdnnd%d" % (i + 1), layer)
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
         for layer in self:
-            x = torch.cat([x, layer(x)], dim=1)
+            x = torch.cat([x, layer(x, mask=mask)], dim=1)
         return x
 
 
@@ -414,15 +490,68 @@ class CAMPPlus(torch.nn.Module):
                 if m.bias is not None:
                     torch.nn.init.zeros_(m.bias)
 
-    def forward(self, x):
+    @torch.no_grad()
+    def fuse_batchnorm(self):
+        """
+        Fold every BatchNorm that directly follows a convolution into that
+        convolution (eval mode only). The pre-activation BatchNorms, which
+        follow a ReLU or a concat, are left as they are.
+        """
+        assert not self.training, "BatchNorm can only be folded in eval mode"
+
+        def fold(parent, conv_name, bn_parent, bn_name):
+            conv, bn = getattr(parent, conv_name), getattr(bn_parent, bn_name)
+            if isinstance(bn, torch.nn.Identity):
+                return
+            setattr(parent, conv_name, fuse_conv_bn_eval(conv, bn))
+            setattr(bn_parent, bn_name, torch.nn.Identity())
+
+        for m in self.modules():
+            if isinstance(m, (BasicResBlock, FCM)):
+                fold(m, "conv1", m, "bn1")
+                fold(m, "conv2", m, "bn2")
+                if isinstance(m, BasicResBlock) and len(m.shortcut):
+                    fold(m.shortcut, "0", m.shortcut, "1")
+            elif isinstance(m, (TDNNLayer, DenseLayer)) and hasattr(m.nonlinear, "batchnorm"):
+                if next(iter(m.nonlinear.children())) is m.nonlinear.batchnorm:
+                    fold(m, "linear", m.nonlinear, "batchnorm")
+            elif isinstance(m, CAMDenseTDNNLayer) and hasattr(m.nonlinear2, "batchnorm"):
+                if next(iter(m.nonlinear2.children())) is m.nonlinear2.batchnorm:
+                    fold(m, "linear1", m.nonlinear2, "batchnorm")
+
+    def forward(self, x, lengths=None):
+        """
+        :param x: (B, T, F) fbanks
+        :param lengths: optional (B,) valid frames per item. Padded frames are
+            then kept out of every conv and pooling, so each item embeds
+            exactly as it would on its own.
+        """
         x = x.permute(0, 2, 1)  # (B,T,F) => (B,F,T)
-        x = self.head(x)
-        x = self.xvector(x)
+        if lengths is None:
+            x = self.head(x)
+            x = self.xvector(x)
+        else:
+            lengths = torch.as_tensor(lengths, device=x.device)
+            mask = length_mask(lengths, x.size(-1)).unsqueeze(1)
+            x = self.head(x, mask=mask[:, 0])
+            for layer in self.xvector:
+                if isinstance(layer, TDNNLayer):
+                    x = layer(x, mask=mask)
+                    lengths = layer.output_lengths(lengths)
+                    mask = length_mask(lengths, x.size(-1)).unsqueeze(1)
+                elif isinstance(layer, (CAMDenseTDNNBlock, StatsPool)):
+                    x = layer(x, mask=mask)
+                else:
+                    x = layer(x)
         if self.output_level == "frame":
             x = x.transpose(1, 2)
         return x
 
-    def inference(self, audio_list):
-        speech, speech_lengths, speech_times = extract_feature(audio_list)
-        results = self.forward(speech.to(torch.float32))
+    def inference(self, audio_list, audio_lens=None):
+        """
+        Speaker embeddings for a list of 16 kHz waveforms, or a right-padded
+        (B, L) tensor with `audio_lens`. Batched items match single-item calls.
+        """
+        speech, speech_lengths, speech_times = extract_feature(audio_list, audio_lens)
+        results = self.forward(speech.to(torch.float32), lengths=speech_lengths)
         return results
@@ -1,15 +1,17 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 import numpy as np
 import librosa
 import torch
 import torch.nn.functional as F
-from s3tokenizer.utils import padding
+from torch.nn.utils.rnn import pad_sequence
 from s3tokenizer.model_v2 import (
     S3TokenizerV2,
     ModelConfig,
 )
 
+from ..utils import reflect_pad_batch
+
 
 # Sampling rate of the inputs to S3TokenizerV2
 S3_SR = 16_000
@@ -90,41 +92,90 @@ class S3Tokenizer(S3TokenizerV2):
     @torch.no_grad()
     def forward(
         self,
-        wavs: torch.Tensor,
+        wavs: Union[torch.Tensor, List[torch.Tensor]],
         accelerator: 'Accelerator'=None,
         max_len: int=None,
+        wav_lens: torch.Tensor=None,
     ) -> Tuple[torch.Tensor, torch.LongTensor]:
         """
         NOTE: mel-spec has a hop size of 160 points (100 frame/sec).
-        FIXME: this class inherits `nn.Module` but doesn't accept `torch.Tensor` and handles a list of wavs one by one, which is unexpected.
+
+        The whole batch goes through one STFT/mel projection and one
+        quantizer call; each item is still normalized against its own peak.
 
         Args
         ----
-        - `wavs`: 16 kHz speech audio
+        - `wavs`: 16 kHz speech audio, as a list of 1D/(1, L) waveforms or a
+          right-padded (B, L) tensor
         - `max_len` max length to truncate the output sequence to (25 token/sec).
         NOTE: please pad the waveform if longer sequence is needed.
+        - `wav_lens`: valid samples per row when `wavs` is a (B, L) tensor
+          whose rows have different lengths
         """
-        processed_wavs = self._prepare_audio(wavs)
-        mels, mel_lens = [], []
-        for wav in processed_wavs:
-            wav = wav.to(self.device)
-            mel = self.log_mel_spectrogram(wav)  # [B=1, F, T]
-            if max_len is not None:
-                mel = mel[..., :max_len * 4]  # num_mel_frames = 4 * num_tokens
-            mels.append(mel.squeeze(0))
-
-        mels, mel_lens = padding(mels)
+        if torch.is_tensor(wavs) and wavs.dim() <= 2:
+            wavs = torch.atleast_2d(wavs).to(self.device)
+            if wav_lens is None:
+                wav_lens = torch.full((wavs.size(0),), wavs.size(1), device=self.device)
+        else:
+            processed_wavs = [wav.reshape(-1).to(self.device) for wav in self._prepare_audio(wavs)]
+            wav_lens = torch.tensor([wav.numel() for wav in processed_wavs], device=self.device)
+            wavs = pad_sequence(processed_wavs, batch_first=True)
+
+        mels, mel_lens = self.log_mel_spectrogram_batch(wavs, wav_lens)
+        if max_len is not None:
+            mel_lens = mel_lens.clamp(max=max_len * 4)  # num_mel_frames = 4 * num_tokens
+            mels = mels[..., :int(mel_lens.max())]
+
         if accelerator is None:
             tokenizer = self
         else:
             tokenizer = accelerator.unwrap_model(self)
 
-        speech_tokens, speech_token_lens = tokenizer.quantize(mels, mel_lens.to(self.device))
+        speech_tokens, speech_token_lens = tokenizer.quantize(mels, mel_lens.int())
         return (
             speech_tokens.long().detach(),
             speech_token_lens.long().detach(),
         )
 
+    @torch.no_grad()
+    def log_mel_spectrogram_batch(
+        self,
+        audio: torch.Tensor,
+        audio_lens: torch.Tensor,
+    ):
+        """
+        Batched `log_mel_spectrogram` over a right-padded (B, L) batch.
+
+        Each row is reflect-padded against its own length and clipped to
+        8 dB below its own maximum, so the result matches running
+        `log_mel_spectrogram` item by item.
+
+        Returns
+        -------
+        (mels, mel_lens): (B, 128, T_max) with frames past each item's length
+        zeroed, and the (B,) number of valid frames.
+        """
+        audio = audio.to(self.device)
+        audio_lens = audio_lens.to(self.device).long()
+        audio = reflect_pad_batch(audio, audio_lens, self.n_fft // 2)
+        stft = torch.stft(
+            audio, self.n_fft, S3_HOP,
+            window=self.window.to(self.device),
+            center=False,
+            return_complex=True,
+        )
+        magnitudes = stft[..., :-1].abs()**2
+        mel_lens = audio_lens // S3_HOP
+        frame_mask = torch.arange(magnitudes.size(-1), device=self.device)[None, :] < mel_lens[:, None]
+
+        mel_spec = self._mel_filters.to(self.device) @ magnitudes
+
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        peak = log_spec.masked_fill(~frame_mask[:, None, :], float("-inf")).amax(dim=(1, 2), keepdim=True)
+        log_spec = torch.maximum(log_spec, peak - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+        return log_spec * frame_mask[:, None, :], mel_lens
+
     def log_mel_spectrogram(
         self,
         audio: torch.Tensor,
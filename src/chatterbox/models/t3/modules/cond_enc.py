@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+import copy
+import weakref
+from dataclasses import dataclass, fields
 from typing import Optional
 
 import torch
@@ -13,6 +15,12 @@ class T3Cond:
     """
     Dataclass container for most / all conditioning info.
     TODO: serialization methods aren't used, keeping them around for convenience
+
+    It also memoizes the conditioning embeddings computed from it (see
+    `T3.prepare_conditioning`), with the emotion token in its own slot.
+    Assigning `emotion_adv` (or calling `set_emotion_adv`) only clears that
+    slot; assigning any other field clears the whole memo. Fields must not
+    be modified in place.
     """
 
     speaker_emb: Tensor
@@ -21,16 +29,76 @@ class T3Cond:
     cond_prompt_speech_emb: Optional[Tensor] = None
     emotion_adv: Optional[Tensor] = 0.5
 
+    # Not dataclass fields:
+    # {"model": weakref, "voice": emb, "emotion": emb or None, "full": emb or None}
+    _cond_emb_cache = None
+    # host-side copy of `emotion_adv`, so comparing it never syncs the device
+    _emotion_adv_value = None
+
+    def __setattr__(self, name, value):
+        if name == "emotion_adv":
+            object.__setattr__(self, "_emotion_adv_value", None)
+            if self._cond_emb_cache is not None:
+                self._cond_emb_cache.update(emotion=None, full=None)
+        elif name not in ("_cond_emb_cache", "_emotion_adv_value"):
+            object.__setattr__(self, "_cond_emb_cache", None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def emotion_adv_value(self) -> Optional[float]:
+        "`emotion_adv` as a Python float (read from the device at most once)."
+        if self._emotion_adv_value is None and self.emotion_adv is not None:
+            v = self.emotion_adv
+            self._emotion_adv_value = float(v.view(-1)[0].item() if torch.is_tensor(v) else v)
+        return self._emotion_adv_value
+
+    def set_emotion_adv(self, value: float) -> bool:
+        """
+        Change the exaggeration in place of rebuilding the `T3Cond`, keeping
+        the memoized voice embeddings. Returns whether the value changed.
+        """
+        value = float(value)
+        if self.emotion_adv_value == value:
+            return False
+        if torch.is_tensor(self.emotion_adv):
+            self.emotion_adv = torch.full_like(self.emotion_adv, value)
+        else:
+            self.emotion_adv = value * torch.ones(1, 1, 1)
+        self._emotion_adv_value = value
+        return True
+
+    def cached_cond_emb(self, model) -> dict:
+        "Whatever parts of the conditioning `model` computed from these fields are still valid."
+        cache = self._cond_emb_cache
+        if cache is None or cache["model"]() is not model:
+            return {}
+        return cache
+
+    def cache_cond_emb(self, model, voice: Tensor, emotion: Tensor, full: Tensor):
+        self._cond_emb_cache = dict(model=weakref.ref(model), voice=voice, emotion=emotion, full=full)
+
+    def copy(self) -> "T3Cond":
+        "A copy whose fields and memo can change without touching this one (tensors are shared)."
+        new = copy.copy(self)
+        if self._cond_emb_cache is not None:
+            object.__setattr__(new, "_cond_emb_cache", dict(self._cond_emb_cache))
+        return new
+
     def to(self, *, device=None, dtype=None):
         "Cast to a device and dtype. Dtype casting is ignored for long/int tensors."
-        for k, v in self.__dict__.items():
+        for f in fields(self):
+            v = getattr(self, f.name)
             if torch.is_tensor(v):
                 is_fp = type(v.view(-1)[0].item()) is not int
-                setattr(self, k, v.to(device=device, dtype=dtype if is_fp else None))
+                setattr(self, f.name, v.to(device=device, dtype=dtype if is_fp else None))
         return self
 
+    def as_dict(self) -> dict:
+        "The dataclass fields, without the memoized embeddings (for saving)."
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
     def save(self, fpath):
-        torch.save(self.__dict__, fpath)
+        torch.save(self.as_dict(), fpath)
 
     @staticmethod
     def load(fpath, map_location="cpu"):
@@ -62,6 +130,11 @@ class T3CondEnc(nn.Module):
             self.perceiver = Perceiver()
 
     def forward(self, cond: T3Cond):
+        voice_emb = self.encode_voice(cond)
+        return torch.cat((voice_emb, self.encode_emotion(cond, voice_emb)), dim=1)
+
+    def encode_voice(self, cond: T3Cond):
+        """Speaker, CLAP and prompt conditioning: everything but the emotion token."""
         # Validate
         assert (cond.cond_prompt_speech_tokens is None) == (cond.cond_prompt_speech_emb is None), \
             "no embeddings for cond_prompt_speech_tokens"
@@ -81,17 +154,18 @@ class T3CondEnc(nn.Module):
         elif self.hp.use_perceiver_resampler:
             cond_prompt_speech_emb = self.perceiver(cond_prompt_speech_emb)
 
-        # Emotion Adv: must provide a value if this model uses emotion conditioning
-        cond_emotion_adv = empty  # (B, 0, dim)
-        if self.hp.emotion_adv:
-            assert cond.emotion_adv is not None
-            cond_emotion_adv = self.emotion_adv_fc(cond.emotion_adv.view(-1, 1, 1))
-
         # Concat and return
         cond_embeds = torch.cat((
             cond_spkr,
             cond_clap,
             cond_prompt_speech_emb,
-            cond_emotion_adv,
         ), dim=1)
         return cond_embeds
+
+    def encode_emotion(self, cond: T3Cond, voice_emb: Tensor):
+        """The emotion token, (B, 1, dim) -- or (B, 0, dim) if this model has none."""
+        # Emotion Adv: must provide a value if this model uses emotion conditioning
+        if not self.hp.emotion_adv:
+            return voice_emb[:, :0]
+        assert cond.emotion_adv is not None
+        return self.emotion_adv_fc(cond.emotion_adv.view(-1, 1, 1))
@@ -25,7 +25,8 @@ from .modules.t3_config import T3Config
 from .llama_configs import LLAMA_CONFIGS
 from .inference.t3_hf_backend import T3HuggingfaceBackend
 from .inference.alignment_stream_analyzer import AlignmentStreamAnalyzer
-from ..utils import AttrDict
+from ..utils import AttrDict, check_cancelled
+from ...profiling import report_progress, stage
 
 
 logger = logging.getLogger(__name__)
@@ -93,12 +94,28 @@ class T3(nn.Module):
     def prepare_conditioning(self, t3_cond: T3Cond):
         """
         Token cond data needs to be embedded, so that needs to be here instead of in `T3CondEnc`.
+
+        At inference the result only depends on the voice and exaggeration, so it
+        is memoized on `t3_cond`: repeated chunks skip the conditioning encoder,
+        and a new exaggeration only recomputes the emotion token.
         """
-        if t3_cond.cond_prompt_speech_tokens is not None and t3_cond.cond_prompt_speech_emb is None:
-            t3_cond.cond_prompt_speech_emb = self.speech_emb(t3_cond.cond_prompt_speech_tokens)
-            if not self.is_gpt:
-                t3_cond.cond_prompt_speech_emb += self.speech_pos_emb(t3_cond.cond_prompt_speech_tokens)
-        return self.cond_enc(t3_cond)  # (B, len_cond, dim)
+        memoize = not (self.training or torch.is_grad_enabled())
+        cache = t3_cond.cached_cond_emb(self) if memoize else {}
+        if cache.get("full") is not None:
+            return cache["full"]
+
+        voice_emb = cache.get("voice")
+        if voice_emb is None:
+            if t3_cond.cond_prompt_speech_tokens is not None and t3_cond.cond_prompt_speech_emb is None:
+                t3_cond.cond_prompt_speech_emb = self.speech_emb(t3_cond.cond_prompt_speech_tokens)
+                if not self.is_gpt:
+                    t3_cond.cond_prompt_speech_emb += self.speech_pos_emb(t3_cond.cond_prompt_speech_tokens)
+            voice_emb = self.cond_enc.encode_voice(t3_cond)
+        emotion_emb = self.cond_enc.encode_emotion(t3_cond, voice_emb)
+        cond_emb = torch.cat((voice_emb, emotion_emb), dim=1)  # (B, len_cond, dim)
+        if memoize:
+            t3_cond.cache_cond_emb(self, voice_emb, emotion_emb, cond_emb)
+        return cond_emb
 
     def prepare_input_embeds(
         self,
@@ -124,10 +141,7 @@ class T3(nn.Module):
              cond_emb = cond_emb.expand(text_emb.size(0), -1, -1)
 
         # concat
-        embeds = torch.stack([
-            torch.cat((ce, te, se))
-            for ce, te, se in zip(cond_emb, text_emb, speech_emb)
-        ])  # (B, length, dim)
+        embeds = torch.cat((cond_emb, text_emb, speech_emb), dim=1)  # (B, length, dim)
         return embeds, len_cond
 
     def forward(
@@ -245,10 +259,12 @@ class T3(nn.Module):
         length_penalty=1.0,
         repetition_penalty=1.2,
         cfg_weight=0.5,
+        cancel=None,
     ):
         """
         Args:
             text_tokens: a 1D (unbatched) or 2D (batched) tensor.
+            cancel: optional `CancellationToken`, checked before every sampling step.
         """
         # Validate / sanitize inputs
         assert prepend_prompt_speech_tokens is None, "not implemented"
@@ -260,12 +276,13 @@ class T3(nn.Module):
             initial_speech_tokens = self.hp.start_speech_token * torch.ones_like(text_tokens[:, :1])
 
         # Prepare custom input embeds
-        embeds, len_cond = self.prepare_input_embeds(
-            t3_cond=t3_cond,
-            text_tokens=text_tokens,
-            speech_tokens=initial_speech_tokens,
-            cfg_weight=cfg_weight,
-        )
+        with stage("t3_embeds"):
+            embeds, len_cond = self.prepare_input_embeds(
+                t3_cond=t3_cond,
+                text_tokens=text_tokens,
+                speech_tokens=initial_speech_tokens,
+                cfg_weight=cfg_weight,
+            )
 
         # In order to use the standard HF generate method, we need to extend some methods to inject our custom logic
         # Note the llama-specific logic. Other tfmr types can be added later.
@@ -326,9 +343,10 @@ class T3(nn.Module):
         # Combine condition and BOS token for the initial input
         inputs_embeds = torch.cat([embeds, bos_embed], dim=1)
 
-        # Track generated token ids; start with the BOS token.
-        generated_ids = bos_token.clone()
-        predicted = []  # To store the predicted tokens
+        # Token ids generated so far, preallocated up to the cap; starts with BOS.
+        max_new_tokens = max_new_tokens or self.hp.max_speech_tokens
+        generated_ids = bos_token.new_full((1, max_new_tokens + 1), self.hp.start_speech_token)
+        n_generated = 0
 
         # Instantiate the logits processors.
         top_p_warper = TopPLogitsWarper(top_p=top_p)
@@ -337,19 +355,22 @@ class T3(nn.Module):
         repetition_penalty_processor = RepetitionPenaltyLogitsProcessor(penalty=float(repetition_penalty))
 
         # ---- Initial Forward Pass (no kv_cache yet) ----
-        output = self.patched_model(
-            inputs_embeds=inputs_embeds,
-            past_key_values=None,
-            use_cache=True,
-            output_attentions=True,
-            output_hidden_states=True,
-            return_dict=True,
-        )
+        with stage("t3_prefill", length=inputs_embeds.size(1)):
+            output = self.patched_model(
+                inputs_embeds=inputs_embeds,
+                past_key_values=None,
+                use_cache=True,
+                output_attentions=True,
+                output_hidden_states=True,
+                return_dict=True,
+            )
         # Initialize kv_cache with the full context.
         past = output.past_key_values
 
         # ---- Generation Loop using kv_cache ----
+        decode_stage = stage("t3_decode")
         for i in tqdm(range(max_new_tokens), desc="Sampling", dynamic_ncols=True):
+            check_cancelled(cancel)
             logits_step = output.logits[:, -1, :]
             # CFG combine  → (1, V)
             cond   = logits_step[0:1, :]
@@ -362,11 +383,11 @@ class T3(nn.Module):
                 if logits.dim() == 1:            # guard in case something upstream squeezed
                     logits = logits.unsqueeze(0) # (1, V)
                 # Pass the last generated token for repetition tracking
-                last_token = generated_ids[0, -1].item() if len(generated_ids[0]) > 0 else None
+                last_token = generated_ids[0, n_generated].item()
                 logits = self.patched_model.alignment_stream_analyzer.step(logits, next_token=last_token)  # (1, V)
 
             # Apply repetition penalty
-            ids_for_proc = generated_ids[:1, ...]   # batch = 1
+            ids_for_proc = generated_ids[:1, :n_generated + 1]   # batch = 1
             logits = repetition_penalty_processor(ids_for_proc, logits)  # expects (B,V)
             
             # Apply temperature scaling.
@@ -381,8 +402,9 @@ class T3(nn.Module):
             probs = torch.softmax(logits, dim=-1)
             next_token = torch.multinomial(probs, num_samples=1)  # shape: (B, 1)
 
-            predicted.append(next_token)
-            generated_ids = torch.cat([generated_ids, next_token], dim=1)
+            n_generated += 1
+            generated_ids[:, n_generated] = next_token.view(-1)
+            report_progress("t3", n_generated, max_new_tokens)
 
             # Check for EOS token.
             if next_token.view(-1) == self.hp.stop_speech_token:
@@ -407,13 +429,15 @@ class T3(nn.Module):
             # Update the kv_cache.
             past = output.past_key_values
 
-        # Concatenate all predicted tokens along the sequence dimension.
-        predicted_tokens = torch.cat(predicted, dim=1)  # shape: (B, num_tokens)
+        decode_stage.end(tokens=n_generated)
+
+        # All predicted tokens, without the leading BOS.
+        predicted_tokens = generated_ids[:, 1:n_generated + 1]  # shape: (B, num_tokens)
         return predicted_tokens
 
     @torch.inference_mode()
     def inference_turbo(self, t3_cond, text_tokens, temperature=0.8, top_k=1000, top_p=0.95, repetition_penalty=1.2,
-                        max_gen_len=1000):
+                        max_gen_len=1000, cancel=None):
 
         logits_processors = LogitsProcessorList()
         if temperature > 0 and temperature != 1.0:
@@ -427,19 +451,23 @@ class T3(nn.Module):
 
 
         speech_start_token = self.hp.start_speech_token * torch.ones_like(text_tokens[:, :1])
-        embeds, _ = self.prepare_input_embeds(
-            t3_cond=t3_cond,
-            text_tokens=text_tokens,
-            speech_tokens=speech_start_token,
-            cfg_weight=0.0,
-        )
+        with stage("t3_embeds"):
+            embeds, _ = self.prepare_input_embeds(
+                t3_cond=t3_cond,
+                text_tokens=text_tokens,
+                speech_tokens=speech_start_token,
+                cfg_weight=0.0,
+            )
 
-        generated_speech_tokens = []
+        # Preallocated up to the cap instead of re-concatenating every step
+        generated_speech_tokens = text_tokens.new_empty((text_tokens.size(0), max_gen_len + 1))
+        n_generated = 0
 
-        llm_outputs = self.tfmr(
-            inputs_embeds=embeds,
-            use_cache=True
-        )
+        with stage("t3_prefill", length=embeds.size(1)):
+            llm_outputs = self.tfmr(
+                inputs_embeds=embeds,
+                use_cache=True
+            )
 
         hidden_states = llm_outputs[0]
         past_key_values = llm_outputs.past_key_values
@@ -451,10 +479,13 @@ class T3(nn.Module):
         probs = F.softmax(processed_logits, dim=-1)
         next_speech_token = torch.multinomial(probs, num_samples=1)
 
-        generated_speech_tokens.append(next_speech_token)
+        generated_speech_tokens[:, n_generated] = next_speech_token[:, 0]
+        n_generated += 1
         current_speech_token = next_speech_token
 
+        decode_stage = stage("t3_decode")
         for _ in tqdm(range(max_gen_len)):
+            check_cancelled(cancel)
             current_speech_embed = self.speech_emb(current_speech_token)
 
             llm_outputs = self.tfmr(
@@ -467,7 +498,7 @@ class T3(nn.Module):
             past_key_values = llm_outputs.past_key_values
             speech_logits = self.speech_head(hidden_states)
 
-            input_ids = torch.cat(generated_speech_tokens, dim=1)
+            input_ids = generated_speech_tokens[:, :n_generated]
             processed_logits = logits_processors(input_ids, speech_logits[:, -1, :])
             if torch.all(processed_logits == -float("inf")):
                 print("Warning: All logits are -inf")
@@ -476,12 +507,15 @@ class T3(nn.Module):
             probs = F.softmax(processed_logits, dim=-1)
             next_speech_token = torch.multinomial(probs, num_samples=1)
 
-            generated_speech_tokens.append(next_speech_token)
+            generated_speech_tokens[:, n_generated] = next_speech_token[:, 0]
+            n_generated += 1
+            report_progress("t3", n_generated, max_gen_len)
             current_speech_token = next_speech_token
             if torch.all(next_speech_token == self.hp.stop_speech_token):
                 break
+        decode_stage.end(tokens=n_generated)
 
-        all_tokens = torch.cat(generated_speech_tokens, dim=1)
+        all_tokens = generated_speech_tokens[:, :n_generated]
 
         # Remove EOS token if present
         if all_tokens.size(1) > 0 and all_tokens[0, -1] == self.hp.stop_speech_token:
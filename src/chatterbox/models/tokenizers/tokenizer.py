@@ -1,6 +1,12 @@
+import hashlib
 import logging
 import json
+import os
+import re
+import threading
+from collections import OrderedDict
 
+import numpy as np
 import torch
 from pathlib import Path
 from unicodedata import category, normalize
@@ -56,11 +62,71 @@ class EnTokenizer:
 # Model repository
 REPO_ID = "ResembleAI/chatterbox"
 
-# Global instances for optional dependencies
+# Where compiled lookup tables are kept, outside the (possibly read-only)
+# HuggingFace snapshot
+CANGJIE_CACHE_DIR = os.environ.get(
+    "CHATTERBOX_CACHE_DIR",
+    str(Path.home() / ".cache" / "chatterbox"),
+)
+
+# Global instances for optional dependencies (False once found missing)
 _kakasi = None
 _dicta = None
 _russian_stresser = None
 
+# Normalized words remembered per tokenizer
+WORD_CACHE_SIZE = 4096
+
+# Whitespace and sentence punctuation: the normalizers treat both as word
+# boundaries, so text can be normalized piece by piece
+_WORD_BOUNDARY = re.compile(r"(\s+|[、。，！？；：,.!?;:]+)")
+
+
+class _LRUCache:
+    """Bounded LRU map, safe to share between threads; `maxsize=0` disables it."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _memoize_words(cache, normalizer, text, key=None):
+    """
+    `normalizer` applied to each non-blank piece of `text` between word
+    boundaries, looked up in `cache` first (under `(key, piece)`).
+    """
+    out = []
+    for piece in _WORD_BOUNDARY.split(text):
+        if not piece or piece.isspace():
+            out.append(piece)
+            continue
+        value = cache.get((key, piece))
+        if value is None:
+            value = normalizer(piece)
+            cache.put((key, piece), value)
+        out.append(value)
+    return "".join(out)
+
 
 def is_kanji(c: str) -> bool:
     """Check if character is kanji."""
@@ -75,7 +141,9 @@ def is_katakana(c: str) -> bool:
 def hiragana_normalize(text: str) -> str:
     """Japanese text normalization: converts kanji to hiragana; katakana remains the same."""
     global _kakasi
-    
+
+    if _kakasi is False:
+        return text
     try:
         if _kakasi is None:
             import pykakasi
@@ -111,6 +179,7 @@ def hiragana_normalize(text: str) -> str:
         
     except ImportError:
         logger.warning("pykakasi not available - Japanese text processing skipped")
+        _kakasi = False
         return text
 
 
@@ -154,90 +223,143 @@ def korean_normalize(text: str) -> str:
     return result.strip()
 
 
+def _compile_cangjie_table(json_path) -> np.ndarray:
+    """
+    Turn `Cangjie5_TC.json` into a dense table indexed by code point whose
+    entries are the glyph's Cangjie code plus its disambiguation index
+    (empty bytes for glyphs without a code).
+    """
+    with open(json_path, "r", encoding="utf-8") as fp:
+        data = json.load(fp)
+
+    word2cj, cj2word = {}, {}
+    for entry in data:
+        word, code = entry.split("\t")[:2]
+        word2cj[word] = code
+        cj2word.setdefault(code, []).append(word)
+
+    encoded = {}
+    for word, code in word2cj.items():
+        if len(word) != 1:
+            continue  # lookups are per glyph
+        index = cj2word[code].index(word)
+        encoded[ord(word)] = (code + (str(index) if index > 0 else "")).encode("utf-8")
+
+    width = max(len(v) for v in encoded.values())
+    table = np.zeros(max(encoded) + 1, dtype=f"S{width}")
+    for cp, value in encoded.items():
+        table[cp] = value
+    return table
+
+
 class ChineseCangjieConverter:
     """Converts Chinese characters to Cangjie codes for tokenization."""
-    
-    def __init__(self, model_dir=None):
-        self.word2cj = {}
-        self.cj2word = {}
-        self.segmenter = None
+
+    TABLE_FILE = "Cangjie5_TC.npy"
+
+    def __init__(self, model_dir=None, cache_size: int = WORD_CACHE_SIZE):
+        self.model_dir = model_dir
+        self.table = None
+        self._segmenter = None
+        self._segmenter_loaded = False
+        self._glyph_cache = {}
+        self._word_cache = _LRUCache(cache_size)
         self._load_cangjie_mapping(model_dir)
-        self._init_segmenter()
-    
+
     def _load_cangjie_mapping(self, model_dir=None):
-        """Load Cangjie mapping from HuggingFace model repository."""        
+        """
+        Memory-map the table compiled from the HuggingFace JSON. Compiled
+        tables live in CANGJIE_CACHE_DIR, named after the JSON's sha1, so an
+        updated mapping gets a new table; if that directory isn't writable the
+        table is compiled and kept in memory.
+        """
         try:
             cangjie_file = hf_hub_download(
                 repo_id=REPO_ID,
                 filename="Cangjie5_TC.json",
                 cache_dir=model_dir
             )
-            
-            with open(cangjie_file, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-            
-            for entry in data:
-                word, code = entry.split("\t")[:2]
-                self.word2cj[word] = code
-                if code not in self.cj2word:
-                    self.cj2word[code] = [word]
-                else:
-                    self.cj2word[code].append(word)
-                    
+            with open(cangjie_file, "rb") as fp:
+                digest = hashlib.sha1(fp.read()).hexdigest()
+            table_file = Path(CANGJIE_CACHE_DIR) / f"{Path(self.TABLE_FILE).stem}.{digest[:16]}.npy"
+            if table_file.exists():
+                try:
+                    self.table = np.load(table_file, mmap_mode="r")
+                    return
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Rebuilding unreadable Cangjie table {table_file}: {e}")
+
+            table = _compile_cangjie_table(cangjie_file)
+            try:
+                table_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp = table_file.with_suffix(f".{os.getpid()}.tmp.npy")
+                np.save(tmp, table)
+                os.replace(tmp, table_file)
+                table = np.load(table_file, mmap_mode="r")
+            except OSError as e:
+                logger.warning(f"Could not cache compiled Cangjie table, keeping it in memory: {e}")
+            self.table = table
+
         except Exception as e:
             logger.warning(f"Could not load Cangjie mapping: {e}")
-    
-    def _init_segmenter(self):
-        """Initialize pkuseg segmenter."""
-        try:
-            from spacy_pkuseg import pkuseg
-            self.segmenter = pkuseg()
-        except ImportError:
-            logger.warning("pkuseg not available - Chinese segmentation will be skipped")
-            self.segmenter = None
-    
+
+    @property
+    def segmenter(self):
+        """pkuseg segmenter, initialized on first use."""
+        if not self._segmenter_loaded:
+            self._segmenter_loaded = True
+            try:
+                from spacy_pkuseg import pkuseg
+                self._segmenter = pkuseg()
+            except ImportError:
+                logger.warning("pkuseg not available - Chinese segmentation will be skipped")
+        return self._segmenter
+
     def _cangjie_encode(self, glyph: str):
         """Encode a single Chinese glyph to Cangjie code."""
-        normed_glyph = glyph
-        code = self.word2cj.get(normed_glyph, None)
-        if code is None:  # e.g. Japanese hiragana
+        cp = ord(glyph)
+        if self.table is None or cp >= len(self.table):
             return None
-        index = self.cj2word[code].index(normed_glyph)
-        index = str(index) if index > 0 else ""
-        return code + str(index)
-    
+        code = self.table[cp]
+        if not code:  # e.g. Japanese hiragana
+            return None
+        return code.decode("utf-8")
+
+    def _glyph_tokens(self, glyph: str) -> str:
+        """Token string for one character; memoized since text reuses a small set of glyphs."""
+        tokens = self._glyph_cache.get(glyph)
+        if tokens is None:
+            cangjie = self._cangjie_encode(glyph) if category(glyph) == "Lo" else None
+            if cangjie is None:
+                tokens = glyph
+            else:
+                tokens = "".join(f"[cj_{c}]" for c in cangjie) + "[cj_.]"
+            self._glyph_cache[glyph] = tokens
+        return tokens
+
+    def _word_tokens(self, word: str) -> str:
+        return "".join(self._glyph_tokens(t) for t in word)
 
-    
     def __call__(self, text):
-        """Convert Chinese characters in text to Cangjie tokens."""
-        output = []
-        if self.segmenter is not None:
-            segmented_words = self.segmenter.cut(text)
-            full_text = " ".join(segmented_words)
-        else:
-            full_text = text
-        
-        for t in full_text:
-            if category(t) == "Lo":
-                cangjie = self._cangjie_encode(t)
-                if cangjie is None:
-                    output.append(t)
-                    continue
-                code = []
-                for c in cangjie:
-                    code.append(f"[cj_{c}]")
-                code.append("[cj_.]")
-                code = "".join(code)
-                output.append(code)
-            else:
-                output.append(t)
-        return "".join(output)
+        """Convert Chinese characters in text to Cangjie tokens, memoized per word."""
+        if self.segmenter is None:
+            return _memoize_words(self._word_cache, self._word_tokens, text)
+        out = []
+        for word in self.segmenter.cut(text):
+            tokens = self._word_cache.get(word)
+            if tokens is None:
+                tokens = self._word_tokens(word)
+                self._word_cache.put(word, tokens)
+            out.append(tokens)
+        return " ".join(out)
 
 
 def add_russian_stress(text: str) -> str:
     """Russian text normalization: adds stress marks to Russian text."""
     global _russian_stresser
-    
+
+    if _russian_stresser is False:
+        return text
     try:
         if _russian_stresser is None:
             from russian_text_stresser.text_stresser import RussianTextStresser
@@ -247,6 +369,7 @@ def add_russian_stress(text: str) -> str:
         
     except ImportError:
         logger.warning("russian_text_stresser not available - Russian stress labeling skipped")
+        _russian_stresser = False
         return text
     except Exception as e:
         logger.warning(f"Russian stress labeling failed: {e}")
@@ -254,12 +377,25 @@ def add_russian_stress(text: str) -> str:
 
 
 class MTLTokenizer:
-    def __init__(self, vocab_file_path):
+    def __init__(self, vocab_file_path, cache_size: int = WORD_CACHE_SIZE):
         self.tokenizer: Tokenizer = Tokenizer.from_file(vocab_file_path)
-        model_dir = Path(vocab_file_path).parent
-        self.cangjie_converter = ChineseCangjieConverter(model_dir)
+        self.model_dir = Path(vocab_file_path).parent
+        self._cangjie_converter = None
         self.check_vocabset_sot_eot()
 
+        # The language normalizers (pykakasi, the Russian stresser, Korean
+        # decomposition, Cangjie) dominate encode time and long documents
+        # keep reusing words, so their output is memoized per word.
+        self.cache_size = cache_size
+        self._word_cache = _LRUCache(cache_size)
+
+    @property
+    def cangjie_converter(self):
+        """Built on first Chinese input; the mapping download and pkuseg are too costly for other languages."""
+        if self._cangjie_converter is None:
+            self._cangjie_converter = ChineseCangjieConverter(self.model_dir, cache_size=self.cache_size)
+        return self._cangjie_converter
+
     def check_vocabset_sot_eot(self):
         voc = self.tokenizer.get_vocab()
         assert SOT in voc
@@ -282,27 +418,57 @@ class MTLTokenizer:
         text_tokens = torch.IntTensor(text_tokens).unsqueeze(0)
         return text_tokens
 
+    def text_to_tokens_batch(self, texts, language_id: str = None, lowercase: bool = True, nfkd_normalize: bool = True, pad_id: int = None):
+        """
+        Tokenize a list of chunks into a right-padded (B, T) IntTensor plus
+        their (B,) lengths. Padding uses `[PAD]` unless `pad_id` is given.
+        """
+        ids = self.encode_batch(texts, language_id=language_id, lowercase=lowercase, nfkd_normalize=nfkd_normalize)
+        if pad_id is None:
+            pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        lengths = torch.IntTensor([len(x) for x in ids])
+        text_tokens = torch.full((len(ids), int(lengths.max()) if ids else 0), pad_id, dtype=torch.int32)
+        for i, x in enumerate(ids):
+            text_tokens[i, :len(x)] = torch.IntTensor(x)
+        return text_tokens, lengths
+
     def encode(self, txt: str, language_id: str = None, lowercase: bool = True, nfkd_normalize: bool = True):
+        return self.encode_batch([txt], language_id=language_id, lowercase=lowercase, nfkd_normalize=nfkd_normalize)[0]
+
+    def encode_batch(self, texts, language_id: str = None, lowercase: bool = True, nfkd_normalize: bool = True):
+        """
+        Encode several chunks, sending the distinct ones through a single
+        `Tokenizer.encode_batch` call. Returns a list of id lists.
+        """
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return []
+        prepared = [self._normalize(txt, language_id, lowercase, nfkd_normalize) for txt in unique]
+        codes = self.tokenizer.encode_batch(prepared) if len(prepared) > 1 else [self.tokenizer.encode(prepared[0])]
+        ids = {txt: code.ids for txt, code in zip(unique, codes)}
+        return [list(ids[txt]) for txt in texts]
+
+    def _normalize(self, txt: str, language_id: str = None, lowercase: bool = True, nfkd_normalize: bool = True):
+        """Full preprocessing chain up to the string handed to the BPE tokenizer."""
         txt = self.preprocess_text(txt, language_id=language_id, lowercase=lowercase, nfkd_normalize=nfkd_normalize)
         
         # Language-specific text processing
         if language_id == 'zh':
             txt = self.cangjie_converter(txt)
         elif language_id == 'ja':
-            txt = hiragana_normalize(txt)
+            txt = _memoize_words(self._word_cache, hiragana_normalize, txt, key='ja')
         elif language_id == 'he':
             txt = add_hebrew_diacritics(txt)
         elif language_id == 'ko':
-            txt = korean_normalize(txt)
+            txt = _memoize_words(self._word_cache, korean_normalize, txt, key='ko').strip()
         elif language_id == 'ru':
-            txt = add_russian_stress(txt)
+            txt = _memoize_words(self._word_cache, add_russian_stress, txt, key='ru')
         
         # Prepend language token
         if language_id:
             txt = f"[{language_id.lower()}]{txt}"
         
-        txt = txt.replace(' ', SPACE)
-        return self.tokenizer.encode(txt).ids
+        return txt.replace(' ', SPACE)
 
     def decode(self, seq):
         if isinstance(seq, torch.Tensor):
@@ -1,4 +1,93 @@
+import threading
+import time
+from collections import Counter
+
+import torch
+
+
 class AttrDict(dict):
     def __init__(self, *args, **kwargs):
         super(AttrDict, self).__init__(*args, **kwargs)
         self.__dict__ = self
+
+
+def reflect_pad_batch(wavs: torch.Tensor, wav_lens: torch.Tensor, pad: int):
+    """
+    Reflect-pad each row of a right-padded (B, L) batch by `pad` samples on
+    both sides of its *own* length, as `np.pad(mode="reflect")` would, so a
+    short clip never reflects the zero padding of the batch. Samples past
+    `wav_lens + 2 * pad` are zero.
+    """
+    B, L = wavs.shape
+    lens = wav_lens.to(wavs.device).long().unsqueeze(1)  # (B, 1)
+    pos = torch.arange(L + 2 * pad, device=wavs.device).unsqueeze(0) - pad  # (1, L')
+    idx = pos.abs()
+    idx = torch.where(idx >= lens, 2 * (lens - 1) - idx, idx)
+    valid = pos < lens + pad
+    idx = idx.clamp(0, L - 1)
+    return torch.gather(wavs, 1, idx.expand(B, -1)) * valid
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised from inside a generation loop once its `CancellationToken` has fired."""
+
+    def __init__(self, reason="cancelled"):
+        super().__init__(f"Generation {reason}")
+        self.reason = reason
+
+
+_cancellation_counts = Counter()
+_cancellation_lock = threading.Lock()
+
+
+def cancellation_counts() -> dict:
+    """Generations abandoned so far in this process, by reason ("cancelled" / "deadline")."""
+    with _cancellation_lock:
+        return dict(_cancellation_counts)
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation for one generation. The sampling and ODE loops
+    call `check()` once per step, so work is abandoned within one step of
+    `cancel()` being called (from any thread) or the deadline passing.
+    """
+
+    def __init__(self, timeout: float = None, deadline: float = None):
+        """
+        :param timeout: seconds from now after which the generation is abandoned.
+        :param deadline: absolute `time.monotonic()` deadline (overrides `timeout`).
+        """
+        if deadline is None and timeout is not None:
+            deadline = time.monotonic() + timeout
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+        self._counted = False
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def check(self):
+        """Raise `GenerationCancelled` if the token has fired; counted once per token."""
+        if not self.cancelled:
+            return
+        with _cancellation_lock:
+            if not self._counted:
+                self._counted = True
+                _cancellation_counts[self.reason] += 1
+        raise GenerationCancelled(self.reason)
+
+
+def check_cancelled(cancel: "CancellationToken" = None):
+    """`cancel.check()`, for the loops where the token is optional."""
+    if cancel is not None:
+        cancel.check()
@@ -3,6 +3,10 @@ from functools import lru_cache
 from scipy import signal
 import numpy as np
 import librosa
+import torch
+import torch.nn.functional as F
+
+from ..utils import reflect_pad_batch
 
 
 @lru_cache()
@@ -76,3 +80,95 @@ def _normalize(s, hp, headroom_db=15):
     min_level_db = 20 * np.log10(hp.stft_magnitude_min)
     s = (s - min_level_db) / (-min_level_db + headroom_db)
     return s
+
+
+# ---------------------------------------------------------------------------
+# Batched torch front end. Mirrors `melspectrogram` / librosa's `effects.trim`
+# but runs on the model device over a padded (B, L) batch of waveforms.
+# ---------------------------------------------------------------------------
+
+@lru_cache()
+def mel_basis_torch(hp, device):
+    return torch.from_numpy(mel_basis(hp)).float().to(device)
+
+
+@lru_cache()
+def hann_window_torch(win_size, device):
+    # librosa's "hann" is the periodic (fftbins=True) window, same as torch's default
+    return torch.hann_window(win_size, device=device)
+
+
+def melspectrogram_batch(wavs: torch.Tensor, wav_lens: torch.Tensor, hp, pad=True):
+    """
+    Torch equivalent of `melspectrogram` for a right-padded (B, L) batch.
+
+    :return: (mels, mel_lens) with mels as (B, T, M) - frames past each
+        item's length are zeroed - and mel_lens as a (B,) long tensor.
+    """
+    device = wavs.device
+    wav_lens = wav_lens.to(device).long()
+
+    if hp.preemphasis > 0:
+        wavs = torch.cat([wavs[:, :1], wavs[:, 1:] - hp.preemphasis * wavs[:, :-1]], dim=1).clamp(-1, 1)
+
+    if pad:
+        wavs = reflect_pad_batch(wavs, wav_lens, hp.n_fft // 2)
+        mel_lens = 1 + wav_lens // hp.hop_size
+    else:
+        mel_lens = 1 + (wav_lens - hp.n_fft) // hp.hop_size
+
+    spec = torch.stft(
+        wavs,
+        n_fft=hp.n_fft,
+        hop_length=hp.hop_size,
+        win_length=hp.win_size,
+        window=hann_window_torch(hp.win_size, device),
+        center=False,
+        return_complex=True,
+    ).abs()
+    if hp.mel_power != 1.0:
+        spec = spec ** hp.mel_power
+
+    mel = mel_basis_torch(hp, device) @ spec  # (B, M, T)
+    if hp.mel_type == "db":
+        mel = 20 * torch.log10(torch.clamp(mel, min=hp.stft_magnitude_min))
+    if hp.normalized_mels:
+        min_level_db = 20 * np.log10(hp.stft_magnitude_min)
+        mel = (mel - min_level_db) / (-min_level_db + 15)
+
+    mel = mel.transpose(1, 2)
+    frame_mask = torch.arange(mel.size(1), device=device)[None, :] < mel_lens[:, None]
+    return mel * frame_mask[..., None], mel_lens
+
+
+def trim_bounds_batch(wavs: torch.Tensor, wav_lens: torch.Tensor, top_db=20, frame_length=2048, hop_length=512):
+    """
+    Per-item (start, end) sample bounds matching `librosa.effects.trim` with
+    its default framing: frames whose RMS is within `top_db` of the loudest
+    frame of the same clip are kept.
+    """
+    device = wavs.device
+    wav_lens = wav_lens.to(device).long()
+    half = frame_length // 2
+
+    # librosa.feature.rms(center=True) pads with zeros; so does the batch
+    y = F.pad(wavs, (half, half))
+    frames = y.unfold(1, frame_length, hop_length)  # (B, n_frames, frame_length)
+    power = frames.pow(2).mean(dim=-1)  # rms ** 2
+    n_frames = 1 + wav_lens // hop_length
+    frame_ok = torch.arange(power.size(1), device=device)[None, :] < n_frames[:, None]
+
+    amin = 1e-10
+    db = 10 * torch.log10(power.clamp(min=amin))
+    ref = torch.where(frame_ok, power, torch.zeros_like(power)).amax(dim=1, keepdim=True)
+    db = db - 10 * torch.log10(ref.clamp(min=amin))
+    non_silent = (db > -top_db) & frame_ok
+
+    idx = torch.arange(power.size(1), device=device)[None, :].expand_as(non_silent)
+    any_voiced = non_silent.any(dim=1)
+    first = torch.where(non_silent, idx, torch.full_like(idx, power.size(1))).amin(dim=1)
+    last = torch.where(non_silent, idx, torch.full_like(idx, -1)).amax(dim=1)
+
+    start = torch.where(any_voiced, first * hop_length, torch.zeros_like(first))
+    end = torch.where(any_voiced, torch.minimum(wav_lens, (last + 1) * hop_length), torch.zeros_like(last))
+    return start, end
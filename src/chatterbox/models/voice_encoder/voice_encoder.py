@@ -4,13 +4,12 @@ from typing import List, Union, Optional
 
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
-import librosa
 import torch
 import torch.nn.functional as F
 from torch import nn, Tensor
 
 from .config import VoiceEncConfig
-from .melspec import melspectrogram
+from .melspec import melspectrogram_batch, trim_bounds_batch
 
 
 def pack(arrays, seq_len: int=None, pad_value=0):
@@ -164,7 +163,7 @@ class VoiceEncoder(nn.Module):
         Computes the embeddings of a batch of full utterances with gradients.
 
         :param mels: (B, T, M) unscaled mels
-        :return: (B, E) embeddings on CPU
+        :return: (B, E) embeddings on the same device as `mels`
         """
         mel_lens = mel_lens.tolist() if torch.is_tensor(mel_lens) else mel_lens
 
@@ -175,25 +174,22 @@ class VoiceEncoder(nn.Module):
         # Possibly pad the mels to reach the target lengths
         len_diff = max(target_lens) - mels.size(1)
         if len_diff > 0:
-            pad = torch.full((mels.size(0), len_diff, self.hp.num_mels), 0, dtype=torch.float32)
-            mels = torch.cat((mels, pad.to(mels.device)), dim=1)
+            mels = F.pad(mels, (0, 0, 0, len_diff))
 
-        # Group all partials together so that we can batch them easily
-        partials = [
-            mel[i * frame_step: i * frame_step + self.hp.ve_partial_frames]
-            for mel, n_partial in zip(mels, n_partials) for i in range(n_partial)
-        ]
-        assert all(partials[0].shape == partial.shape for partial in partials)
-        partials = torch.stack(partials)
+        # Strided (B, W, P, M) view of every window, then keep each item's first n_partials
+        windows = mels.unfold(1, self.hp.ve_partial_frames, frame_step).transpose(2, 3)
+        n_partials = torch.tensor(n_partials, device=mels.device)
+        keep = torch.arange(windows.size(1), device=mels.device)[None, :] < n_partials[:, None]
+        partials = windows[keep]
 
         # Forward the partials
         n_chunks = int(np.ceil(len(partials) / (batch_size or len(partials))))
-        partial_embeds = torch.cat([self(batch) for batch in partials.chunk(n_chunks)], dim=0).cpu()
+        partial_embeds = torch.cat([self(batch) for batch in partials.chunk(n_chunks)], dim=0)
 
         # Reduce the partial embeds into full embeds and L2-normalize them
-        slices = np.concatenate(([0], np.cumsum(n_partials)))
-        raw_embeds = [torch.mean(partial_embeds[start:end], dim=0) for start, end in zip(slices[:-1], slices[1:])]
-        raw_embeds = torch.stack(raw_embeds)
+        owner = torch.repeat_interleave(torch.arange(len(n_partials), device=mels.device), n_partials)
+        raw_embeds = torch.zeros(len(n_partials), partial_embeds.size(1), device=mels.device, dtype=partial_embeds.dtype)
+        raw_embeds = raw_embeds.index_add_(0, owner, partial_embeds) / n_partials[:, None]
         embeds = raw_embeds / torch.linalg.norm(raw_embeds, dim=1, keepdim=True)
 
         return embeds
@@ -239,36 +235,78 @@ class VoiceEncoder(nn.Module):
 
         # Embed them
         with torch.inference_mode():
-            utt_embeds = self.inference(mels.to(self.device), mel_lens, batch_size=batch_size, **kwargs).numpy()
+            utt_embeds = self.inference(mels.to(self.device), mel_lens, batch_size=batch_size, **kwargs).cpu().numpy()
 
         return self.utt_to_spk_embed(utt_embeds) if as_spk else utt_embeds
 
-    def embeds_from_wavs(
+    def embed_wavs(
         self,
-        wavs: List[np.ndarray],
+        wavs: Union[Tensor, List[Union[Tensor, np.ndarray]]],
         sample_rate,
-        as_spk=False,
-        batch_size=32,
+        wav_lens=None,
         trim_top_db: Optional[float]=20,
+        batch_size=None,
         **kwargs
-    ):
+    ) -> Tensor:
         """
-        Wrapper around embeds_from_mels
+        Batched utterance embeddings, computed end to end on the model device.
 
-        :param trim_top_db: this argument was only added for the sake of compatibility with metavoice's implementation
+        :param wavs: a list of 1D waveforms, or a right-padded (B, L) tensor with `wav_lens`
+        :param trim_top_db: silence trimming threshold, as in `librosa.effects.trim`
+        :param kwargs: args for inference()
+        :returns: (B, E) L2-normalized embeddings on the model device
         """
-        if sample_rate != self.hp.sample_rate:
-            wavs = [
-                librosa.resample(wav, orig_sr=sample_rate, target_sr=self.hp.sample_rate, res_type="kaiser_fast")
-                for wav in wavs
-            ]
+        device = self.device
+        if isinstance(wavs, (list, tuple)):
+            wavs = [torch.as_tensor(w, dtype=torch.float32).reshape(-1).to(device) for w in wavs]
+            if sample_rate != self.hp.sample_rate:
+                from ..audio_ingest import resample
+                wavs = [resample(w[None], sample_rate, self.hp.sample_rate, device)[0] for w in wavs]
+            wav_lens = torch.tensor([len(w) for w in wavs], device=device)
+            wavs = pack(wavs)
+        else:
+            wavs = torch.atleast_2d(wavs).float().to(device)
+            if wav_lens is None:
+                wav_lens = torch.full((wavs.size(0),), wavs.size(1), device=device)
+            wav_lens = torch.as_tensor(wav_lens, device=device).long()
+            if sample_rate != self.hp.sample_rate:
+                from ..audio_ingest import resample
+                ratio = self.hp.sample_rate / sample_rate
+                wavs = resample(wavs, sample_rate, self.hp.sample_rate, device)
+                wav_lens = torch.ceil(wav_lens * ratio).long().clamp(max=wavs.size(1))
 
         if trim_top_db:
-            wavs = [librosa.effects.trim(wav, top_db=trim_top_db)[0] for wav in wavs]
+            start, end = trim_bounds_batch(wavs, wav_lens, top_db=trim_top_db)
+            # Shift every row left by its own start offset with one gather
+            shift = torch.arange(wavs.size(1), device=device)[None, :] + start[:, None]
+            wavs = torch.gather(wavs, 1, shift.clamp(max=wavs.size(1) - 1))
+            wav_lens = end - start
+            wavs = wavs * (torch.arange(wavs.size(1), device=device)[None, :] < wav_lens[:, None])
 
         if "rate" not in kwargs:
             kwargs["rate"] = 1.3  # Resemble's default value.
 
-        mels = [melspectrogram(w, self.hp).T for w in wavs]
+        mels, mel_lens = melspectrogram_batch(wavs, wav_lens, self.hp)
+        mels = mels[:, :int(mel_lens.max())]
+        with torch.inference_mode():
+            return self.inference(mels, mel_lens, batch_size=batch_size, **kwargs)
 
-        return self.embeds_from_mels(mels, as_spk=as_spk, batch_size=batch_size, **kwargs)
+    def embeds_from_wavs(
+        self,
+        wavs: List[np.ndarray],
+        sample_rate,
+        as_spk=False,
+        batch_size=32,
+        trim_top_db: Optional[float]=20,
+        **kwargs
+    ):
+        """
+        Wrapper around embed_wavs returning numpy arrays
+
+        :param trim_top_db: this argument was only added for the sake of compatibility with metavoice's implementation
+        """
+        utt_embeds = self.embed_wavs(
+            wavs, sample_rate, trim_top_db=trim_top_db, batch_size=batch_size, **kwargs
+        ).cpu().numpy()
+
+        return self.utt_to_spk_embed(utt_embeds) if as_spk else utt_embeds
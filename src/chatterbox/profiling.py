@@ -0,0 +1,426 @@
+"""
+Per-stage profiling of the pipelines' `generate` calls.
+
+Every `generate` runs inside a `GenerationProfile` (see `profiled`). Code on
+the way -- T3, S3Gen, the watermarker -- marks its stages with `stage(name)`,
+which does nothing when no profile is active. A finished profile is kept on
+the pipeline as `last_profile`, can be returned with `return_profile=True`,
+and is handed to every registered sink:
+
+- `LoggingSink`: one summary line per call
+- `PrometheusSink`: cumulative per-stage counters, in Prometheus text format
+  (optionally rewritten to a node_exporter textfile after every call)
+- `ChromeTraceSink`: one trace event per line, loadable in chrome://tracing
+  or Perfetto
+
+Sinks can also be enabled with the environment variables
+CHATTERBOX_PROFILE_LOG (a log level), CHATTERBOX_PROFILE_PROM and
+CHATTERBOX_PROFILE_TRACE (file paths).
+
+Two measurements cost something on every stage and are off unless a
+registered sink asks for them (a `sync_cuda` / `track_memory` attribute
+set to True) or CHATTERBOX_PROFILE_SYNC / CHATTERBOX_PROFILE_MEMORY is set:
+
+- sync_cuda: synchronize CUDA around each stage, so stage times cover the
+  GPU work and not just the kernel launches
+- track_memory: per-stage peak memory; CUDA allocations, or on CPU the
+  process RSS high-water mark, reset at the start of each stage (Linux)
+
+Step-level progress travels the same way: the T3 decode loop and the CFM
+solver call `report_progress(phase, done, total)` every step, which reaches
+the callback installed with `progress_callback(fn)` (or passed to a
+pipeline's `generate` as `progress=fn`) and costs nothing otherwise.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("chatterbox_generation_profile", default=None)
+_progress = contextvars.ContextVar("chatterbox_progress_callback", default=None)
+
+
+def _cuda_active():
+    return torch.cuda.is_available() and torch.cuda.is_initialized()
+
+
+def _reset_peak_rss():
+    """Restart the kernel's RSS high-water mark (Linux); False where that isn't possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    """RSS high-water mark in MiB since the last `_reset_peak_rss()`."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").lower() not in ("", "0", "false", "no")
+
+
+@dataclass
+class StageTiming:
+    name: str
+    start: float  # seconds since the start of the profile
+    duration: float
+    # With track_memory: CUDA peak allocated, or CPU peak RSS, during the stage
+    peak_memory_mb: Optional[float] = None
+    attrs: dict = field(default_factory=dict)
+
+
+class _Stage:
+    """An open stage; ends on `end()` or when used as a context manager."""
+
+    __slots__ = ("profile", "name", "attrs", "t0")
+
+    def __init__(self, profile, name, attrs):
+        self.profile = profile
+        self.name = name
+        self.attrs = attrs
+        if profile is not None:
+            self.t0 = profile._begin_stage()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+
+    def end(self, **attrs):
+        if self.profile is not None:
+            self.attrs.update(attrs)
+            self.profile._end_stage(self.name, self.t0, self.attrs)
+            self.profile = None
+
+
+def stage(name, **attrs) -> _Stage:
+    """
+    Time a stage of the active generation, if any:
+
+        with stage("cfm", steps=10):
+            ...
+
+    or, around code that can't easily be indented, `s = stage("t3_decode")`
+    ... `s.end(tokens=n)`. A `tokens` attribute also records tokens/s.
+    """
+    return _Stage(_current.get(), name, attrs)
+
+
+def current_profile() -> Optional["GenerationProfile"]:
+    return _current.get()
+
+
+def annotate(**attrs):
+    """Record attributes of the active generation as a whole (e.g. whether it hit its token cap)."""
+    profile = _current.get()
+    if profile is not None:
+        profile.attrs.update(attrs)
+
+
+def report_progress(phase, done, total):
+    """
+    Tell the active progress callback, if any, that `done` of at most
+    `total` steps of `phase` ("t3" tokens, "cfm" steps) are finished.
+    """
+    callback = _progress.get()
+    if callback is not None:
+        callback(phase, done, total)
+
+
+@contextlib.contextmanager
+def progress_callback(callback: Optional[Callable[[str, int, int], None]]):
+    """Route `report_progress` calls made inside the block to `callback(phase, done, total)`."""
+    token = _progress.set(callback)
+    try:
+        yield
+    finally:
+        _progress.reset(token)
+
+
+class GenerationProfile:
+    """Timings of one `generate` call, stage by stage."""
+
+    def __init__(self, pipeline, sync_cuda=None, track_memory=None):
+        """
+        `sync_cuda` and `track_memory` default to whatever the registered
+        sinks ask for (see the module docstring).
+        """
+        self.pipeline = pipeline
+        self.sync_cuda = _wanted("sync_cuda") if sync_cuda is None else sync_cuda
+        self.track_memory = _wanted("track_memory") if track_memory is None else track_memory
+        self._rss_reset = False
+        self.stages: List[StageTiming] = []
+        self.attrs = {}
+        self.wall_start = time.time()
+        self.thread_id = threading.get_ident()
+        self.total = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def _sync(self):
+        if self.sync_cuda and _cuda_active():
+            torch.cuda.synchronize()
+
+    def _begin_stage(self):
+        self._sync()
+        if self.track_memory:
+            if _cuda_active():
+                torch.cuda.reset_peak_memory_stats()
+            else:
+                self._rss_reset = _reset_peak_rss()
+        return time.perf_counter()
+
+    def _end_stage(self, name, t0, attrs):
+        self._sync()
+        t1 = time.perf_counter()
+        peak = None
+        if self.track_memory:
+            if _cuda_active():
+                peak = torch.cuda.max_memory_allocated() / 2**20
+            elif self._rss_reset:
+                peak = _peak_rss_mb()
+        duration = t1 - t0
+        if "tokens" in attrs and duration > 0:
+            attrs["tokens_per_s"] = attrs["tokens"] / duration
+        self.stages.append(StageTiming(name, t0 - self._t0, duration, peak, attrs))
+
+    def finish(self, error=None):
+        self._sync()
+        self.total = time.perf_counter() - self._t0
+        self.error = error
+
+    def summary(self) -> dict:
+        """Seconds per stage name (stages that ran several times are summed)."""
+        out = defaultdict(float)
+        for s in self.stages:
+            out[s.name] += s.duration
+        return dict(out)
+
+    def as_dict(self) -> dict:
+        return {
+            "pipeline": self.pipeline,
+            "wall_start": self.wall_start,
+            "total": self.total,
+            "error": self.error,
+            "attrs": self.attrs,
+            "stages": [vars(s) for s in self.stages],
+        }
+
+    def format(self) -> str:
+        parts = []
+        for name, secs in self.summary().items():
+            parts.append(f"{name}={secs * 1000:.0f}ms")
+        rates = [s.attrs["tokens_per_s"] for s in self.stages if "tokens_per_s" in s.attrs]
+        if rates:
+            parts.append(f"{rates[-1]:.1f} tok/s")
+        total = f"{self.total * 1000:.0f}ms" if self.total is not None else "?"
+        return f"{self.pipeline}.generate {total}: " + " ".join(parts)
+
+    def __repr__(self):
+        return f"<GenerationProfile {self.format()}>"
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+class LoggingSink:
+    def __init__(self, log=None, level=logging.INFO):
+        self.log = log or logger
+        self.level = level
+
+    def __call__(self, profile: GenerationProfile):
+        self.log.log(self.level, profile.format())
+
+
+class PrometheusSink:
+    """
+    Cumulative stage counters in Prometheus text format: `render()` for an
+    HTTP endpoint, or `path` to rewrite a node_exporter textfile per call.
+    """
+
+    def __init__(self, path=None, prefix="chatterbox", track_memory=False):
+        """:param track_memory: also collect per-stage peak memory (see the module docstring)."""
+        self.path = path
+        self.prefix = prefix
+        self.track_memory = track_memory
+        self._lock = threading.Lock()
+        self._seconds = defaultdict(float)  # (pipeline, stage) -> seconds
+        self._count = defaultdict(int)
+        self._peak = {}  # (pipeline, stage) -> max peak MB
+        self._calls = defaultdict(int)  # (pipeline, status) -> count
+
+    def __call__(self, profile: GenerationProfile):
+        with self._lock:
+            self._calls[(profile.pipeline, "error" if profile.error else "ok")] += 1
+            for s in profile.stages:
+                key = (profile.pipeline, s.name)
+                self._seconds[key] += s.duration
+                self._count[key] += 1
+                if s.peak_memory_mb is not None:
+                    self._peak[key] = max(self._peak.get(key, 0.0), s.peak_memory_mb)
+            if profile.total is not None:
+                key = (profile.pipeline, "total")
+                self._seconds[key] += profile.total
+                self._count[key] += 1
+        if self.path:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp, self.path)
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_generate_calls_total generate() calls, by pipeline and outcome.",
+            f"# TYPE {p}_generate_calls_total counter",
+        ]
+        with self._lock:
+            for (pipeline, status), n in sorted(self._calls.items()):
+                lines.append(f'{p}_generate_calls_total{{pipeline="{pipeline}",status="{status}"}} {n}')
+            for metric, kind, help_, values in (
+                ("stage_seconds_total", "counter", "Time spent per generate() stage.", self._seconds),
+                ("stage_runs_total", "counter", "Runs of each generate() stage.", self._count),
+                ("stage_peak_memory_mb", "gauge", "Highest peak memory seen per stage.", self._peak),
+            ):
+                lines += [f"# HELP {p}_{metric} {help_}", f"# TYPE {p}_{metric} {kind}"]
+                for (pipeline, name), v in sorted(values.items()):
+                    lines.append(f'{p}_{metric}{{pipeline="{pipeline}",stage="{name}"}} {v:g}')
+        return "\n".join(lines) + "\n"
+
+
+class ChromeTraceSink:
+    """
+    Appends complete ("X") trace events, one JSON object per line, inside an
+    unterminated JSON array -- the form chrome://tracing and Perfetto accept
+    for traces that are still being written. Asks for CUDA syncs and
+    memory tracking, so the stage spans on the timeline are exact.
+    """
+
+    sync_cuda = True
+    track_memory = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, profile: GenerationProfile):
+        pid, tid = os.getpid(), profile.thread_id
+        t0 = profile.wall_start * 1e6
+        events = [{
+            "name": f"{profile.pipeline}.generate", "ph": "X", "pid": pid, "tid": tid,
+            "ts": t0, "dur": (profile.total or 0.0) * 1e6,
+            "args": dict(profile.attrs, error=profile.error),
+        }]
+        for s in profile.stages:
+            events.append({
+                "name": s.name, "ph": "X", "pid": pid, "tid": tid,
+                "ts": t0 + s.start * 1e6, "dur": s.duration * 1e6,
+                "args": dict(s.attrs, peak_memory_mb=s.peak_memory_mb),
+            })
+        lines = "".join(json.dumps(e, default=str) + ",\n" for e in events)
+        with self._lock:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", encoding="utf-8") as f:
+                if new:
+                    f.write("[\n")
+                f.write(lines)
+
+
+def _sinks_from_env():
+    sinks = []
+    level = os.environ.get("CHATTERBOX_PROFILE_LOG")
+    if level:
+        sinks.append(LoggingSink(level=logging.getLevelName(level.upper())))
+    if os.environ.get("CHATTERBOX_PROFILE_PROM"):
+        sinks.append(PrometheusSink(os.environ["CHATTERBOX_PROFILE_PROM"]))
+    if os.environ.get("CHATTERBOX_PROFILE_TRACE"):
+        sinks.append(ChromeTraceSink(os.environ["CHATTERBOX_PROFILE_TRACE"]))
+    return sinks
+
+
+_sinks: List[Callable] = _sinks_from_env()
+
+
+def add_sink(sink: Callable[[GenerationProfile], None]):
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _wanted(option):
+    """Whether the environment or any registered sink asks for `option` ("sync_cuda" / "track_memory")."""
+    env = {"sync_cuda": "CHATTERBOX_PROFILE_SYNC", "track_memory": "CHATTERBOX_PROFILE_MEMORY"}[option]
+    return _env_flag(env) or any(getattr(sink, option, False) for sink in list(_sinks))
+
+
+def emit_profile(profile: GenerationProfile):
+    """
+    Send a finished profile to every sink. `profiled` does this for each
+    generate() call; work timed outside one (background watermarking) calls
+    it directly.
+    """
+    for sink in list(_sinks):
+        try:
+            sink(profile)
+        except Exception as e:
+            logger.warning(f"Profiling sink {sink!r} failed: {e}")
+
+
+def profiled(pipeline):
+    """
+    Decorator for a pipeline's `generate`: runs it inside a fresh
+    `GenerationProfile`, stores it as `self.last_profile`, sends it to the
+    sinks, and returns `(result, profile)` if called with `return_profile=True`.
+    A `progress=fn` argument installs `fn` as the progress callback for the call.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, return_profile=False, progress=None, **kwargs):
+            profile = GenerationProfile(pipeline)
+            token = _current.set(profile)
+            try:
+                if progress is not None:
+                    with progress_callback(progress):
+                        result = fn(self, *args, **kwargs)
+                else:
+                    result = fn(self, *args, **kwargs)
+            except BaseException as e:
+                profile.finish(error=type(e).__name__)
+                raise
+            else:
+                profile.finish()
+            finally:
+                _current.reset(token)
+                self.last_profile = profile
+                emit_profile(profile)
+            return (result, profile) if return_profile else result
+        return wrapper
+    return decorator
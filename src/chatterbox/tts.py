@@ -1,19 +1,21 @@
 from dataclasses import dataclass
 from pathlib import Path
 
-import librosa
 import torch
-import perth
 import torch.nn.functional as F
 from huggingface_hub import hf_hub_download
 from safetensors.torch import load_file
 
 from .models.t3 import T3
+from .length_model import SpeechLengthModel
+from .models.audio_ingest import load_audio_views
 from .models.s3tokenizer import S3_SR, drop_invalid_tokens
 from .models.s3gen import S3GEN_SR, S3Gen
 from .models.tokenizers import EnTokenizer
 from .models.voice_encoder import VoiceEncoder
 from .models.t3.modules.cond_enc import T3Cond
+from .profiling import annotate, profiled, stage
+from .watermarking import WatermarkWorker
 
 
 REPO_ID = "ResembleAI/chatterbox"
@@ -90,7 +92,7 @@ class Conditionals:
 
     def save(self, fpath: Path):
         arg_dict = dict(
-            t3=self.t3.__dict__,
+            t3=self.t3.as_dict(),
             gen=self.gen
         )
         torch.save(arg_dict, fpath)
@@ -123,7 +125,12 @@ class ChatterboxTTS:
         self.tokenizer = tokenizer
         self.device = device
         self.conds = conds
+
+        import perth  # ~4s with librosa; paid when a model is built, not on import
         self.watermarker = perth.PerthImplicitWatermarker()
+        self.watermark_worker = WatermarkWorker(self.watermarker, self.sr)
+        self.length_model = SpeechLengthModel.default()
+        self.last_profile = None  # GenerationProfile of the latest generate()
 
     @classmethod
     def from_local(cls, ckpt_dir, device) -> 'ChatterboxTTS':
@@ -153,6 +160,7 @@ class ChatterboxTTS:
             load_file(ckpt_dir / "s3gen.safetensors"), strict=False
         )
         s3gen.to(device).eval()
+        s3gen.prepare_for_inference()
 
         tokenizer = EnTokenizer(
             str(ckpt_dir / "tokenizer.json")
@@ -180,31 +188,36 @@ class ChatterboxTTS:
         return cls.from_local(Path(local_path).parent, device)
 
     def prepare_conditionals(self, wav_fpath, exaggeration=0.5):
-        ## Load reference wav
-        s3gen_ref_wav, _sr = librosa.load(wav_fpath, sr=S3GEN_SR)
+        self.conds = self.build_conditionals(wav_fpath, exaggeration=exaggeration)
 
-        ref_16k_wav = librosa.resample(s3gen_ref_wav, orig_sr=S3GEN_SR, target_sr=S3_SR)
+    def build_conditionals(self, wav_fpath, exaggeration=0.5) -> Conditionals:
+        """Compute the T3 and S3Gen conditionals for a reference clip without touching `self.conds`."""
+        ## Load reference wav (decoded once; both views land on the device)
+        s3gen_ref_wav, ref_16k_wav = load_audio_views(wav_fpath, (S3GEN_SR, S3_SR), self.device)
 
-        s3gen_ref_wav = s3gen_ref_wav[:self.DEC_COND_LEN]
-        s3gen_ref_dict = self.s3gen.embed_ref(s3gen_ref_wav, S3GEN_SR, device=self.device)
+        s3gen_ref_dict = self.s3gen.embed_ref(
+            s3gen_ref_wav[:, :self.DEC_COND_LEN], S3GEN_SR, device=self.device,
+            ref_wav_16=ref_16k_wav[:, :self.DEC_COND_LEN * S3_SR // S3GEN_SR],
+        )
 
         # Speech cond prompt tokens
         if plen := self.t3.hp.speech_cond_prompt_len:
             s3_tokzr = self.s3gen.tokenizer
-            t3_cond_prompt_tokens, _ = s3_tokzr.forward([ref_16k_wav[:self.ENC_COND_LEN]], max_len=plen)
+            t3_cond_prompt_tokens, _ = s3_tokzr.forward([ref_16k_wav[0, :self.ENC_COND_LEN]], max_len=plen)
             t3_cond_prompt_tokens = torch.atleast_2d(t3_cond_prompt_tokens).to(self.device)
 
         # Voice-encoder speaker embedding
-        ve_embed = torch.from_numpy(self.ve.embeds_from_wavs([ref_16k_wav], sample_rate=S3_SR))
-        ve_embed = ve_embed.mean(axis=0, keepdim=True).to(self.device)
+        ve_embed = self.ve.embed_wavs(ref_16k_wav, sample_rate=S3_SR)
+        ve_embed = ve_embed.mean(dim=0, keepdim=True).to(self.device)
 
         t3_cond = T3Cond(
             speaker_emb=ve_embed,
             cond_prompt_speech_tokens=t3_cond_prompt_tokens,
             emotion_adv=exaggeration * torch.ones(1, 1, 1),
         ).to(device=self.device)
-        self.conds = Conditionals(t3_cond, s3gen_ref_dict)
+        return Conditionals(t3_cond, s3gen_ref_dict)
 
+    @profiled("tts")
     def generate(
         self,
         text,
@@ -215,46 +228,55 @@ class ChatterboxTTS:
         exaggeration=0.5,
         cfg_weight=0.5,
         temperature=0.8,
+        max_new_tokens=None,
+        cancel=None,
+        watermark_async=False,
     ):
-        if audio_prompt_path:
-            self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration)
-        else:
-            assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
+        with stage("conditioning"):
+            if audio_prompt_path:
+                self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration)
+            else:
+                assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
 
-        # Update exaggeration if needed
-        if exaggeration != self.conds.t3.emotion_adv[0, 0, 0]:
-            _cond: T3Cond = self.conds.t3
-            self.conds.t3 = T3Cond(
-                speaker_emb=_cond.speaker_emb,
-                cond_prompt_speech_tokens=_cond.cond_prompt_speech_tokens,
-                emotion_adv=exaggeration * torch.ones(1, 1, 1),
-            ).to(device=self.device)
+            # Update exaggeration if needed (keeps the cached voice conditioning)
+            self.conds.t3.set_emotion_adv(exaggeration)
 
         # Norm and tokenize text
-        text = punc_norm(text)
-        text_tokens = self.tokenizer.text_to_tokens(text).to(self.device)
+        with stage("tokenize"):
+            text = punc_norm(text)
+            text_tokens = self.tokenizer.text_to_tokens(text).to(self.device)
+            n_text_tokens = text_tokens.size(-1)
 
-        if cfg_weight > 0.0:
-            text_tokens = torch.cat([text_tokens, text_tokens], dim=0)  # Need two seqs for CFG
+            if cfg_weight > 0.0:
+                text_tokens = torch.cat([text_tokens, text_tokens], dim=0)  # Need two seqs for CFG
 
-        sot = self.t3.hp.start_text_token
-        eot = self.t3.hp.stop_text_token
-        text_tokens = F.pad(text_tokens, (1, 0), value=sot)
-        text_tokens = F.pad(text_tokens, (0, 1), value=eot)
+            sot = self.t3.hp.start_text_token
+            eot = self.t3.hp.stop_text_token
+            text_tokens = F.pad(text_tokens, (1, 0), value=sot)
+            text_tokens = F.pad(text_tokens, (0, 1), value=eot)
 
         with torch.inference_mode():
-            speech_tokens = self.t3.inference(
-                t3_cond=self.conds.t3,
-                text_tokens=text_tokens,
-                max_new_tokens=1000,  # TODO: use the value in config
-                temperature=temperature,
-                cfg_weight=cfg_weight,
-                repetition_penalty=repetition_penalty,
-                min_p=min_p,
-                top_p=top_p,
+            def decode(max_new_tokens):
+                speech_tokens = self.t3.inference(
+                    t3_cond=self.conds.t3,
+                    text_tokens=text_tokens,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    cfg_weight=cfg_weight,
+                    repetition_penalty=repetition_penalty,
+                    min_p=min_p,
+                    top_p=top_p,
+                    cancel=cancel,
+                )
+                # Extract only the conditional batch.
+                speech_tokens = speech_tokens[0]
+                hit_cap = speech_tokens.size(-1) >= max_new_tokens and speech_tokens[-1] != self.t3.hp.stop_speech_token
+                return speech_tokens, hit_cap
+
+            speech_tokens, max_new_tokens, hit_cap = self.length_model.decode(
+                decode, n_text_tokens, "tts", max_new_tokens=max_new_tokens,
             )
-            # Extract only the conditional batch.
-            speech_tokens = speech_tokens[0]
+            annotate(max_new_tokens=max_new_tokens, hit_cap=hit_cap)
 
             # TODO: output becomes 1D
             speech_tokens = drop_invalid_tokens(speech_tokens)
@@ -266,7 +288,8 @@ class ChatterboxTTS:
             wav, _ = self.s3gen.inference(
                 speech_tokens=speech_tokens,
                 ref_dict=self.conds.gen,
+                cancel=cancel,
             )
-            wav = wav.squeeze(0).detach().cpu().numpy()
-            watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
-        return torch.from_numpy(watermarked_wav).unsqueeze(0)
+            with stage("host_transfer"):
+                wav = wav.squeeze(0).detach().cpu().numpy()
+            return self.watermark_worker.watermark(wav, background=watermark_async)
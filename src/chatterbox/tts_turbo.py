@@ -3,16 +3,14 @@ import math
 from dataclasses import dataclass
 from pathlib import Path
 
-import librosa
 import torch
-import perth
-import pyloudnorm as ln
 
 from safetensors.torch import load_file
 from huggingface_hub import snapshot_download
-from transformers import AutoTokenizer
 
 from .models.t3 import T3
+from .length_model import SpeechLengthModel
+from .models.audio_ingest import load_audio_views
 from .models.s3tokenizer import S3_SR
 from .models.s3gen import S3GEN_SR, S3Gen
 from .models.tokenizers import EnTokenizer
@@ -20,6 +18,8 @@ from .models.voice_encoder import VoiceEncoder
 from .models.t3.modules.cond_enc import T3Cond
 from .models.t3.modules.t3_config import T3Config
 from .models.s3gen.const import S3GEN_SIL
+from .profiling import annotate, profiled, stage
+from .watermarking import WatermarkWorker
 import logging
 logger = logging.getLogger(__name__)
 
@@ -94,7 +94,7 @@ class Conditionals:
 
     def save(self, fpath: Path):
         arg_dict = dict(
-            t3=self.t3.__dict__,
+            t3=self.t3.as_dict(),
             gen=self.gen
         )
         torch.save(arg_dict, fpath)
@@ -127,10 +127,17 @@ class ChatterboxTurboTTS:
         self.tokenizer = tokenizer
         self.device = device
         self.conds = conds
+
+        import perth
         self.watermarker = perth.PerthImplicitWatermarker()
+        self.watermark_worker = WatermarkWorker(self.watermarker, self.sr)
+        self.length_model = SpeechLengthModel.default()
+        self.last_profile = None  # GenerationProfile of the latest generate()
 
     @classmethod
     def from_local(cls, ckpt_dir, device) -> 'ChatterboxTurboTTS':
+        from transformers import AutoTokenizer
+
         ckpt_dir = Path(ckpt_dir)
 
         # Always load to CPU first for non-CUDA devices to handle CUDA-saved models
@@ -168,6 +175,7 @@ class ChatterboxTurboTTS:
             weights, strict=True
         )
         s3gen.to(device).eval()
+        s3gen.prepare_for_inference()
 
         tokenizer = AutoTokenizer.from_pretrained(ckpt_dir)
         if tokenizer.pad_token is None:
@@ -201,50 +209,61 @@ class ChatterboxTurboTTS:
 
         return cls.from_local(local_path, device)
 
-    def norm_loudness(self, wav, sr, target_lufs=-27):
+    def loudness_gain(self, wav, sr, target_lufs=-27):
+        """Linear gain that brings `wav` to `target_lufs` (1.0 if it can't be measured)."""
+        import pyloudnorm as ln
+
         try:
             meter = ln.Meter(sr)
             loudness = meter.integrated_loudness(wav)
             gain_db = target_lufs - loudness
             gain_linear = 10.0 ** (gain_db / 20.0)
             if math.isfinite(gain_linear) and gain_linear > 0.0:
-                wav = wav * gain_linear
+                return gain_linear
         except Exception as e:
             print(f"Warning: Error in norm_loudness, skipping: {e}")
 
-        return wav
-
-    def prepare_conditionals(self, wav_fpath, exaggeration=0.5, norm_loudness=True):
-        ## Load and norm reference wav
-        s3gen_ref_wav, _sr = librosa.load(wav_fpath, sr=S3GEN_SR)
+        return 1.0
 
-        assert len(s3gen_ref_wav) / _sr > 5.0, "Audio prompt must be longer than 5 seconds!"
+    def norm_loudness(self, wav, sr, target_lufs=-27):
+        return wav * self.loudness_gain(wav, sr, target_lufs=target_lufs)
 
-        if norm_loudness:
-            s3gen_ref_wav = self.norm_loudness(s3gen_ref_wav, _sr)
+    def prepare_conditionals(self, wav_fpath, exaggeration=0.5, norm_loudness=True):
+        self.conds = self.build_conditionals(wav_fpath, exaggeration=exaggeration, norm_loudness=norm_loudness)
+
+    def build_conditionals(self, wav_fpath, exaggeration=0.5, norm_loudness=True) -> Conditionals:
+        """Compute the T3 and S3Gen conditionals for a reference clip without touching `self.conds`."""
+        ## Load and norm reference wav (decoded once; both views land on the device)
+        s3gen_ref_wav, ref_16k_wav = load_audio_views(
+            wav_fpath, (S3GEN_SR, S3_SR), self.device,
+            gain_fn=self.loudness_gain if norm_loudness else None,
+        )
 
-        ref_16k_wav = librosa.resample(s3gen_ref_wav, orig_sr=S3GEN_SR, target_sr=S3_SR)
+        assert s3gen_ref_wav.shape[-1] / S3GEN_SR > 5.0, "Audio prompt must be longer than 5 seconds!"
 
-        s3gen_ref_wav = s3gen_ref_wav[:self.DEC_COND_LEN]
-        s3gen_ref_dict = self.s3gen.embed_ref(s3gen_ref_wav, S3GEN_SR, device=self.device)
+        s3gen_ref_dict = self.s3gen.embed_ref(
+            s3gen_ref_wav[:, :self.DEC_COND_LEN], S3GEN_SR, device=self.device,
+            ref_wav_16=ref_16k_wav[:, :self.DEC_COND_LEN * S3_SR // S3GEN_SR],
+        )
 
         # Speech cond prompt tokens
         if plen := self.t3.hp.speech_cond_prompt_len:
             s3_tokzr = self.s3gen.tokenizer
-            t3_cond_prompt_tokens, _ = s3_tokzr.forward([ref_16k_wav[:self.ENC_COND_LEN]], max_len=plen)
+            t3_cond_prompt_tokens, _ = s3_tokzr.forward([ref_16k_wav[0, :self.ENC_COND_LEN]], max_len=plen)
             t3_cond_prompt_tokens = torch.atleast_2d(t3_cond_prompt_tokens).to(self.device)
 
         # Voice-encoder speaker embedding
-        ve_embed = torch.from_numpy(self.ve.embeds_from_wavs([ref_16k_wav], sample_rate=S3_SR))
-        ve_embed = ve_embed.mean(axis=0, keepdim=True).to(self.device)
+        ve_embed = self.ve.embed_wavs(ref_16k_wav, sample_rate=S3_SR)
+        ve_embed = ve_embed.mean(dim=0, keepdim=True).to(self.device)
 
         t3_cond = T3Cond(
             speaker_emb=ve_embed,
             cond_prompt_speech_tokens=t3_cond_prompt_tokens,
             emotion_adv=exaggeration * torch.ones(1, 1, 1),
         ).to(device=self.device)
-        self.conds = Conditionals(t3_cond, s3gen_ref_dict)
+        return Conditionals(t3_cond, s3gen_ref_dict)
 
+    @profiled("turbo")
     def generate(
         self,
         text,
@@ -257,28 +276,44 @@ class ChatterboxTurboTTS:
         temperature=0.8,
         top_k=1000,
         norm_loudness=True,
+        max_new_tokens=None,
+        cancel=None,
+        watermark_async=False,
     ):
-        if audio_prompt_path:
-            self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration, norm_loudness=norm_loudness)
-        else:
-            assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
+        with stage("conditioning"):
+            if audio_prompt_path:
+                self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration, norm_loudness=norm_loudness)
+            else:
+                assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
 
         if cfg_weight > 0.0 or exaggeration > 0.0 or min_p > 0.0:
             logger.warning("CFG, min_p and exaggeration are not supported by Turbo version and will be ignored.")
 
         # Norm and tokenize text
-        text = punc_norm(text)
-        text_tokens = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        text_tokens = text_tokens.input_ids.to(self.device)
-
-        speech_tokens = self.t3.inference_turbo(
-            t3_cond=self.conds.t3,
-            text_tokens=text_tokens,
-            temperature=temperature,
-            top_k=top_k,
-            top_p=top_p,
-            repetition_penalty=repetition_penalty,
+        with stage("tokenize"):
+            text = punc_norm(text)
+            text_tokens = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True)
+            text_tokens = text_tokens.input_ids.to(self.device)
+            n_text_tokens = text_tokens.size(-1)
+
+        def decode(max_new_tokens):
+            speech_tokens = self.t3.inference_turbo(
+                t3_cond=self.conds.t3,
+                text_tokens=text_tokens,
+                temperature=temperature,
+                top_k=top_k,
+                top_p=top_p,
+                repetition_penalty=repetition_penalty,
+                max_gen_len=max_new_tokens,
+                cancel=cancel,
+            )
+            # EOS is stripped, so running past the cap means it never stopped
+            return speech_tokens, speech_tokens.size(-1) > max_new_tokens
+
+        speech_tokens, max_new_tokens, hit_cap = self.length_model.decode(
+            decode, n_text_tokens, "turbo", max_new_tokens=max_new_tokens,
         )
+        annotate(max_new_tokens=max_new_tokens, hit_cap=hit_cap)
 
         # Remove OOV tokens and add silence to end
         speech_tokens = speech_tokens[speech_tokens < 6561]
@@ -290,7 +325,8 @@ class ChatterboxTurboTTS:
             speech_tokens=speech_tokens,
             ref_dict=self.conds.gen,
             n_cfm_timesteps=2,
+            cancel=cancel,
         )
-        wav = wav.squeeze(0).detach().cpu().numpy()
-        watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
-        return torch.from_numpy(watermarked_wav).unsqueeze(0)
+        with stage("host_transfer"):
+            wav = wav.squeeze(0).detach().cpu().numpy()
+        return self.watermark_worker.watermark(wav, background=watermark_async)
@@ -1,13 +1,17 @@
 from pathlib import Path
 
-import librosa
+import time
+
+import numpy as np
 import torch
-import perth
 from huggingface_hub import hf_hub_download
 from safetensors.torch import load_file
 
-from .models.s3tokenizer import S3_SR
+from .models.audio_ingest import audio_duration, load_audio, load_audio_views
+from .models.s3tokenizer import S3_SR, S3_TOKEN_RATE
 from .models.s3gen import S3GEN_SR, S3Gen
+from .profiling import profiled, stage
+from .watermarking import WatermarkWorker
 
 
 REPO_ID = "ResembleAI/chatterbox"
@@ -26,7 +30,11 @@ class ChatterboxVC:
         self.sr = S3GEN_SR
         self.s3gen = s3gen
         self.device = device
+
+        import perth
         self.watermarker = perth.PerthImplicitWatermarker()
+        self.watermark_worker = WatermarkWorker(self.watermarker, self.sr)
+        self.last_profile = None  # GenerationProfile of the latest generate()
         if ref_dict is None:
             self.ref_dict = None
         else:
@@ -55,6 +63,7 @@ class ChatterboxVC:
             load_file(ckpt_dir / "s3gen.safetensors"), strict=False
         )
         s3gen.to(device).eval()
+        s3gen.prepare_for_inference()
 
         return cls(s3gen, device, ref_dict=ref_dict)
 
@@ -74,31 +83,264 @@ class ChatterboxVC:
         return cls.from_local(Path(local_path).parent, device)
 
     def set_target_voice(self, wav_fpath):
-        ## Load reference wav
-        s3gen_ref_wav, _sr = librosa.load(wav_fpath, sr=S3GEN_SR)
+        self.ref_dict = self.build_ref_dict(wav_fpath)
 
-        s3gen_ref_wav = s3gen_ref_wav[:self.DEC_COND_LEN]
-        self.ref_dict = self.s3gen.embed_ref(s3gen_ref_wav, S3GEN_SR, device=self.device)
+    def build_ref_dict(self, wav_fpath) -> dict:
+        """Compute the S3Gen reference dict for a target clip without touching `self.ref_dict`."""
+        ## Load reference wav (decoded once; both views land on the device)
+        s3gen_ref_wav, ref_16k_wav = load_audio_views(wav_fpath, (S3GEN_SR, S3_SR), self.device)
+
+        return self.s3gen.embed_ref(
+            s3gen_ref_wav[:, :self.DEC_COND_LEN], S3GEN_SR, device=self.device,
+            ref_wav_16=ref_16k_wav[:, :self.DEC_COND_LEN * S3_SR // S3GEN_SR],
+        )
 
+    @profiled("vc")
     def generate(
         self,
         audio,
         target_voice_path=None,
+        cancel=None,
+        watermark_async=False,
+    ):
+        with stage("conditioning"):
+            if target_voice_path:
+                self.set_target_voice(target_voice_path)
+            else:
+                assert self.ref_dict is not None, "Please `prepare_conditionals` first or specify `target_voice_path`"
+
+        with torch.inference_mode():
+            with stage("tokenize"):
+                audio_16 = load_audio(audio, S3_SR, self.device)
+                s3_tokens, _ = self.s3gen.tokenizer(audio_16)
+            wav, _ = self.s3gen.inference(
+                speech_tokens=s3_tokens,
+                ref_dict=self.ref_dict,
+                cancel=cancel,
+            )
+            with stage("host_transfer"):
+                wav = wav.squeeze(0).detach().cpu().numpy()
+            return self.watermark_worker.watermark(wav, background=watermark_async)
+
+    def generate_batch(
+        self,
+        audios,
+        target_voice_path=None,
+        batch_size=8,
+        max_batch_seconds=60.0,
+        return_timings=False,
     ):
+        """
+        Convert every file in `audios` to the same target voice.
+
+        Inputs are sorted by duration and run `batch_size` at a time through a
+        single tokenizer and flow pass; HiFT runs per item, and each item's
+        watermark runs in the background while the next one is decoded.
+        Inputs longer than `max_batch_seconds` go through `generate_stream`.
+
+        Returns the (1, N) waveforms in input order, and with `return_timings`
+        also the seconds spent on each item (shared batch work is split in
+        proportion to token count; background watermarking is not counted).
+        """
         if target_voice_path:
             self.set_target_voice(target_voice_path)
         else:
             assert self.ref_dict is not None, "Please `prepare_conditionals` first or specify `target_voice_path`"
 
+        durations = [audio_duration(a) for a in audios]
+        order = sorted(range(len(audios)), key=lambda i: durations[i], reverse=True)
+        wavs, timings = [None] * len(audios), [0.0] * len(audios)
+
+        long_items = [i for i in order if durations[i] > max_batch_seconds]
+        for i in long_items:
+            t0 = time.perf_counter()
+            wavs[i] = torch.cat(list(self.generate_stream(audios[i])), dim=-1)
+            timings[i] = time.perf_counter() - t0
+
+        short_items = [i for i in order if durations[i] <= max_batch_seconds]
+        ratio = self.s3gen.flow.token_mel_ratio
         with torch.inference_mode():
-            audio_16, _ = librosa.load(audio, sr=S3_SR)
-            audio_16 = torch.from_numpy(audio_16).float().to(self.device)[None, ]
+            for b in range(0, len(short_items), batch_size):
+                group = short_items[b:b + batch_size]
+                t0 = time.perf_counter()
+                s3_tokens, token_lens = self.s3gen.tokenizer(
+                    [load_audio(audios[i], S3_SR, self.device)[0] for i in group]
+                )
+                mels = self.s3gen.flow_inference(
+                    s3_tokens,
+                    speech_token_lens=token_lens,
+                    ref_dict=dict(self.ref_dict),
+                    finalize=True,
+                ).to(dtype=self.s3gen.dtype)
+                shared = time.perf_counter() - t0
+                n_total = max(int(token_lens.sum()), 1)
 
-            s3_tokens, _ = self.s3gen.tokenizer(audio_16)
-            wav, _ = self.s3gen.inference(
-                speech_tokens=s3_tokens,
-                ref_dict=self.ref_dict,
+                for j, i in enumerate(group):
+                    t0 = time.perf_counter()
+                    n = int(token_lens[j])
+                    wav, _ = self.s3gen.hift_inference(mels[j:j + 1, :, :n * ratio], None)
+                    # NOTE: ad-hoc method to reduce "spillover" from the reference clip.
+                    trim_fade = self.s3gen.trim_fade
+                    wav[:, :len(trim_fade)] *= trim_fade[:wav.size(1)]
+                    wav = wav.squeeze(0).detach().cpu().numpy()
+                    wavs[i] = self.watermark_worker.watermark(wav, background=True)
+                    timings[i] = time.perf_counter() - t0 + shared * n / n_total
+
+        # Batched items come back as watermark futures
+        batched = set(short_items)
+        wavs = [w.result() if i in batched else w for i, w in enumerate(wavs)]
+        if return_timings:
+            return wavs, timings
+        return wavs
+
+    # ------------------------------------------------------------------
+    # Chunked conversion for long inputs
+    # ------------------------------------------------------------------
+    def _iter_source_tokens(self, audio_16, window_sec, margin_sec, batch_size):
+        """
+        Tokenize (1, L) 16 kHz audio in windows of `window_sec` with
+        `margin_sec` of audio context on each side, yielding each window's
+        (1, n) core tokens in order. Windows are tokenized `batch_size` at a
+        time and only moved to the device while being tokenized.
+        """
+        hop = S3_SR // S3_TOKEN_RATE  # samples per token
+        core = int(window_sec * S3_TOKEN_RATE) * hop
+        margin = int(margin_sec * S3_TOKEN_RATE) * hop
+        total = audio_16.size(-1)
+
+        windows = []
+        for start in range(0, total, core):
+            seg_start, seg_end = max(0, start - margin), min(total, start + core + margin)
+            last = start + core >= total
+            windows.append((seg_start, seg_end, (start - seg_start) // hop, None if last else core // hop))
+
+        for i in range(0, len(windows), batch_size):
+            group = windows[i:i + batch_size]
+            segs = [audio_16[0, s:e].to(self.device) for s, e, _, _ in group]
+            tokens, token_lens = self.s3gen.tokenizer(segs)
+            for (_, _, skip, keep), toks, n in zip(group, tokens, token_lens.tolist()):
+                toks = toks[skip:n]
+                yield (toks if keep is None else toks[:keep]).unsqueeze(0)
+
+    def _iter_flow_mels(self, token_iter, chunk_tokens, context_tokens, cancel=None):
+        """
+        Run the flow over chunks of `chunk_tokens` tokens, yielding (mels, final).
+
+        Each chunk is conditioned on the reference prompt plus the previous
+        `context_tokens` tokens and the mels already generated for them, and
+        sees `pre_lookahead_len` tokens of the next chunk, so the attention
+        span (and the cost per chunk) stays constant however long the input is.
+        """
+        flow = self.s3gen.flow
+        lookahead = flow.pre_lookahead_len
+        ratio = flow.token_mel_ratio
+        ref = self.ref_dict
+        prompt_token = ref["prompt_token"].to(self.device)
+        prompt_feat = ref["prompt_feat"].to(self.device)
+
+        ctx_tokens = prompt_token[:, :0]
+        ctx_mels = prompt_feat[:, :0]
+
+        def convert(tokens, look, final):
+            nonlocal ctx_tokens, ctx_mels
+            window_ref = dict(
+                ref,
+                prompt_token=torch.cat([prompt_token, ctx_tokens], dim=1),
+                prompt_token_len=torch.LongTensor([prompt_token.size(1) + ctx_tokens.size(1)]).to(self.device),
+                prompt_feat=torch.cat([prompt_feat, ctx_mels.to(prompt_feat.dtype)], dim=1),
+                prompt_feat_len=None,
             )
-            wav = wav.squeeze(0).detach().cpu().numpy()
-            watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
-        return torch.from_numpy(watermarked_wav).unsqueeze(0)
\ No newline at end of file
+            mels = self.s3gen.flow_inference(torch.cat([tokens, look], dim=1), ref_dict=window_ref, finalize=final, cancel=cancel)
+            n_ctx = min(context_tokens, tokens.size(1) + ctx_tokens.size(1))
+            ctx_tokens = torch.cat([ctx_tokens, tokens], dim=1)[:, -n_ctx:] if n_ctx else ctx_tokens[:, :0]
+            ctx_mels = torch.cat([ctx_mels, mels.transpose(1, 2)], dim=1)[:, ctx_mels.size(1) + mels.size(2) - n_ctx * ratio:]
+            return mels
+
+        buf = torch.zeros(1, 0, dtype=torch.long, device=self.device)
+        for tokens in token_iter:
+            buf = torch.cat([buf, tokens.to(self.device, torch.long)], dim=1)
+            while buf.size(1) >= chunk_tokens + lookahead:
+                yield convert(buf[:, :chunk_tokens], buf[:, chunk_tokens:chunk_tokens + lookahead], False), False
+                buf = buf[:, chunk_tokens:]
+        if buf.size(1):
+            yield convert(buf, buf[:, :0], True), True
+
+    def generate_stream(
+        self,
+        audio,
+        target_voice_path=None,
+        chunk_seconds=10.0,
+        context_seconds=2.0,
+        tokenize_window_seconds=28.0,
+        tokenize_batch_size=8,
+        cancel=None,
+    ):
+        """
+        Convert `audio` window by window, yielding (1, N) watermarked waveform
+        chunks at `self.sr` as soon as each is ready.
+
+        Device memory and per-chunk cost depend on the chunk/context sizes,
+        not the input length; concatenating the chunks gives the full output.
+        Watermarking runs on fixed-size blocks, so the chunks are those
+        blocks, yielded as they are watermarked while the next window converts.
+        An optional `cancel` token is checked at every CFM step.
+        """
+        if target_voice_path:
+            self.set_target_voice(target_voice_path)
+        else:
+            assert self.ref_dict is not None, "Please `prepare_conditionals` first or specify `target_voice_path`"
+
+        wavs = self._iter_stream_wavs(
+            audio, chunk_seconds, context_seconds, tokenize_window_seconds, tokenize_batch_size, cancel,
+        )
+        for block in self.watermark_worker.stream(wavs):
+            yield torch.from_numpy(block).unsqueeze(0)
+
+    def _iter_stream_wavs(self, audio, chunk_seconds, context_seconds, tokenize_window_seconds,
+                          tokenize_batch_size, cancel):
+        """`generate_stream` before watermarking: 1-D float waveform chunks."""
+        # HiFT caching across chunks, as in CosyVoice's streaming token2wav
+        mel_cache_len = 8
+        source_cache_len = mel_cache_len * (S3GEN_SR // 50)  # 480 samples per mel frame
+        window = torch.from_numpy(np.hamming(2 * source_cache_len)).float().to(self.device)
+
+        with torch.inference_mode():
+            audio_16 = load_audio(audio, S3_SR, "cpu")
+            token_iter = self._iter_source_tokens(
+                audio_16, tokenize_window_seconds, 1.0, tokenize_batch_size,
+            )
+            hift_cache = None
+            first = True
+            for mels, final in self._iter_flow_mels(
+                token_iter,
+                int(chunk_seconds * S3_TOKEN_RATE),
+                int(context_seconds * S3_TOKEN_RATE),
+                cancel=cancel,
+            ):
+                mels = mels.to(dtype=self.s3gen.dtype)
+                if hift_cache is None:
+                    cache_source = None
+                else:
+                    mels = torch.cat([hift_cache["mel"], mels], dim=2)
+                    cache_source = hift_cache["source"]
+
+                wav, source = self.s3gen.hift_inference(mels, cache_source)
+
+                if hift_cache is not None:
+                    n = source_cache_len
+                    wav[:, :n] = wav[:, :n] * window[:n] + hift_cache["speech"] * window[n:]
+                if not final:
+                    hift_cache = dict(
+                        mel=mels[:, :, -mel_cache_len:],
+                        source=source[:, :, -source_cache_len:],
+                        speech=wav[:, -source_cache_len:],
+                    )
+                    wav = wav[:, :-source_cache_len]
+
+                if first:
+                    # NOTE: ad-hoc method to reduce "spillover" from the reference clip.
+                    trim_fade = self.s3gen.trim_fade
+                    wav[:, :len(trim_fade)] *= trim_fade[:wav.size(1)]
+                    first = False
+
+                yield wav.squeeze(0).detach().cpu().numpy()
@@ -0,0 +1,121 @@
+"""
+Perth watermarking off the synthesis critical path.
+
+Watermarking only post-processes a finished waveform, so nothing the model
+does next depends on it. `WatermarkWorker` runs it on a background thread,
+one job at a time in submission order:
+
+- `watermark(wav, background=True)` returns a `Future` of the watermarked
+  (1, N) tensor, so a caller can start the next chunk right away
+- `stream(chunks)` regroups streamed audio into fixed-size blocks and
+  yields them watermarked as they finish, keeping a few in flight while the
+  producer makes its next chunk, so streaming latency stays that of synthesis
+
+Background jobs are timed as their own "watermark" profile (see
+`chatterbox.profiling`); synchronous calls stay a "watermark" stage of the
+generate() call that made them.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+import numpy as np
+import torch
+
+from .profiling import GenerationProfile, StageTiming, emit_profile, stage
+
+# Samples per watermark block when streaming: 2 s at 24 kHz, a whole number
+# of Perth's 10 ms hops so block edges fall on STFT frame boundaries
+STREAM_BLOCK_SAMPLES = 48000
+
+# Watermarked blocks `stream` may leave pending while the next chunk is made
+STREAM_LOOKAHEAD_BLOCKS = 2
+
+
+def _fit(wav: np.ndarray, n: int) -> np.ndarray:
+    """Trim or zero-pad to `n` samples; Perth rounds lengths to its hop size."""
+    if len(wav) >= n:
+        return wav[:n]
+    return np.pad(wav, (0, n - len(wav)))
+
+
+class WatermarkWorker:
+    """Applies a pipeline's watermarker on a dedicated thread."""
+
+    def __init__(self, watermarker, sample_rate):
+        self.watermarker = watermarker
+        self.sr = sample_rate
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chatterbox-watermark")
+        return self._executor
+
+    def apply(self, wav: np.ndarray) -> np.ndarray:
+        """Watermark a 1-D float waveform on the calling thread."""
+        with torch.inference_mode():
+            out = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
+        return _fit(out, len(wav))
+
+    def _run(self, wav: np.ndarray) -> np.ndarray:
+        profile = GenerationProfile("watermark", sync_cuda=False)
+        t0 = time.perf_counter()
+        try:
+            out = self.apply(wav)
+        except BaseException as e:
+            profile.finish(error=type(e).__name__)
+            raise
+        else:
+            duration = time.perf_counter() - t0
+            profile.stages.append(StageTiming("watermark", t0 - profile._t0, duration, attrs={"samples": len(wav)}))
+            profile.finish()
+        finally:
+            emit_profile(profile)
+        return out
+
+    def submit(self, wav: np.ndarray):
+        """Queue `wav` for watermarking; returns a `Future` of the watermarked array."""
+        return self.executor.submit(self._run, wav)
+
+    def watermark(self, wav: np.ndarray, background=False):
+        """
+        (1, N) tensor of the watermarked `wav`, or, with `background=True`, a
+        `Future` resolving to it.
+        """
+        if not background:
+            with stage("watermark"):
+                out = self.apply(wav)
+            return torch.from_numpy(out).unsqueeze(0)
+        return self.executor.submit(lambda: torch.from_numpy(self._run(wav)).unsqueeze(0))
+
+    def stream(self, chunks: Iterable[np.ndarray], block_samples=STREAM_BLOCK_SAMPLES,
+               lookahead=STREAM_LOOKAHEAD_BLOCKS) -> Iterator[np.ndarray]:
+        """
+        Watermark a stream of 1-D waveform chunks in fixed blocks of
+        `block_samples` (the last one shorter), yielded in order.
+        Concatenating the output gives the whole input, watermarked.
+
+        Blocks are yielded as they finish, so the producer goes on to its
+        next chunk while the last ones are still being watermarked. Up to
+        `lookahead` blocks may be left pending when the next chunk is pulled;
+        past that, the oldest is waited for. The first block is always
+        waited for, so time to first audio stays that of synthesis.
+        """
+        buf = np.zeros(0, dtype=np.float32)
+        pending = deque()
+        started = False
+        for chunk in chunks:
+            buf = np.concatenate([buf, chunk])
+            while len(buf) >= block_samples:
+                pending.append(self.submit(buf[:block_samples]))
+                buf = buf[block_samples:]
+            while pending and (not started or pending[0].done() or len(pending) > lookahead):
+                yield pending.popleft().result()
+                started = True
+        if len(buf):
+            pending.append(self.submit(buf))
+        while pending:
+            yield pending.popleft().result()
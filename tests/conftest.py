@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Import the app's modules and the chatterbox package from the checkout, as app.py does
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "src")):
+    if path not in sys.path:
+        sys.path.append(path)
@@ -0,0 +1,50 @@
+"""
+Every output format must decode with the audio stack the app itself uses
+(libsndfile through soundfile), whether it was streamed chunk by chunk or
+encoded in one go.
+"""
+import io
+
+import numpy as np
+import pytest
+
+from modules.audio_output import SAMPLE_RATE, ChunkEncoder, available_formats
+
+sf = pytest.importorskip("soundfile")
+
+# Mean squared error allowed relative to the signal's power (opus is lossy)
+TOLERANCE = {"opus": 0.02}
+
+
+def _speechlike(seconds=3.0, sr=SAMPLE_RATE):
+    t = np.arange(int(seconds * sr)) / sr
+    wav = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return wav.astype(np.float32)
+
+
+def _decode(fmt, data):
+    if fmt == "pcm":
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    wav, sr = sf.read(io.BytesIO(data), dtype="float32")
+    assert sr == SAMPLE_RATE
+    return wav
+
+
+def _check(fmt, wav, decoded):
+    assert len(decoded) == len(wav)
+    error = np.mean((decoded - wav) ** 2) / np.mean(wav ** 2)
+    assert error <= TOLERANCE.get(fmt, 1e-6), f"{fmt}: relative error {error:.2g}"
+
+
+@pytest.mark.parametrize("fmt", available_formats())
+def test_streamed_round_trip(fmt):
+    wav = _speechlike()
+    encoder = ChunkEncoder(fmt)
+    data = b"".join(encoder.encode(chunk) for chunk in np.array_split(wav, 7)) + encoder.finish()
+    _check(fmt, wav, _decode(fmt, data))
+
+
+@pytest.mark.parametrize("fmt", available_formats())
+def test_whole_file_round_trip(fmt):
+    wav = _speechlike()
+    _check(fmt, wav, _decode(fmt, ChunkEncoder(fmt).encode_all(wav)))
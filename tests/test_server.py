@@ -0,0 +1,215 @@
+"""
+Admission control and cancellation in the HTTP server, driven through
+FastAPI's TestClient with stub jobs in place of the models: each job's work
+yields a couple of chunks once its gate opens, checking its cancellation
+token while it waits as the T3/CFM loops do.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")  # TestClient
+
+try:
+    from fastapi.testclient import TestClient
+
+    from chatterbox.models.utils import cancellation_counts
+    from modules import server
+except ImportError as e:  # e.g. no chatterbox-tts package metadata
+    pytest.skip(f"cannot import the server here: {e}", allow_module_level=True)
+
+
+class StubModels:
+    """Stands in for `model_manager`: `use()` hands out a placeholder model."""
+
+    current_model_type = None
+
+    @contextmanager
+    def use(self, model_type):
+        yield object()
+
+
+class Jobs:
+    """Stub work per request text, each held back by its own gate."""
+
+    def __init__(self):
+        self.gates = {}
+
+    def work(self, req):
+        gate = self.gates.setdefault(req.text, threading.Event())
+
+        def work(model, job):
+            for _ in range(2):
+                while not gate.wait(0.01):
+                    job.token.check()
+                yield np.zeros(2400, dtype=np.float32)
+        return work
+
+    def release(self, text=None):
+        for key, gate in self.gates.items():
+            if text is None or key == text:
+                gate.set()
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    jobs = Jobs()
+    monkeypatch.setattr(server, "_tts_work", jobs.work)
+    monkeypatch.setattr(server, "_tts_estimate", lambda req: 10.0)
+    monkeypatch.setattr(server, "model_manager", StubModels())
+    monkeypatch.setattr(server, "load_voices", lambda: None)
+    yield jobs
+    jobs.release()
+
+
+def _client(monkeypatch, **scheduler_args):
+    scheduler_args.setdefault("workers_per_model", 1)
+    monkeypatch.setattr(server, "scheduler", server.JobScheduler(**scheduler_args))
+    return TestClient(server.app)
+
+
+def _post(client, text, **fields):
+    return client.post("/v1/tts", json={"text": text, "model": "tts", "stream": False, "format": "pcm", **fields})
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the server"
+        time.sleep(0.01)
+
+
+def _job(state):
+    """Id of a job in `state`, once there is one."""
+    found = []
+
+    def match():
+        found[:] = [job.id for job in server.scheduler.jobs.values() if job.state == state]
+        return found
+    _wait_for(match)
+    return found[0]
+
+
+def test_job_runs_to_completion(monkeypatch, jobs):
+    jobs.gates["hello"] = threading.Event()
+    jobs.gates["hello"].set()
+    with _client(monkeypatch) as client:
+        response = _post(client, "hello")
+        assert response.status_code == 200
+        assert len(response.content) == 2 * 2400 * 2  # two chunks of 16-bit PCM
+        assert server.scheduler.finished["done"] == 1
+
+
+def test_full_queue_gets_429(monkeypatch, jobs):
+    with _client(monkeypatch, max_queue=2) as client, ThreadPoolExecutor(2) as pool:
+        running = pool.submit(_post, client, "first")
+        queued = pool.submit(_post, client, "second")
+        _wait_for(lambda: server.scheduler.pending == 2)
+
+        response = _post(client, "third")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+        jobs.release()
+        assert running.result().status_code == 200
+        assert queued.result().status_code == 200
+        # Room again once the queue drains
+        jobs.gates["fourth"] = threading.Event()
+        jobs.gates["fourth"].set()
+        assert _post(client, "fourth").status_code == 200
+
+
+def test_long_backlog_gets_429_with_retry_after(monkeypatch, jobs):
+    with _client(monkeypatch, max_backlog=15.0) as client, ThreadPoolExecutor(2) as pool:
+        first = pool.submit(_post, client, "first")
+        _job("running")
+        # 10 s admitted; the backlog is still within the limit
+        second = pool.submit(_post, client, "second")
+        _wait_for(lambda: server.scheduler.pending == 2)
+
+        response = _post(client, "third")
+        assert response.status_code == 429
+        assert 1 <= int(response.headers["Retry-After"]) <= 6  # backlog of ~20 s over a 15 s limit
+
+        jobs.release()
+        assert first.result().status_code == 200
+        assert second.result().status_code == 200
+
+
+def test_unmeetable_timeout_gets_503(monkeypatch, jobs):
+    with _client(monkeypatch) as client, ThreadPoolExecutor(1) as pool:
+        first = pool.submit(_post, client, "first")
+        _job("running")
+
+        # ~10 s queued ahead plus its own 10 s estimate
+        response = _post(client, "second", timeout=15.0)
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert server.scheduler.pending == 1
+
+        jobs.release()
+        assert first.result().status_code == 200
+
+
+def test_cancel_queued_job(monkeypatch, jobs):
+    before = cancellation_counts().get("cancelled", 0)
+    with _client(monkeypatch) as client, ThreadPoolExecutor(2) as pool:
+        running = pool.submit(_post, client, "first")
+        running_id = _job("running")
+        queued = pool.submit(_post, client, "second")
+        queued_id = _job("queued")
+
+        response = client.delete(f"/v1/jobs/{queued_id}")
+        assert response.json() == {"job_id": queued_id, "cancelled": True}
+        jobs.release("first")
+        assert running.result().status_code == 200
+        response = queued.result()
+        assert response.status_code == 409
+
+        assert server.scheduler.finished == {"done": 1, "cancelled": 1}
+        assert running_id not in server.scheduler.jobs
+    # It never reached the model, so no generation loop was abandoned
+    assert cancellation_counts().get("cancelled", 0) == before
+
+
+def test_cancel_running_job_stops_its_loop(monkeypatch, jobs):
+    before = cancellation_counts().get("cancelled", 0)
+    with _client(monkeypatch) as client, ThreadPoolExecutor(1) as pool:
+        running = pool.submit(_post, client, "first")
+        job_id = _job("running")
+
+        assert client.get(f"/v1/jobs/{job_id}").json()["state"] == "running"
+        assert client.delete(f"/v1/jobs/{job_id}").status_code == 200
+        # Never released: only the token check can end the job
+        assert running.result(timeout=5).status_code == 409
+
+        assert server.scheduler.finished["cancelled"] == 1
+        assert client.get(f"/v1/jobs/{job_id}").status_code == 404
+    assert cancellation_counts().get("cancelled", 0) == before + 1
+
+
+def test_cancel_unknown_job_gets_404(monkeypatch, jobs):
+    with _client(monkeypatch) as client:
+        assert client.delete("/v1/jobs/job-0").status_code == 404
+
+
+def test_metrics_count_jobs_and_cancellations(monkeypatch, jobs):
+    with _client(monkeypatch) as client, ThreadPoolExecutor(1) as pool:
+        jobs.gates["done"] = threading.Event()
+        jobs.gates["done"].set()
+        assert _post(client, "done").status_code == 200
+
+        running = pool.submit(_post, client, "cancelled")
+        client.delete(f"/v1/jobs/{_job('running')}")
+        assert running.result(timeout=5).status_code == 409
+
+        text = client.get("/metrics").text
+        assert 'chatterbox_jobs_total{state="done"} 1' in text
+        assert 'chatterbox_jobs_total{state="cancelled"} 1' in text
+        assert f'chatterbox_generations_cancelled_total{{reason="cancelled"}} {cancellation_counts()["cancelled"]}' in text
+        assert "chatterbox_jobs_pending 0" in text
@@ -0,0 +1,74 @@
+"""
+Startup budget: importing the app's modules must not load a model stack.
+
+The pipelines, and everything heavy they need (transformers, perth/librosa,
+pkuseg...), are imported on first use. These tests import a module in a
+fresh interpreter with `-X importtime` and check both what got loaded and
+how long the import took beyond torch, which the modules need anyway and
+whose import time depends on the machine.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only a loaded model may pull in
+HEAVY_MODULES = ("transformers", "perth", "librosa", "pkuseg", "diffusers", "gradio", "chatterbox.models.t3")
+
+# Optional dependencies whose absence skips the test instead of failing it
+OPTIONAL_MODULES = ("fastapi", "uvicorn", "pydantic", "starlette")
+
+# Seconds of import time allowed on top of torch
+BUDGETS = {
+    "modules.generation_functions": 0.75,
+    "modules.server": 1.5,  # + fastapi/pydantic
+}
+
+
+def _import(module):
+    """Import `module` in a new interpreter; returns ({module: cumulative seconds}, loaded heavy modules)."""
+    env = dict(os.environ)
+    paths = [PROJECT_ROOT, os.path.join(PROJECT_ROOT, "src")]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    if proc.returncode:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+        # An environment without the package installed or the server extras
+        # can't run this; anything else is a broken import
+        if error.startswith("importlib.metadata.PackageNotFoundError") or any(
+            error == f"ModuleNotFoundError: No module named '{name}'" for name in OPTIONAL_MODULES
+        ):
+            pytest.skip(f"cannot import {module} here: {error}")
+        pytest.fail(f"importing {module} failed:\n{proc.stderr}")
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            times[name.strip()] = int(cumulative) / 1e6
+        except ValueError:  # the header line
+            pass
+    return times, proc.stdout.split()
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_stays_light(module):
+    times, heavy = _import(module)
+    assert not heavy, f"importing {module} loaded {', '.join(heavy)}"
+
+    own = times[module] - times.get("torch", 0.0)
+    assert own <= BUDGETS[module], (
+        f"importing {module} took {times[module]:.2f}s, {own:.2f}s beyond torch "
+        f"(budget {BUDGETS[module]:.2f}s)"
+    )